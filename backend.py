@@ -1,12 +1,26 @@
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import date
 from typing import Optional, Tuple
 
 from fastapi import FastAPI, HTTPException, status
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
-from src.prompt import answer_with_rag, answer_with_sql, answer_directly
-from config import SUPABASE
+from src.prompt import aanswer_with_rag, aanswer_with_sql, aanswer_directly, astream_with_rag, astream_with_sql, astream_directly, get_sql_chain, get_llm_chain, get_rag_chain
+from src.embed import get_shared_embed_model, get_query_embedder, embed_query
+from src.concurrency import TenantLimiter, run_blocking
+from src.cache import SemanticAnswerCache, get_data_versions, get_sql_result_cache
+from src.intents import get_intent_router
+from src.get.tenants import get_tenant_directory
+from src.retrieval import get_hybrid_retriever
+from src.vector_cache import get_report_vector_cache
+from src.metrics import REGISTRY, Gauges
+from src.tracing import TracingMiddleware, trace_stage, trace_log
+from config import get_supabase, BACKEND_WARM_UP_EMBEDDINGS, ASK_TIMEOUT_SECONDS, ASK_MAX_CONCURRENCY_PER_COMPANY, SEMANTIC_CACHE_ENABLED, INTENT_ROUTER_ENABLED
 
 # ----------------- Setup -----------------
 
@@ -15,14 +29,52 @@ from config import SUPABASE
 # What are the most important takeaways from this report?
 
 
-app = FastAPI(title="Digiole Backend")
+def warm_up(embeddings: bool | None = None):
+    """
+    Create the shared clients before the first request instead of during it.
+    The embedding model is only loaded when something on the request path needs it.
+    """
+    if embeddings is None:
+        embeddings = BACKEND_WARM_UP_EMBEDDINGS or SEMANTIC_CACHE_ENABLED or INTENT_ROUTER_ENABLED
+    get_supabase()
+    get_tenant_directory().refresh()
+    get_sql_chain()
+    get_llm_chain()
+    get_rag_chain()
+    if embeddings:
+        get_shared_embed_model()
+        get_query_embedder()
+    if INTENT_ROUTER_ENABLED:
+        get_intent_router()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up()
+    yield
+
+
+app = FastAPI(title="Digiole Backend", lifespan=lifespan)
+ASK_LIMITER = TenantLimiter(ASK_MAX_CONCURRENCY_PER_COMPANY)
+DATA_VERSIONS = get_data_versions()
+ANSWER_CACHE = SemanticAnswerCache()
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:8080", "http://localhost:5500", "http://localhost:3000"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
+app.add_middleware(TracingMiddleware)
+
+# Cache/directory stats as gauges on /metrics (a collector whose object isn't loaded yet is skipped)
+REGISTRY.register(Gauges("digiole_answer_cache", "Semantic answer cache", lambda: ANSWER_CACHE.stats()))
+REGISTRY.register(Gauges("digiole_sql_cache", "SQL result cache", lambda: get_sql_result_cache().stats()))
+REGISTRY.register(Gauges("digiole_query_embedder", "Query embedding cache", lambda: get_query_embedder().stats() if get_query_embedder.is_loaded() else {}))
+REGISTRY.register(Gauges("digiole_tenants", "Tenant directory", lambda: get_tenant_directory().stats()))
+REGISTRY.register(Gauges("digiole_report_vectors", "Local report-chunk vector cache", lambda: get_report_vector_cache().stats() if get_report_vector_cache.is_loaded() else {}))
+REGISTRY.register(Gauges("digiole_bm25", "BM25 keyword index", lambda: get_hybrid_retriever().stats() if get_hybrid_retriever.is_loaded() else {}))
 
 
 # ----------------- Pydantic models -----------------
@@ -40,39 +92,201 @@ class AskResponse(BaseModel):
 # ----------------- Data helpers (tenant-aware) -----------------
 
 def ensure_product_belongs_to_company(talking_product_id: str, company_id: str):
-    res = (
-        SUPABASE.table("talking_products")
-        .select("id")
-        .eq("id", talking_product_id)
-        .eq("company_id", company_id)
-        .eq("active", True)
-        .limit(1)
-        .execute()
-    )
-    if not res.data:
+    with trace_stage("ownership_check"):
+        owned = get_tenant_directory().product_belongs_to_company(talking_product_id, company_id)
+    if not owned:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Talking product not found for this company",
         )
 
 
-# ----------------- RAG / SQL / Q&A endpoint (tenant-safe) -----------------
-@app.post("/ask", response_model=AskResponse)
-def ask(req: AskRequest):
-    print("ASK CALLED")
-    print(req)
-    if req.talking_product_id:
-        ensure_product_belongs_to_company(req.talking_product_id, req.company_id)
+# ----------------- Semantic answer cache -----------------
+async def semantic_lookup(req: AskRequest):
+    """
+    Returns (key, hit) for the semantic answer cache. key is what remember_answer needs
+    to store a fresh answer; both are None when the cache is disabled.
+    """
+    if not SEMANTIC_CACHE_ENABLED:
+        return None, None
+    scope = ANSWER_CACHE.scope(req.company_id, req.talking_product_id, req.date_range)
+    with trace_stage("answer_cache"):
+        version, embedding = await asyncio.gather(
+            run_blocking(DATA_VERSIONS.get, req.company_id),
+            run_blocking(embed_query, req.question),
+        )
+        hit = ANSWER_CACHE.lookup(scope, embedding, version)
+    return (scope, embedding, version), hit
+
 
+def remember_answer(req: AskRequest, key, answer: str, latency_s: float):
+    if key is not None:
+        scope, embedding, version = key
+        ANSWER_CACHE.store(scope, req.question, embedding, answer, version, latency_s)
+
+
+# ----------------- RAG / SQL / Q&A endpoint (tenant-safe) -----------------
+async def generate_answer(req: AskRequest) -> str:
     all_products = not req.talking_product_id
     all_time = not req.date_range
 
     if all_products or all_time:
-        resp = answer_with_sql(req.question, req.company_id)  # or answer_with_rag(...)
+        resp = await aanswer_with_sql(req.question, req.company_id)  # or aanswer_with_rag(...)
     else:
-        resp = answer_directly(req.question, req.company_id, req.talking_product_id, req.date_range)
-        
-    answer_text = resp.content if hasattr(resp, "content") else str(resp)
-    print(answer_text)
+        resp = await aanswer_directly(req.question, req.company_id, req.talking_product_id, req.date_range)
+    return resp.content if hasattr(resp, "content") else str(resp)
+
+
+async def answer_question(req: AskRequest) -> str:
+    if req.talking_product_id:
+        await run_blocking(ensure_product_belongs_to_company, req.talking_product_id, req.company_id)
+
+    key, hit = await semantic_lookup(req)
+    if hit:
+        return hit["answer"]
+
+    t0 = time.perf_counter()
+    answer = await generate_answer(req)
+    remember_answer(req, key, answer, time.perf_counter() - t0)
+    return answer
+
+
+@app.post("/ask", response_model=AskResponse)
+async def ask(req: AskRequest):
+    trace_log(f"ASK CALLED {req}")
+
+    async def limited():
+        async with ASK_LIMITER.slot(req.company_id):
+            return await answer_question(req)
+
+    try:
+        answer_text = await asyncio.wait_for(limited(), timeout=ASK_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"Answer took longer than {ASK_TIMEOUT_SECONDS}s",
+        )
+
+    trace_log(answer_text)
     return AskResponse(answer=answer_text)
 
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text format: request/stage latency histograms, counters and cache gauges."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats/embeddings")
+def embedding_stats():
+    """Query-embedding cache hit rate and micro-batch size histogram."""
+    return get_query_embedder().stats()
+
+
+@app.get("/stats/tenants")
+def tenant_stats():
+    """Size and age of the in-process tenant directory."""
+    return get_tenant_directory().stats()
+
+
+@app.get("/stats/intents")
+def intent_stats():
+    """How many SQL questions were answered from canned intents vs LLM-written SQL."""
+    if not INTENT_ROUTER_ENABLED:
+        return {"enabled": False}  # Don't build the router (and load its embedding model) just to report zeros
+    return {"enabled": True, **get_intent_router().stats()}
+
+
+@app.get("/stats/sql-cache")
+def sql_cache_stats():
+    """Hit/miss counts and size of the execute_readonly_sql result cache."""
+    return get_sql_result_cache().stats()
+
+
+@app.get("/stats/retrieval")
+def retrieval_stats():
+    """Companies and documents in the in-memory BM25 index used by hybrid retrieval."""
+    return get_hybrid_retriever().stats()
+
+
+@app.get("/stats/vector-cache")
+def vector_cache_stats():
+    """Companies, chunks and memory of the local report-chunk vector cache."""
+    return get_report_vector_cache().stats()
+
+
+@app.get("/stats/answer-cache")
+def answer_cache_stats():
+    """Semantic answer cache hit rate and latency saved by hits."""
+    return ANSWER_CACHE.stats()
+
+
+# ----------------- Streaming variant (Server-Sent Events) -----------------
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.post("/ask/stream")
+async def ask_stream(req: AskRequest):
+    """
+    Same routing as /ask, streamed as SSE:
+      event: meta   -> {"mode": "sql", "sql": ...} | {"mode": "direct", "context": {source, bytes_fetched, bytes_used, ...}} | {"mode": "rag", "citations": [...]}
+                       | {"mode": "cache", "question": <cached question>, "similarity": ...}
+      event: token  -> {"text": "..."} (one per LLM chunk)
+      event: done   -> {"answer": "<full answer>"}
+      event: error  -> {"detail": "..."}
+    """
+    trace_log(f"ASK STREAM CALLED {req}")
+    # Ownership errors must still be a real 404, so check before the stream starts
+    if req.talking_product_id:
+        await run_blocking(ensure_product_belongs_to_company, req.talking_product_id, req.company_id)
+
+    if not req.talking_product_id or not req.date_range:
+        events = astream_with_sql(req.question, req.company_id)  # or astream_with_rag(...)
+    else:
+        events = astream_directly(req.question, req.company_id, req.talking_product_id, req.date_range)
+
+    # The answer is produced by a task under the tenant slot and the deadline, and the client reads it
+    # from the queue at its own pace: a slow reader neither holds the slot nor runs into the timeout
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            async with ASK_LIMITER.slot(req.company_id), asyncio.timeout(ASK_TIMEOUT_SECONDS):
+                key, hit = await semantic_lookup(req)
+                if hit:
+                    queue.put_nowait(("meta", {"mode": "cache", "question": hit["question"], "similarity": hit["similarity"]}))
+                    queue.put_nowait(("token", {"text": hit["answer"]}))
+                    queue.put_nowait(("done", {"answer": hit["answer"]}))
+                    return
+
+                t0 = time.perf_counter()
+                answer = []
+                async for event, payload in events:
+                    if event == "token":
+                        answer.append(payload)
+                        queue.put_nowait(("token", {"text": payload}))
+                    else:
+                        queue.put_nowait((event, payload))
+            remember_answer(req, key, "".join(answer), time.perf_counter() - t0)
+            queue.put_nowait(("done", {"answer": "".join(answer)}))
+        except TimeoutError:
+            queue.put_nowait(("error", {"detail": f"Answer took longer than {ASK_TIMEOUT_SECONDS}s"}))
+        except Exception as e:
+            queue.put_nowait(("error", {"detail": str(e)}))
+        finally:
+            queue.put_nowait(None)
+
+    async def event_stream():
+        producer = asyncio.create_task(produce())
+        try:
+            while (item := await queue.get()) is not None:
+                yield sse_event(*item)
+        finally:
+            producer.cancel()  # No-op once the answer is complete; stops the generation if the client went away
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,509 @@
+"""
+In-memory stand-ins for Supabase, Chroma and the LLM so the pipeline can run fully offline.
+
+install() swaps them into the lazy client getters (config.get_supabase, config.get_chroma_client,
+src.embed.get_shared_embed_model, src.prompt.get_llm), so call it before the first pipeline call.
+"""
+import re
+import time
+import zlib
+import asyncio
+import itertools
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+# ----------------- Supabase -----------------
+
+class _FakeQuery:
+    """Subset of the postgrest query builder used in this repo."""
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db = db
+        self.table = table
+        self.columns: Optional[List[str]] = None
+        self.embedded: Dict[str, List[str]] = {}
+        self.filters = []
+        self.order_by = None
+        self.limit_n = None
+        self.single = False
+        self.write = None
+
+    # --- reads ---
+    def select(self, columns: str = "*", **_):
+        # Embedded one-to-many resources like "talking_products(id, name)" join on <parent singular>_id
+        for name, cols in re.findall(r"(\w+)\(([^)]*)\)", columns):
+            self.embedded[name] = [c.strip() for c in cols.split(",")]
+        columns = re.sub(r",?\s*\w+\([^)]*\)", "", columns)
+        if columns.strip() != "*":
+            self.columns = [c.strip() for c in columns.split(",")]
+        return self
+
+    def _embed(self, row):
+        fk = re.sub(r"ies$", "y", self.table).rstrip("s") + "_id"
+        for name, cols in self.embedded.items():
+            row[name] = [{c: r.get(c) for c in cols} for r in self.db.tables.get(name, []) if r.get(fk) == row.get("id")]
+        return row
+
+    def eq(self, col, value):
+        self.filters.append(lambda r: r.get(col) == value)
+        return self
+
+    def neq(self, col, value):
+        self.filters.append(lambda r: r.get(col) != value)
+        return self
+
+    def in_(self, col, values):
+        values = set(values)
+        self.filters.append(lambda r: r.get(col) in values)
+        return self
+
+    def gt(self, col, value):
+        self.filters.append(lambda r: r.get(col) is not None and r.get(col) > value)
+        return self
+
+    def gte(self, col, value):
+        self.filters.append(lambda r: r.get(col) is not None and r.get(col) >= value)
+        return self
+
+    def lt(self, col, value):
+        self.filters.append(lambda r: r.get(col) is not None and r.get(col) < value)
+        return self
+
+    def lte(self, col, value):
+        self.filters.append(lambda r: r.get(col) is not None and r.get(col) <= value)
+        return self
+
+    def order(self, col, desc=False):
+        self.order_by = (col, desc)
+        return self
+
+    def limit(self, n):
+        self.limit_n = n
+        return self
+
+    def maybe_single(self):
+        self.single = True
+        return self
+
+    # --- writes ---
+    def upsert(self, payload, on_conflict: str = "id", **_):
+        self.write = ("upsert", payload if isinstance(payload, list) else [payload], on_conflict)
+        return self
+
+    def insert(self, payload, **_):
+        self.write = ("insert", payload if isinstance(payload, list) else [payload], None)
+        return self
+
+    def delete(self):
+        self.write = ("delete", None, None)
+        return self
+
+    def execute(self):
+        self.db.calls[f"table.{self.table}"] += 1
+        if self.db.latency_s:
+            time.sleep(self.db.latency_s)
+        rows = self.db.tables.setdefault(self.table, [])
+
+        if self.write is not None:
+            return SimpleNamespace(data=self._execute_write(rows))
+
+        matched = [r for r in rows if all(f(r) for f in self.filters)]
+        if self.order_by:
+            col, desc = self.order_by
+            matched.sort(key=lambda r: (r.get(col) is None, r.get(col)), reverse=desc)
+        if self.limit_n is not None:
+            matched = matched[: self.limit_n]
+        if self.columns:
+            matched = [{c: r.get(c) for c in self.columns} for r in matched]
+        else:
+            matched = [dict(r) for r in matched]
+        if self.embedded:
+            matched = [self._embed(r) for r in matched]
+        if self.single:
+            return SimpleNamespace(data=matched[0] if matched else None)
+        return SimpleNamespace(data=matched)
+
+    def _execute_write(self, rows):
+        kind, payload, on_conflict = self.write
+        if kind == "delete":
+            keep = [r for r in rows if not all(f(r) for f in self.filters)]
+            removed = len(rows) - len(keep)
+            rows[:] = keep
+            return [{"deleted": removed}]
+
+        written = []
+        keys = [k.strip() for k in on_conflict.split(",")] if on_conflict else None
+        for item in payload:
+            item = dict(item)
+            existing = None
+            if kind == "upsert" and keys and all(k in item for k in keys):
+                existing = next((r for r in rows if all(r.get(k) == item[k] for k in keys)), None)
+            if existing is not None:
+                existing.update(item)
+                written.append(dict(existing))
+            else:
+                item.setdefault("id", next(self.db._ids))
+                rows.append(item)
+                written.append(dict(item))
+        return written
+
+
+class _FakeRpc:
+    def __init__(self, db: "FakeSupabase", name: str, params: Dict[str, Any]):
+        self.db = db
+        self.name = name
+        self.params = params or {}
+
+    def execute(self):
+        self.db.calls[f"rpc.{self.name}"] += 1
+        if self.db.latency_s:
+            time.sleep(self.db.latency_s)
+        handler = self.db.rpcs.get(self.name)
+        if handler is None:
+            raise RuntimeError(f"Fake Supabase has no RPC '{self.name}'")
+        return SimpleNamespace(data=handler(self.db, self.params))
+
+
+def _rpc_fetch_interactions_filtered(db: "FakeSupabase", params: Dict[str, Any]):
+    tp, company = params.get("_talking_product_id"), params.get("_company_id")
+    start, end = params.get("_start_date"), params.get("_end_date")
+    rows = db.tables.get("interactions", [])
+    matched = [
+        r for r in rows
+        if (tp is None or r.get("talking_product_id") == tp)
+        and (company is None or r.get("company_id") == company)
+        and (start is None or r["date"] >= start)
+        and (end is None or r["date"] <= end)
+    ]
+    offset, limit = params.get("_offset", 0), params.get("_limit", len(matched))
+    return matched[offset: offset + limit]
+
+
+def _rpc_execute_readonly_sql(db: "FakeSupabase", params: Dict[str, Any]):
+    # No SQL engine here: return a deterministic sample of interactions so the answer step has context
+    m = re.search(r"limit\s+(\d+)", params.get("query", ""), re.IGNORECASE)
+    limit = int(m.group(1)) if m else 200
+    return [
+        {k: r.get(k) for k in ("date", "interaction_time", "question", "answer", "match_score", "talking_product_id")}
+        for r in db.tables.get("interactions", [])[:limit]
+    ]
+
+
+class FakeSupabase:
+    """In-memory Supabase client: tables are plain lists of dicts, RPCs are python callables."""
+
+    def __init__(self, latency_s: float = 0.0):
+        self.latency_s = latency_s
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.rpcs = {
+            "fetch_interactions_filtered": _rpc_fetch_interactions_filtered,
+            "execute_readonly_sql": _rpc_execute_readonly_sql,
+        }
+        self.calls: Dict[str, int] = {}
+        self.reset()
+
+    def reset(self):
+        self.tables.clear()
+        self.calls = _CallCounter()
+        self._ids = itertools.count(1)
+
+    def table(self, name: str) -> _FakeQuery:
+        return _FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Dict[str, Any] = None) -> _FakeRpc:
+        return _FakeRpc(self, name, params)
+
+
+class _CallCounter(dict):
+    def __missing__(self, key):
+        return 0
+
+
+# ----------------- Chroma -----------------
+
+def _match_where(meta: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    if not where:
+        return True
+    if "$and" in where:
+        return all(_match_where(meta, w) for w in where["$and"])
+    if "$or" in where:
+        return any(_match_where(meta, w) for w in where["$or"])
+    for key, cond in where.items():
+        value = meta.get(key)
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        for op, target in cond.items():
+            if op == "$eq" and value != target: return False
+            if op == "$ne" and value == target: return False
+            if op == "$in" and value not in target: return False
+            if op == "$nin" and value in target: return False
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None: return False
+                if op == "$gt" and not value > target: return False
+                if op == "$gte" and not value >= target: return False
+                if op == "$lt" and not value < target: return False
+                if op == "$lte" and not value <= target: return False
+    return True
+
+
+class FakeCollection:
+    """In-memory Chroma collection with exact (squared L2) search and metadata filtering."""
+
+    def __init__(self, name: str = "fake", latency_s: float = 0.0):
+        self.name = name
+        self.latency_s = latency_s
+        self.reset()
+
+    def reset(self):
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.calls = _CallCounter()
+
+    def count(self) -> int:
+        return len(self.records)
+
+    def upsert(self, ids, documents=None, metadatas=None, embeddings=None, **_):
+        self.calls["upsert"] += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        for i, id_ in enumerate(ids):
+            rec = self.records.setdefault(id_, {})
+            if documents is not None: rec["document"] = documents[i]
+            if metadatas is not None: rec["metadata"] = dict(metadatas[i] or {})
+            if embeddings is not None: rec["embedding"] = np.asarray(embeddings[i], dtype=np.float32)
+
+    add = upsert
+
+    def delete(self, ids=None, where=None, **_):
+        self.calls["delete"] += 1
+        for id_ in list(self._select(ids, where)):
+            self.records.pop(id_, None)
+
+    def _select(self, ids=None, where=None) -> Iterator[str]:
+        candidates = ids if ids is not None else list(self.records)
+        for id_ in candidates:
+            rec = self.records.get(id_)
+            if rec is not None and _match_where(rec.get("metadata", {}), where):
+                yield id_
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas"), **_):
+        self.calls["get"] += 1
+        selected = list(self._select(ids, where))[offset or 0:]
+        if limit is not None:
+            selected = selected[:limit]
+        out = {"ids": selected}
+        if "documents" in include: out["documents"] = [self.records[i].get("document") for i in selected]
+        if "metadatas" in include: out["metadatas"] = [self.records[i].get("metadata") for i in selected]
+        if "embeddings" in include: out["embeddings"] = [self.records[i].get("embedding") for i in selected]
+        return out
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas", "distances"), **_):
+        self.calls["query"] += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        selected = [i for i in self._select(None, where) if "embedding" in self.records[i]]
+        out = {k: [] for k in ("ids", "documents", "metadatas", "distances")}
+        if selected:
+            matrix = np.stack([self.records[i]["embedding"] for i in selected])
+        for q in query_embeddings:
+            if not selected:
+                for k in out: out[k].append([])
+                continue
+            d = ((matrix - np.asarray(q, dtype=np.float32)) ** 2).sum(axis=1)
+            top = np.argsort(d)[:n_results]
+            out["ids"].append([selected[j] for j in top])
+            out["documents"].append([self.records[selected[j]].get("document") for j in top])
+            out["metadatas"].append([self.records[selected[j]].get("metadata") for j in top])
+            out["distances"].append([float(d[j]) for j in top])
+        return out
+
+
+class FakeChromaClient:
+    def __init__(self, latency_s: float = 0.0):
+        self.latency_s = latency_s
+        self.collections: Dict[str, FakeCollection] = {}
+
+    def get_or_create_collection(self, name: str, **_) -> FakeCollection:
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name, self.latency_s)
+        return self.collections[name]
+
+    def get_collection(self, name: str, **_) -> FakeCollection:
+        return self.collections[name]
+
+    def list_collections(self):
+        return list(self.collections.values())
+
+    def delete_collection(self, name: str):
+        self.collections.pop(name, None)
+
+
+# ----------------- Embeddings -----------------
+
+class HashingEmbedder:
+    """
+    Deterministic bag-of-words hashing embedder with the SentenceTransformer.encode() API.
+    Much cheaper than bge-m3, but keeps similar questions close so clustering still works.
+    """
+
+    def __init__(self, dim: int = 1024, call_latency_s: float = 0.0, item_latency_s: float = 0.0):
+        self.dim = dim
+        # Optional simulated model cost: a fixed cost per encode() call plus a cost per text.
+        # Calls are serialized like on a single busy CPU, which is what makes batching pay off.
+        self.call_latency_s = call_latency_s
+        self.item_latency_s = item_latency_s
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _encode_one(self, text: str) -> np.ndarray:
+        v = np.zeros(self.dim, dtype=np.float32)
+        for tok in re.findall(r"\w+", text.lower()):
+            h = zlib.crc32(tok.encode("utf-8"))
+            v[h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        return v
+
+    def encode(self, sentences, normalize_embeddings: bool = False, batch_size: int = 32, **_):
+        single = isinstance(sentences, str)
+        self.calls += 1
+        if self.call_latency_s or self.item_latency_s:
+            with self._lock:
+                time.sleep(self.call_latency_s + self.item_latency_s * (1 if single else len(sentences)))
+        X = np.stack([self._encode_one(s) for s in ([sentences] if single else sentences)]) if (single or len(sentences)) else np.zeros((0, self.dim), dtype=np.float32)
+        if normalize_embeddings and len(X):
+            norms = np.linalg.norm(X, axis=1, keepdims=True)
+            X = X / np.where(norms == 0, 1, norms)
+        return X[0] if single else X
+
+
+# ----------------- LLM -----------------
+
+def fake_report_json(seed_text: str = "") -> str:
+    """A valid Report (src/report.py) serialized as JSON, deterministic for a given input."""
+    from src.report import Report  # deferred: src imports config
+
+    n_topics = 1 + zlib.crc32(seed_text.encode("utf-8")) % 3
+    topics = [
+        {
+            "topic": f"Synthetic topic {i + 1}",
+            "observation": "Visitors repeatedly ask about this subject.",
+            "implication": "The talking product lacks a clear answer.",
+            "strategic_alignment": {"objective": "Visitor satisfaction", "status": "At Risk"},
+            "recommendation": {"priority": "short-term", "action": "Add a dedicated answer.", "alternative": None, "impact": "Fewer misses."},
+            "decision_required": "Approve new content.",
+        }
+        for i in range(n_topics)
+    ]
+    report = Report(
+        topics=topics,
+        executive_summary=[{"objective": "Visitor satisfaction", "status": "At Risk", "key_decision_needed": "Approve new content."}],
+        overall_takeaway="Synthetic report generated offline.",
+    )
+    return report.model_dump_json()
+
+
+FAKE_SQL = (
+    "SELECT interactions.date, interactions.question, interactions.answer, interactions.match_score "
+    "FROM interactions JOIN talking_products ON interactions.talking_product_id = talking_products.id "
+    "WHERE talking_products.company_id = '{company_id}' AND talking_products.active = true "
+    "ORDER BY interactions.date, interactions.time, interactions.id LIMIT 200"
+)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model. It recognises the prompts in prompt_input/ and answers with
+    a valid Report JSON, a read-only SQL query, or a short plain-text answer.
+    latency_s simulates model time (time.sleep / asyncio.sleep), chunk_size controls streaming.
+    """
+
+    latency_s: float = 0.0
+    chunk_size: int = 16
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(m.content) for m in messages)
+        if "JSON instance" in prompt or "json schema" in prompt.lower():
+            return fake_report_json(prompt)
+        if "Return only the SQL query" in prompt:
+            m = re.search(r"company_id:\s*(\S+)", prompt)
+            return FAKE_SQL.format(company_id=m.group(1) if m else "")
+        return f"Offline answer based on {prompt.count(chr(10)) + 1} lines of prompt."
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._respond(messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._respond(messages)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._respond(messages)
+        pieces = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+        for piece in pieces:
+            if self.latency_s:
+                time.sleep(self.latency_s / len(pieces))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._respond(messages)
+        pieces = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+        for piece in pieces:
+            if self.latency_s:
+                await asyncio.sleep(self.latency_s / len(pieces))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+
+# ----------------- Installation -----------------
+
+class OfflineStack(SimpleNamespace):
+    """Handles to the installed fakes (supabase, chroma, collection, llm, embedder)."""
+
+    def reset(self):
+        self.supabase.reset()
+        for c in self.chroma.collections.values():
+            c.reset()
+
+
+def install(
+    embedder: Any = None,
+    llm_latency_s: float = 0.0,
+    supabase_latency_s: float = 0.0,
+    chroma_latency_s: float = 0.0,
+) -> OfflineStack:
+    """
+    Install in-memory stand-ins into the shared client getters.
+    Pass embedder=None to use the HashingEmbedder, or e.g. a SentenceTransformer to benchmark the real model.
+    """
+    import config
+    from src import embed, prompt, sharding
+
+    stack = OfflineStack(
+        supabase=FakeSupabase(supabase_latency_s),
+        chroma=FakeChromaClient(chroma_latency_s),
+        llm=FakeChatModel(latency_s=llm_latency_s),
+        embedder=embedder if embedder is not None else HashingEmbedder(),
+    )
+    config.get_supabase.set(stack.supabase)
+    config.get_chroma_client.set(stack.chroma)
+    config.get_collection.reset()
+    sharding.reset_collections()
+    stack.collection = config.get_collection()
+
+    embed.get_shared_embed_model.set(stack.embedder)
+    prompt.get_llm.set(stack.llm)
+    prompt.get_free_llm.set(stack.llm)
+    for chain in (prompt.get_report_chain, prompt.get_sql_chain, prompt.get_llm_chain, prompt.get_rag_chain):
+        chain.reset()  # Rebuild with the fake LLM
+    return stack
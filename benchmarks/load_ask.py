@@ -0,0 +1,176 @@
+"""
+Load test for the backend /ask endpoint against the in-memory stand-ins.
+
+    python -m benchmarks.load_ask --concurrency 50 --requests 500 --llm-latency 0.3
+    python -m benchmarks.load_ask --stream  # /ask/stream, also reports time-to-first-token
+
+Requests are sent in-process through httpx.ASGITransport (the streaming variant reads the
+endpoint's response iterator directly), so the numbers measure the backend itself
+(event loop, thread pool, tenant limits) and not a network stack.
+"""
+import io
+import os
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from benchmarks.fakes import install
+from benchmarks.synthetic import generate_interactions
+
+QUESTIONS = [
+    "Which topic is most frequently asked?",
+    "What are the top topics this week?",
+    "How many questions were complete misses?",
+    "What is the average match score over time?",
+    "Which talking product is the busiest?",
+]
+
+
+def seed(stack, n_companies: int, products_per_company: int, rows_per_product: int):
+    """Create companies/talking products with interactions over the last 7 days. Returns the products."""
+    stack.reset()
+    day = date.today() - timedelta(days=1)
+    products = []
+    companies, tps, interactions = [], [], []
+    for c in range(n_companies):
+        company_id = f"load-company-{c}"
+        companies.append({"id": company_id, "name": f"Company {c}", "active": True})
+        for p in range(products_per_company):
+            tp_id = f"{company_id}-tp-{p}"
+            tps.append({"id": tp_id, "company_id": company_id, "name": tp_id, "active": True})
+            interactions += generate_interactions(rows_per_product, tp_id, company_id, day - timedelta(days=6), days=7, seed=c * 100 + p)
+            products.append((company_id, tp_id))
+    stack.supabase.tables.update(companies=companies, talking_products=tps, interactions=interactions)
+    return products, (day - timedelta(days=6), day)
+
+
+def build_payloads(products, date_range, n_requests: int):
+    """Alternate between the SQL path (no product) and the direct path (product + date range)."""
+    payloads = []
+    for i in range(n_requests):
+        company_id, tp_id = products[i % len(products)]
+        payload = {"company_id": company_id, "question": QUESTIONS[i % len(QUESTIONS)]}
+        if i % 2:
+            payload.update(talking_product_id=tp_id, date_range=[d.isoformat() for d in date_range])
+        payloads.append(payload)
+    return payloads
+
+
+async def run_load(backend, payloads, concurrency: int, stream: bool = False):
+    """Returns (latencies, time-to-first-token latencies (stream only), statuses, wall time)."""
+    import httpx
+
+    queue = asyncio.Queue()
+    for p in payloads:
+        queue.put_nowait(p)
+    latencies, ttfts, statuses = [], [], {}
+
+    async def ask_once(client, payload):
+        if not stream:
+            resp = await client.post("/ask", json=payload)
+            return resp.status_code, None
+        # httpx.ASGITransport buffers the whole body, so read the StreamingResponse directly
+        ttft = None
+        resp = await backend.ask_stream(backend.AskRequest(**payload))
+        async for event in resp.body_iterator:
+            if ttft is None and event.startswith("event: token"):
+                ttft = time.perf_counter()
+        return resp.status_code, ttft
+
+    async def asker(client):
+        while True:
+            try:
+                payload = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            t0 = time.perf_counter()
+            status_code, first_token_at = await ask_once(client, payload)
+            latencies.append(time.perf_counter() - t0)
+            if first_token_at is not None:
+                ttfts.append(first_token_at - t0)
+            statuses[status_code] = statuses.get(status_code, 0) + 1
+
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=None) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(asker(client) for _ in range(concurrency)))
+        wall = time.perf_counter() - t0
+    return np.array(latencies), np.array(ttfts), statuses, wall
+
+
+def main_cli(argv=None):
+    ap = argparse.ArgumentParser(description="Concurrent /ask load test against offline stand-ins")
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--requests", type=int, default=500)
+    ap.add_argument("--companies", type=int, default=5)
+    ap.add_argument("--products-per-company", type=int, default=2)
+    ap.add_argument("--rows-per-product", type=int, default=500)
+    ap.add_argument("--llm-latency", type=float, default=0.3)
+    ap.add_argument("--supabase-latency", type=float, default=0.02)
+    ap.add_argument("--stream", action="store_true", help="Use /ask/stream and also report time-to-first-token")
+    ap.add_argument("--no-cache", action="store_true", help="Disable the semantic answer cache")
+    ap.add_argument("--no-sql-cache", action="store_true", help="Disable the SQL result cache")
+    ap.add_argument("--per-company-limit", type=int, help="Override ASK_MAX_CONCURRENCY_PER_COMPANY")
+    ap.add_argument("--out", help="Store the summary as JSON")
+    args = ap.parse_args(argv)
+
+    import backend
+    from src.concurrency import TenantLimiter
+    if args.per_company_limit:
+        backend.ASK_LIMITER = TenantLimiter(args.per_company_limit)
+    if args.no_cache:
+        backend.SEMANTIC_CACHE_ENABLED = False
+    if args.no_sql_cache:
+        from src import cache
+        cache.SQL_RESULT_CACHE_ENABLED = False
+    stack = install(llm_latency_s=args.llm_latency, supabase_latency_s=args.supabase_latency)
+    products, date_range = seed(stack, args.companies, args.products_per_company, args.rows_per_product)
+    payloads = build_payloads(products, date_range, args.requests)
+    backend.warm_up()
+
+    with contextlib.redirect_stdout(io.StringIO()):  # The endpoint prints every request and answer
+        latencies, ttfts, statuses, wall = asyncio.run(run_load(backend, payloads, args.concurrency, args.stream))
+
+    summary = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "params": {k: v for k, v in vars(args).items() if k != "out"},
+        "requests": len(latencies),
+        "statuses": statuses,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "p50_s": round(float(np.percentile(latencies, 50)), 4),
+        "p95_s": round(float(np.percentile(latencies, 95)), 4),
+        "p99_s": round(float(np.percentile(latencies, 99)), 4),
+    }
+    if len(ttfts):
+        summary["ttft_p50_s"] = round(float(np.percentile(ttfts, 50)), 4)
+        summary["ttft_p95_s"] = round(float(np.percentile(ttfts, 95)), 4)
+    print(
+        f"📈 {summary['requests']} requests | concurrency {args.concurrency} | {summary['throughput_rps']} req/s | "
+        f"p50 {summary['p50_s']}s | p95 {summary['p95_s']}s | p99 {summary['p99_s']}s | statuses {statuses}"
+    )
+    summary["answer_cache"] = backend.ANSWER_CACHE.stats()
+    if not args.no_cache:
+        print(f"🗃️ answer cache | {summary['answer_cache']}")
+    summary["sql_cache"] = backend.get_sql_result_cache().stats()
+    summary["supabase_calls"] = dict(stack.supabase.calls)
+    print(f"🗄️ sql cache | {summary['sql_cache']} | supabase calls {summary['supabase_calls']}")
+    if backend.INTENT_ROUTER_ENABLED:
+        summary["intents"] = backend.get_intent_router().stats()
+        print(f"🧭 intent router | {summary['intents']}")
+    if len(ttfts):
+        print(f"⚡ time to first token | p50 {summary['ttft_p50_s']}s | p95 {summary['ttft_p95_s']}s")
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,71 @@
+"""
+Nightly daily reports one product at a time vs. as a stage pipeline (PIPELINE_ENABLED) against the
+offline stand-ins, with simulated Supabase/Chroma/embedding/LLM latencies so the I/O waits that the
+pipeline overlaps are present. Prints both wall times and the pipeline's per-stage table.
+
+    python -m benchmarks.nightly_pipeline --products 12 --llm-latency 1.0
+"""
+import io
+import time
+import argparse
+import tempfile
+import contextlib
+
+from benchmarks.fakes import install, HashingEmbedder
+from benchmarks.nightly_shards import product_volumes, seed_tenants
+
+
+def run_nightly(pipelined: bool, args) -> float:
+    import config
+    import main
+    from src.pipeline import format_pipeline_table
+
+    config.PIPELINE_ENABLED = pipelined
+    stack = install(
+        embedder=HashingEmbedder(call_latency_s=args.embed_latency),
+        llm_latency_s=args.llm_latency,
+        supabase_latency_s=args.db_latency,
+        chroma_latency_s=args.db_latency,
+    )
+    seed_tenants(stack, product_volumes(args.products, args.interactions, args.skew, args.seed), args.seed)
+
+    out = io.StringIO()
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(out):
+        main.main_nightly()
+    wall = time.perf_counter() - t0
+    if args.verbose:
+        print(out.getvalue())
+    if pipelined:
+        table = out.getvalue()
+        print(table[table.index("🚰 Pipeline"):].split("\n\n")[0])
+    return wall
+
+
+def main_cli(argv=None):
+    ap = argparse.ArgumentParser(description="Nightly daily reports: sequential vs. stage pipeline (offline)")
+    ap.add_argument("--products", type=int, default=12)
+    ap.add_argument("--interactions", type=int, default=3000, help="Interactions over all products")
+    ap.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of the product volumes")
+    ap.add_argument("--llm-latency", type=float, default=1.0, help="Simulated LLM latency in seconds")
+    ap.add_argument("--embed-latency", type=float, default=0.2, help="Simulated latency per embedding call in seconds")
+    ap.add_argument("--db-latency", type=float, default=0.05, help="Simulated Supabase/Chroma latency per request in seconds")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--verbose", action="store_true")
+    args = ap.parse_args(argv)
+
+    import config
+    config.RUN_REPORTS_DIR = tempfile.mkdtemp(prefix="bench_run_reports_")
+    config.CSV_LOGS_DIR = tempfile.mkdtemp(prefix="bench_csv_")  # No CSV step
+    config.MANUAL_AGGREGATION_ENABLED = False
+    config.PROFILE_TRACE_MEMORY = False
+    config.RUN_LEDGER_ENABLED = False
+    config.WRITE_BEHIND_SPOOL_PATH = tempfile.mktemp(prefix="bench_spool_", suffix=".sqlite")
+
+    sequential = run_nightly(False, args)
+    pipelined = run_nightly(True, args)
+    print(f"\n⏱️ sequential: {sequential:.1f}s | pipelined: {pipelined:.1f}s ({sequential / pipelined:.2f}x)")
+
+
+if __name__ == "__main__":
+    main_cli()
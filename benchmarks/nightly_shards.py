@@ -0,0 +1,101 @@
+"""
+Sharded nightly run (`main.py nightly --shard i/N`) with N local worker processes against the
+offline stand-ins. Every worker seeds the same synthetic tenants (skewed interaction volumes,
+with the previous day's daily reports as balancing history), processes its shard and writes
+its summary; the last one prints the merged summary. The run is repeated with 1 shard for comparison.
+
+    python -m benchmarks.nightly_shards --shards 4 --products 24 --llm-latency 0.5
+"""
+import sys
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+from datetime import date, timedelta
+
+from benchmarks.fakes import install
+from benchmarks.synthetic import generate_interactions
+
+
+def product_volumes(n_products: int, total: int, skew: float, seed: int):
+    """Interactions per product, Zipf-like: a few large products and many small ones."""
+    rng = random.Random(seed)
+    raw = [1 / (rank + 1) ** skew for rank in range(n_products)]
+    rng.shuffle(raw)
+    return [max(int(total * r / sum(raw)), 5) for r in raw]
+
+
+def seed_tenants(stack, volumes, seed: int):
+    yesterday = date.today() - timedelta(days=1)
+    n_companies = max(len(volumes) // 4, 1)
+    stack.supabase.tables["companies"] = [{"id": f"shard-company-{c}", "name": f"Company {c}", "active": True} for c in range(n_companies)]
+    stack.supabase.tables["talking_products"] = []
+    stack.supabase.tables["interactions"] = []
+    stack.supabase.tables["daily"] = []
+    for p, n in enumerate(volumes):
+        company_id, tp_id = f"shard-company-{p % n_companies}", f"shard-tp-{p}"
+        stack.supabase.tables["talking_products"].append({"id": tp_id, "company_id": company_id, "name": tp_id, "active": True})
+        stack.supabase.tables["interactions"] += generate_interactions(n, tp_id, company_id, yesterday, seed=seed + p)
+        # The day before: similar volume, used to balance the shards
+        stack.supabase.tables["daily"].append({"talking_product_id": tp_id, "date": (yesterday - timedelta(days=1)).isoformat(), "n_logs": n})
+
+
+def run_worker(args):
+    import config
+    config.SHARD_SUMMARY_DIR = args.summary_dir  # Bound when src.partition is imported, so set before importing main
+    config.RUN_REPORTS_DIR = tempfile.mkdtemp(prefix="bench_run_reports_")
+    config.PROFILE_TRACE_MEMORY = False
+    config.RUN_LEDGER_ENABLED = False
+    config.WRITE_BEHIND_SPOOL_PATH = tempfile.mktemp(prefix="bench_spool_", suffix=".sqlite")
+    import main
+
+    stack = install(llm_latency_s=args.llm_latency)
+    seed_tenants(stack, product_volumes(args.products, args.interactions, args.skew, args.seed), args.seed)
+    main.main_nightly(shard=(args.worker, args.shards))
+
+
+def run_shards(n_shards: int, args) -> float:
+    summary_dir = tempfile.mkdtemp(prefix="bench_shards_")
+    cmd = [sys.executable, "-m", "benchmarks.nightly_shards", "--summary-dir", summary_dir, "--shards", str(n_shards),
+           "--products", str(args.products), "--interactions", str(args.interactions), "--skew", str(args.skew),
+           "--llm-latency", str(args.llm_latency), "--seed", str(args.seed)]
+    t0 = time.perf_counter()
+    workers = [subprocess.Popen(cmd + ["--worker", str(i)], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True) for i in range(n_shards)]
+    outputs = [w.communicate()[0] for w in workers]
+    wall = time.perf_counter() - t0
+    if any(w.returncode for w in workers):
+        raise RuntimeError("A shard worker failed:\n" + "\n".join(outputs))
+    if args.verbose:
+        print("\n".join(outputs))
+
+    import config
+    config.SHARD_SUMMARY_DIR = summary_dir
+    from src.partition import read_shard_summaries, format_shard_table
+    print(format_shard_table(read_shard_summaries(f"nightly:{date.today() - timedelta(days=1)}", n_shards, summary_dir)))
+    return wall
+
+
+def main_cli(argv=None):
+    ap = argparse.ArgumentParser(description="Sharded nightly run with local worker processes (offline)")
+    ap.add_argument("--shards", type=int, default=4)
+    ap.add_argument("--products", type=int, default=24)
+    ap.add_argument("--interactions", type=int, default=6000, help="Interactions over all products")
+    ap.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of the product volumes")
+    ap.add_argument("--llm-latency", type=float, default=0.5, help="Simulated LLM latency in seconds")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--verbose", action="store_true")
+    ap.add_argument("--worker", type=int, default=None, help=argparse.SUPPRESS)
+    ap.add_argument("--summary-dir", default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.worker is not None:
+        return run_worker(args)
+
+    single = run_shards(1, args)
+    sharded = run_shards(args.shards, args)
+    print(f"\n⏱️ 1 process: {single:.1f}s | {args.shards} shards: {sharded:.1f}s ({single / sharded:.2f}x)")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,118 @@
+"""
+Concurrent answer_with_rag load test, with and without the query-embedding service
+(LRU cache + micro-batcher in src/embed.py), against the offline stand-ins.
+
+    python -m benchmarks.rag_load --concurrency 50 --requests 1000
+    python -m benchmarks.rag_load --no-service  # plain embed_fn per query, for comparison
+    python -m benchmarks.rag_load --chroma-latency 0.05 --no-vector-cache  # every search goes to (simulated) Chroma Cloud
+
+The hashing embedder simulates model cost with --embed-call-latency (per encode call)
+and --embed-item-latency (per text); calls are serialized like on one busy CPU.
+"""
+import time
+import random
+import asyncio
+import argparse
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+
+from benchmarks.fakes import HashingEmbedder, install
+from benchmarks.synthetic import generate_interactions
+
+
+def seed_report_chunks(collection, n_companies: int, chunks_per_company: int):
+    """Index synthetic report chunks (doc_type=report_chunk) without simulated embedding cost."""
+    embedder = HashingEmbedder()
+    companies = []
+    for c in range(n_companies):
+        company_id, tp_id = f"rag-company-{c}", f"rag-company-{c}-tp"
+        rows = generate_interactions(chunks_per_company, tp_id, company_id, date.today() - timedelta(days=1), seed=c)
+        texts = [f"# Topic\n{r['question']} {r['answer']}" for r in rows]
+        collection.upsert(
+            ids=[f"r_{tp_id}_daily_{i}" for i in range(len(texts))],
+            documents=texts,
+            metadatas=[{"doc_type": "report_chunk", "company_id": company_id, "talking_product_id": tp_id, "report_type": "daily", "date": r["date"]} for r in rows],
+            embeddings=embedder.encode(texts, normalize_embeddings=True).tolist(),
+        )
+        companies.append((company_id, tp_id, [r["question"] for r in rows]))
+    return companies
+
+
+def build_questions(companies, n_requests: int, distinct: int, seed: int = 7):
+    """Zipf-like repeats: a few questions are asked very often, most rarely."""
+    rng = random.Random(seed)
+    pool = []
+    for company_id, tp_id, questions in companies:
+        pool += [(company_id, tp_id, q) for q in questions[:max(distinct // len(companies), 1)]]
+    weights = [1 / (i + 1) for i in range(len(pool))]
+    return rng.choices(pool, weights=weights, k=n_requests)
+
+
+async def run_load(requests, concurrency: int):
+    from src.prompt import aanswer_with_rag
+
+    queue = asyncio.Queue()
+    for r in requests:
+        queue.put_nowait(r)
+    latencies = []
+
+    async def asker():
+        while True:
+            try:
+                company_id, tp_id, question = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            t0 = time.perf_counter()
+            await aanswer_with_rag(question, company_id, tp_id)
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(asker() for _ in range(concurrency)))
+    return np.array(latencies), time.perf_counter() - t0
+
+
+def main_cli(argv=None):
+    ap = argparse.ArgumentParser(description="answer_with_rag load test with/without the query-embedding service")
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--requests", type=int, default=1000)
+    ap.add_argument("--companies", type=int, default=5)
+    ap.add_argument("--chunks-per-company", type=int, default=400)
+    ap.add_argument("--distinct-questions", type=int, default=300)
+    ap.add_argument("--embed-call-latency", type=float, default=0.03)
+    ap.add_argument("--embed-item-latency", type=float, default=0.004)
+    ap.add_argument("--llm-latency", type=float, default=0.0)
+    ap.add_argument("--chroma-latency", type=float, default=0.0, help="Simulated Chroma Cloud round trip per call")
+    ap.add_argument("--no-vector-cache", action="store_true", help="Query Chroma instead of the local report-chunk vectors")
+    ap.add_argument("--no-service", action="store_true", help="Embed every query with a direct encode() call")
+    args = ap.parse_args(argv)
+
+    from src import embed, vector_cache
+    from src.get import data
+    embedder = HashingEmbedder(call_latency_s=args.embed_call_latency, item_latency_s=args.embed_item_latency)
+    stack = install(embedder=embedder, llm_latency_s=args.llm_latency, chroma_latency_s=args.chroma_latency)
+    companies = seed_report_chunks(stack.collection, args.companies, args.chunks_per_company)
+    data.REPORT_VECTOR_CACHE_ENABLED = not args.no_vector_cache
+    vector_cache.get_report_vector_cache.reset()
+    requests = build_questions(companies, args.requests, args.distinct_questions)
+
+    if args.no_service:
+        embed.get_query_embedder.set(SimpleNamespace(embed=embed.embed_fn, stats=lambda: {}))
+    else:
+        embed.get_query_embedder.set(embed.QueryEmbedder())
+
+    latencies, wall = asyncio.run(run_load(requests, args.concurrency))
+    mode = "direct encode" if args.no_service else "embedding service"
+    print(
+        f"🔎 {mode} | {len(latencies)} requests | concurrency {args.concurrency} | {len(latencies) / wall:.1f} req/s | "
+        f"p50 {np.percentile(latencies, 50):.4f}s | p95 {np.percentile(latencies, 95):.4f}s | encode calls {embedder.calls}"
+    )
+    stats = embed.get_query_embedder().stats()
+    if stats:
+        print(f"   hit rate {stats['hit_rate']:.1%} | batches {stats['batches']} | batch sizes {stats['batch_size_histogram']}")
+    print(f"   chroma calls {dict(stack.collection.calls)} | vector cache {vector_cache.get_report_vector_cache().stats() if data.REPORT_VECTOR_CACHE_ENABLED else 'off'}")
+
+
+if __name__ == "__main__":
+    main_cli()
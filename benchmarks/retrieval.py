@@ -0,0 +1,130 @@
+"""
+Recall@k and latency of retrieve_context with dense-only vs hybrid (dense + BM25, RRF) retrieval,
+against the offline stand-ins.
+
+    python -m benchmarks.retrieval --docs 3000 --queries 400 --k 8
+    python -m benchmarks.retrieval --rerank   # also rerank with the cross-encoder (downloads RERANKER_MODEL)
+
+Half of the queries ask about an exact identifier (product code / error id) that appears in a
+single document, the other half paraphrase a document's question. The dense stand-in is the
+HashingEmbedder at a reduced dimension (--dense-dim), so exact tokens are blurred by collisions
+the way a semantic model blurs rare codes; absolute numbers say little about bge-m3, the
+dense-vs-hybrid gap on identifier queries is what this measures.
+"""
+import time
+import random
+import argparse
+from datetime import date, timedelta
+
+import numpy as np
+
+from benchmarks.fakes import HashingEmbedder, install
+from benchmarks.synthetic import generate_interactions
+
+_CODE_QUESTIONS = [
+    "Customers report that {code} stops working after the update",
+    "Is {code} still covered by the warranty?",
+    "Error {code} shows up when pairing the device",
+]
+_CODE_QUERIES = [
+    "what issues were reported about {code}",
+    "{code} warranty",
+    "why do users see {code}",
+]
+
+
+def _code(rng: random.Random) -> str:
+    return f"{rng.choice(['XR', 'QT', 'ZN', 'KM', 'E'])}-{rng.randint(1000, 9999)}"
+
+
+def seed_corpus(collection, embedder, n_docs: int, n_companies: int, code_share: float, seed: int = 11):
+    """Interaction documents per company; returns [(company_id, tp_id, doc_id, question, code or None)]."""
+    rng = random.Random(seed)
+    docs = []
+    per_company = max(n_docs // n_companies, 1)
+    for c in range(n_companies):
+        company_id, tp_id = f"ret-company-{c}", f"ret-company-{c}-tp"
+        rows = generate_interactions(per_company, tp_id, company_id, date.today() - timedelta(days=1), seed=seed + c)
+        ids, texts, metas = [], [], []
+        for i, r in enumerate(rows):
+            code = _code(rng) if rng.random() < code_share else None
+            question = rng.choice(_CODE_QUESTIONS).format(code=code) if code else r["question"]
+            doc_id = f"i_{tp_id}_{i}"
+            ids.append(doc_id)
+            texts.append(f"Q: {question}\nA: {r['answer']}")
+            metas.append({"doc_type": "interaction", "company_id": company_id, "talking_product_id": tp_id, "date": r["date"], "bench_id": doc_id})
+            docs.append((company_id, tp_id, doc_id, question, code))
+        collection.upsert(ids=ids, documents=texts, metadatas=metas, embeddings=embedder.encode(texts, normalize_embeddings=True).tolist())
+    return docs
+
+
+def build_queries(docs, n_queries: int, seed: int = 5):
+    """(company_id, tp_id, query, relevant doc_id): identifier queries and dropped-word paraphrases."""
+    rng = random.Random(seed)
+    coded = [d for d in docs if d[4]]
+    plain = [d for d in docs if not d[4]]
+    queries = []
+    for i in range(n_queries):
+        if i % 2 == 0 and coded:
+            company_id, tp_id, doc_id, _, code = rng.choice(coded)
+            queries.append(("identifier", company_id, tp_id, rng.choice(_CODE_QUERIES).format(code=code), doc_id))
+        else:
+            company_id, tp_id, doc_id, question, _ = rng.choice(plain)
+            words = question.rstrip("?").split()
+            kept = [w for w in words if rng.random() > 0.3] or words
+            queries.append(("paraphrase", company_id, tp_id, " ".join(kept), doc_id))
+    return queries
+
+
+def run(queries, k: int, embed_fn):
+    from src.get.data import retrieve_context
+
+    hits = {"identifier": [], "paraphrase": []}
+    latencies = []
+    for kind, company_id, tp_id, query, relevant in queries:
+        t0 = time.perf_counter()
+        _, citations = retrieve_context(query, company_id, tp_id, embed_fn=embed_fn, k=k)
+        latencies.append(time.perf_counter() - t0)
+        hits[kind].append(any(c["meta"].get("bench_id") == relevant for c in citations))
+    return hits, np.array(latencies)
+
+
+def main_cli(argv=None):
+    ap = argparse.ArgumentParser(description="retrieve_context recall@k: dense-only vs hybrid")
+    ap.add_argument("--docs", type=int, default=3000)
+    ap.add_argument("--companies", type=int, default=3)
+    ap.add_argument("--queries", type=int, default=400)
+    ap.add_argument("--k", type=int, default=8)
+    ap.add_argument("--code-share", type=float, default=0.2, help="Share of documents that mention an identifier")
+    ap.add_argument("--dense-dim", type=int, default=96)
+    ap.add_argument("--rerank", action="store_true", help="Also run hybrid + cross-encoder rerank (needs the model)")
+    args = ap.parse_args(argv)
+
+    from src.get import data
+    from src import retrieval
+
+    embedder = HashingEmbedder(dim=args.dense_dim)
+    stack = install(embedder=embedder)
+    docs = seed_corpus(stack.collection, embedder, args.docs, args.companies, args.code_share)
+    queries = build_queries(docs, args.queries)
+    embed_fn = lambda text: embedder.encode(text, normalize_embeddings=True).tolist()
+
+    modes = [("dense", False, False), ("hybrid", True, False)] + ([("hybrid+rerank", True, True)] if args.rerank else [])
+    for name, hybrid, rerank in modes:
+        data.HYBRID_RETRIEVAL_ENABLED = hybrid
+        retrieval.get_hybrid_retriever.set(retrieval.HybridRetriever(rerank=rerank))
+        if hybrid:
+            for company_id in {d[0] for d in docs}:  # Build the indexes outside the timed loop
+                retrieval.get_hybrid_retriever().index_for(company_id)
+        hits, latencies = run(queries, args.k, embed_fn)
+        recall = {kind: np.mean(v) if v else float("nan") for kind, v in hits.items()}
+        overall = np.mean(hits["identifier"] + hits["paraphrase"])
+        print(
+            f"🔎 {name:<14} recall@{args.k} {overall:.1%} (identifier {recall['identifier']:.1%}, paraphrase {recall['paraphrase']:.1%}) | "
+            f"p50 {np.percentile(latencies, 50) * 1000:.2f} ms | p95 {np.percentile(latencies, 95) * 1000:.2f} ms"
+        )
+    print(f"   BM25 index: {retrieval.get_hybrid_retriever().stats()}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,160 @@
+"""
+Offline pipeline benchmarks against in-memory Supabase/Chroma/LLM stand-ins.
+
+Run from the repository root (prompt paths are relative):
+    python -m benchmarks.run --sizes 1000 10000 100000 --scenarios daily aggregate csv
+    python -m benchmarks.run --sizes 1000 --baseline benchmarks/results/baseline.json
+"""
+import os
+import io
+import sys
+import json
+import argparse
+import platform
+import tempfile
+import contextlib
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List
+
+from benchmarks.fakes import install
+from benchmarks.synthetic import SCORE_DISTRIBUTIONS, generate_interactions, write_csv_log
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+COMPANY_ID = "bench-company"
+TALKING_PRODUCT_ID = "bench-tp"
+SCENARIOS = ("daily", "aggregate", "csv")
+
+
+def seed_directory(stack):
+    stack.supabase.tables["companies"] = [{"id": COMPANY_ID, "name": "Bench Company", "active": True}]
+    stack.supabase.tables["talking_products"] = [
+        {"id": TALKING_PRODUCT_ID, "company_id": COMPANY_ID, "name": "bench-tp", "active": True}
+    ]
+
+
+def run_scenario(main, stack, scenario: str, n: int, args) -> Dict[str, Any]:
+    """Seed the stand-ins with n synthetic rows and run one main_* entry point."""
+    stack.reset()
+    seed_directory(stack)
+    day = date.today() - timedelta(days=1)
+    days = 1 if scenario == "daily" else 7
+    start = day - timedelta(days=days - 1)
+    rows = generate_interactions(
+        n, TALKING_PRODUCT_ID, COMPANY_ID, start, days=days,
+        duplicate_rate=args.duplicate_rate, n_topics=args.topics,
+        score_distribution=args.score_distribution, seed=args.seed,
+    )
+
+    out = io.StringIO()
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else out):
+        if scenario == "daily":
+            stack.supabase.tables["interactions"] = rows
+            report = main.main_daily((day, day), COMPANY_ID, TALKING_PRODUCT_ID)
+        elif scenario == "aggregate":
+            stack.supabase.tables["interactions"] = rows
+            report = main.main_aggregate((start, day), report_type="weekly", talking_product_id=TALKING_PRODUCT_ID)
+        elif scenario == "csv":
+            with tempfile.TemporaryDirectory() as tmp:
+                csv_file = write_csv_log(rows, os.path.join(tmp, "bench-tp.csv"))
+                report = main.main_csv(csv_file, COMPANY_ID, TALKING_PRODUCT_ID)
+        else:
+            raise ValueError(f"Unknown scenario '{scenario}'")
+
+    return {
+        "scenario": scenario,
+        "n": n,
+        "status": report["status"],
+        "total_wall_s": report["total_wall_s"],
+        "total_cpu_s": report["total_cpu_s"],
+        "stages": {s["stage"]: {k: s.get(k) for k in ("items", "wall_s", "cpu_s", "peak_mem_mb")} for s in report["stages"]},
+        "calls": {**dict(stack.supabase.calls), **{f"chroma.{k}": v for k, v in stack.collection.calls.items()}},
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """Return human-readable regressions (total or per stage slower than baseline by more than tolerance)."""
+    base = {(r["scenario"], r["n"]): r for r in baseline}
+    regressions = []
+    print(f"\n{'scenario':<12}{'n':>8}{'stage':>16}{'baseline_s':>12}{'now_s':>10}{'ratio':>8}")
+    for r in results:
+        b = base.get((r["scenario"], r["n"]))
+        if b is None:
+            continue
+        pairs = [("total", b["total_wall_s"], r["total_wall_s"])]
+        pairs += [(name, b["stages"][name]["wall_s"], s["wall_s"]) for name, s in r["stages"].items() if name in b["stages"]]
+        for name, old, new in pairs:
+            ratio = new / old if old else float("inf") if new else 1.0
+            flag = ""
+            # Ignore sub-10ms stages, they are dominated by noise
+            if ratio > 1 + tolerance and new - old > 0.01:
+                flag = " ⚠️"
+                regressions.append(f"{r['scenario']} n={r['n']} {name}: {old:.3f}s → {new:.3f}s ({ratio:.2f}x)")
+            print(f"{r['scenario']:<12}{r['n']:>8}{name:>16}{old:>12.3f}{new:>10.3f}{ratio:>8.2f}{flag}")
+    return regressions
+
+
+def main_cli(argv=None):
+    ap = argparse.ArgumentParser(description="Offline benchmark of main_daily / main_aggregate / main_csv")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    ap.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    ap.add_argument("--duplicate-rate", type=float, default=0.3)
+    ap.add_argument("--topics", type=int, default=20)
+    ap.add_argument("--score-distribution", choices=SCORE_DISTRIBUTIONS, default="bimodal")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--llm-latency", type=float, default=0.0, help="Simulated LLM latency in seconds")
+    ap.add_argument("--real-embed", action="store_true", help="Use the real EMBED_MODEL instead of the hashing embedder")
+    ap.add_argument("--no-trace-memory", action="store_true", help="Disable tracemalloc (it slows down CPU-heavy stages)")
+    ap.add_argument("--baseline", help="Results JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown vs baseline (0.2 = 20%%)")
+    ap.add_argument("--out", help="Where to store results (default: benchmarks/results/<timestamp>.json)")
+    ap.add_argument("--verbose", action="store_true", help="Show pipeline output")
+    args = ap.parse_args(argv)
+
+    embedder = None
+    if args.real_embed:
+        from sentence_transformers import SentenceTransformer
+        from dotenv import load_dotenv
+        load_dotenv()
+        embedder = SentenceTransformer(os.getenv("BENCH_EMBED_MODEL", "BAAI/bge-m3"))
+
+    # Run reports defaults are bound when src.profiling is imported, so set them before importing main
+    import config
+    config.RUN_REPORTS_DIR = tempfile.mkdtemp(prefix="bench_run_reports_")
+    config.PROFILE_TRACE_MEMORY = not args.no_trace_memory
+    import main
+    stack = install(embedder=embedder, llm_latency_s=args.llm_latency)
+
+    results = []
+    for scenario in args.scenarios:
+        for n in args.sizes:
+            print(f"▶️ {scenario} n={n} ...", flush=True)
+            r = run_scenario(main, stack, scenario, n, args)
+            stages = " | ".join(f"{k} {v['wall_s']:.2f}s" for k, v in r["stages"].items())
+            print(f"   {r['status']} total {r['total_wall_s']:.2f}s :: {stages}")
+            results.append(r)
+
+    payload = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "verbose")},
+        "results": results,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%dT%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+    print(f"\n💾 Results stored in {out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\n⚠️ Regressions:\n" + "\n".join(regressions))
+            return 1
+        print("\n✅ No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
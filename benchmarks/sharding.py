@@ -0,0 +1,101 @@
+"""
+Filtered query latency: one shared Chroma collection vs per-company, per-doc_type collections,
+on a local (on-disk) Chroma instance. The sharded collections are filled with the real
+migration (src.sharding.migrate_to_sharded_collections), so its throughput is measured too.
+
+    python -m benchmarks.sharding --companies 20 --docs-per-company 2000 --queries 300
+"""
+import time
+import random
+import argparse
+import tempfile
+from datetime import date, timedelta
+
+import numpy as np
+
+from benchmarks.fakes import HashingEmbedder
+from benchmarks.synthetic import generate_interactions
+
+
+def seed_shared_collection(collection, embedder, n_companies: int, docs_per_company: int, report_share: float, batch: int = 2000):
+    """Interactions and report chunks of all companies in one collection; returns [(company_id, tp_id, question)]."""
+    rng = random.Random(3)
+    samples = []
+    for c in range(n_companies):
+        company_id, tp_id = f"bench-company-{c}", f"bench-company-{c}-tp"
+        rows = generate_interactions(docs_per_company, tp_id, company_id, date.today() - timedelta(days=1), seed=c)
+        for start in range(0, len(rows), batch):
+            part = rows[start:start + batch]
+            texts = [f"Q: {r['question']}\nA: {r['answer']}" for r in part]
+            metas = []
+            for r in part:
+                doc_type = "report_chunk" if rng.random() < report_share else "interaction"
+                metas.append({"doc_type": doc_type, "company_id": company_id, "talking_product_id": tp_id, "date": r["date"]})
+            collection.upsert(
+                ids=[f"{company_id}_{start + i}" for i in range(len(part))],
+                documents=texts,
+                metadatas=metas,
+                embeddings=embedder.encode(texts, normalize_embeddings=True),
+            )
+        samples += [(company_id, tp_id, r["question"]) for r in rows[:50]]
+    return samples
+
+
+def time_queries(queries, embedder, collections_of, n_results: int):
+    from src.sharding import query_collections
+
+    latencies = []
+    for company_id, tp_id, question, doc_type in queries:
+        q = embedder.encode(question, normalize_embeddings=True)
+        where = {"$and": [{"company_id": company_id}, {"talking_product_id": tp_id}] + ([{"doc_type": doc_type}] if doc_type else [])}
+        t0 = time.perf_counter()
+        query_collections(collections_of(company_id, doc_type), q, n_results, where)
+        latencies.append(time.perf_counter() - t0)
+    return np.array(latencies)
+
+
+def main_cli(argv=None):
+    ap = argparse.ArgumentParser(description="Shared vs sharded Chroma collections (local instance)")
+    ap.add_argument("--companies", type=int, default=20)
+    ap.add_argument("--docs-per-company", type=int, default=2000)
+    ap.add_argument("--report-share", type=float, default=0.2, help="Share of documents that are report chunks")
+    ap.add_argument("--queries", type=int, default=300)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--path", default=None, help="Chroma persist directory (default: a temporary directory)")
+    args = ap.parse_args(argv)
+
+    import chromadb
+    import config
+    from src.sharding import collections_for, migrate_to_sharded_collections, reset_collections
+
+    path = args.path or tempfile.mkdtemp(prefix="chroma-bench-")
+    config.get_chroma_client.set(chromadb.PersistentClient(path=path))
+    config.get_collection.reset()
+    reset_collections()
+    embedder = HashingEmbedder(dim=args.dim)
+
+    t0 = time.perf_counter()
+    samples = seed_shared_collection(config.get_collection(), embedder, args.companies, args.docs_per_company, args.report_share)
+    total = args.companies * args.docs_per_company
+    print(f"📥 Seeded {total} documents in {time.perf_counter() - t0:.1f}s ({path})")
+
+    t0 = time.perf_counter()
+    result = migrate_to_sharded_collections()
+    seconds = time.perf_counter() - t0
+    print(f"🚚 Migration: {result['total']} documents into {len(result['copied'])} collections in {seconds:.1f}s ({result['total'] / seconds:.0f} docs/s)")
+
+    rng = random.Random(9)
+    queries = [(*rng.choice(samples), rng.choice([None, "report_chunk", "interaction"])) for _ in range(args.queries)]
+    modes = [
+        ("shared", lambda company_id, doc_type: collections_for(company_id, doc_type, sharded=False)),
+        ("sharded", lambda company_id, doc_type: collections_for(company_id, doc_type, sharded=True)),
+    ]
+    for name, collections_of in modes:
+        time_queries(queries[:20], embedder, collections_of, args.k)  # Warm up (load the HNSW segments)
+        latencies = time_queries(queries, embedder, collections_of, args.k)
+        print(f"🔎 {name:<8} {len(latencies)} queries | p50 {np.percentile(latencies, 50) * 1000:.2f} ms | p95 {np.percentile(latencies, 95) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,99 @@
+import csv
+import random
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List
+
+
+SCORE_DISTRIBUTIONS = ("uniform", "bimodal", "high", "low")
+
+_TEMPLATES = [
+    "What are the {a} for the {b}?",
+    "Where can I find the {a}?",
+    "How do I {a} the {b}?",
+    "Is there a {a} near the {b}?",
+    "Can you tell me more about {a} and {b}?",
+    "When does the {a} open?",
+    "How much does the {a} cost?",
+]
+_SYLLABLES = ["ka", "lo", "mi", "ter", "van", "do", "ri", "sen", "pa", "gu", "lin", "tho", "be", "ro", "ze", "mar"]
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3)))
+
+
+def _score(rng: random.Random, distribution: str) -> float:
+    if distribution == "uniform":
+        return float(rng.randint(0, 100))
+    if distribution == "bimodal":  # Many complete misses, the rest mostly good matches
+        return 0.0 if rng.random() < 0.3 else float(rng.randint(60, 100))
+    if distribution == "high":
+        return round(rng.betavariate(5, 2) * 100, 0)
+    if distribution == "low":
+        return round(rng.betavariate(2, 5) * 100, 0)
+    raise ValueError(f"Unknown score distribution '{distribution}', expected one of {SCORE_DISTRIBUTIONS}")
+
+
+def generate_interactions(
+    n: int,
+    talking_product_id: str,
+    company_id: str,
+    start_date: date,
+    days: int = 1,
+    duplicate_rate: float = 0.3,
+    n_topics: int = 20,
+    score_distribution: str = "bimodal",
+    seed: int = 42,
+) -> List[Dict[str, Any]]:
+    """
+    Generate n synthetic interaction rows shaped like the rows returned by the
+    fetch_interactions_filtered RPC (question, answer, match_score, date, interaction_time, ...).
+
+    Questions are drawn from n_topics topics (each with its own vocabulary, so they cluster),
+    and a duplicate_rate fraction of rows repeats an earlier question verbatim.
+    """
+    rng = random.Random(seed)
+    topics = [[_word(rng) for _ in range(6)] for _ in range(max(n_topics, 1))]
+
+    rows: List[Dict[str, Any]] = []
+    seen_questions: List[str] = []
+    for i in range(n):
+        if seen_questions and rng.random() < duplicate_rate:
+            question = rng.choice(seen_questions)
+        else:
+            vocab = rng.choice(topics)
+            a, b = rng.sample(vocab, 2)
+            question = rng.choice(_TEMPLATES).format(a=a, b=b)
+            seen_questions.append(question)
+
+        day = start_date + timedelta(days=rng.randrange(max(days, 1)))
+        seconds = rng.randrange(24 * 3600)
+        rows.append({
+            "id": i + 1,
+            "question": question,
+            "answer": f"Synthetic answer about {question.split()[-1].strip('?')}.",
+            "match_score": _score(rng, score_distribution),
+            "date": day.isoformat(),
+            "interaction_time": f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}",
+            "talking_product_id": talking_product_id,
+            "company_id": company_id,
+        })
+
+    rows.sort(key=lambda r: (r["date"], r["interaction_time"], r["id"]))
+    return rows
+
+
+def write_csv_log(rows: List[Dict[str, Any]], csv_path: str) -> str:
+    """Write rows in the Talking Product admin CSV export format consumed by parse_csv_logs."""
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter=",", quotechar='"', escapechar="\\", quoting=csv.QUOTE_ALL)
+        writer.writerow(["Date/Time", "Statement", "Answer", "Score"])
+        for r in rows:
+            dt = datetime.strptime(f"{r['date']} {r['interaction_time']}", "%Y-%m-%d %H:%M:%S")
+            writer.writerow([
+                dt.strftime("%d/%m/%Y, %H:%M:%S"),
+                r["question"],
+                r["answer"],
+                f"{r['match_score']:.0f}%",
+            ])
+    return csv_path
@@ -1,6 +1,7 @@
-from supabase import create_client
 from dotenv import load_dotenv
-import os, chromadb, time
+import os, time
+
+from src.lazy import lazy
 
 
 load_dotenv()  # Load environment variables from .env file
@@ -11,13 +12,34 @@ CONTEXT_WINDOW = 1000000
 MIN_TOKENS_PER_CLUSTER = 200
 SCORE_IMPORTANCE = 0.5
 LANG_CONFIDENCE_THRESHOLD = 0.5  # Minimum confidence for language detection
+LANGUAGE_DETECT_WORKERS = max((os.cpu_count() or 2) - 1, 1)  # Processes classifying uncached texts
+LANGUAGE_DETECT_PARALLEL_MIN = 2000  # Fewer uncached texts than this are classified in-process (pool start-up isn't worth it)
+LANGUAGE_DETECT_BATCH_SIZE = 500  # Texts per process-pool task
 RETRIEVAL_K = 10  # Number of documents to retrieve for RAG
-MAX_CONTEXT_CHARS = 25000 
+HYBRID_RETRIEVAL_ENABLED = True  # Fuse dense (Chroma) hits with a local BM25 index per company (exact terms, product codes)
+HYBRID_CANDIDATES = 30  # Candidates taken from each retriever before fusion
+HYBRID_RRF_K = 60  # Reciprocal rank fusion constant: score = sum(1 / (HYBRID_RRF_K + rank))
+HYBRID_INDEX_PAGE_SIZE = 1000  # Documents per Chroma get() call when (re)building a company's BM25 index
+RERANKER_ENABLED = False  # Rerank the fused candidates with RERANKER_MODEL
+RERANKER_TOP_N = 20  # Fused candidates passed to the reranker
+RERANKER_BATCH_SIZE = 16
+RAG_DOC_TYPE = "report_chunk"  # RAG searches only this doc_type ("report_chunk" or "interaction"); None searches both
+REPORT_VECTOR_CACHE_ENABLED = True  # Answer report-chunk searches from an in-process copy of the vectors (Chroma stays the source of truth and fallback)
+REPORT_VECTOR_CACHE_PAGE_SIZE = 500  # Chunks (with embeddings) per Chroma get() call when loading a company
+MAX_CONTEXT_CHARS = 25000
+DIRECT_CONTEXT_PAGE_SIZE = 1000  # Interactions per request round for a direct answer (a range with fewer rows is read in one call)
+DIRECT_CONTEXT_TIME_SLICES = 7  # The date range is sampled in up to this many windows, so early days don't crowd out later ones
+DIRECT_CONTEXT_OVERSAMPLE = 2  # Stop reading once the distinct questions fill this many times the context budget
+DIRECT_CONTEXT_LOW_MATCH = 50  # match_score below this counts as a (near) miss
+DIRECT_CONTEXT_LOW_MATCH_SHARE = 0.5  # Share of the context budget reserved for low-match questions 
 
 
 # ---------- Chunking ----------
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+CSV_CHUNK_SIZE = 2000  # CSV log rows parsed, embedded and upserted per step in main_csv (bounds peak memory)
+EMBED_BATCH_SIZE = 64  # Texts per model forward pass when embedding questions in bulk
+CHROMA_UPSERT_BATCH_SIZE = 300  # Records per Chroma upsert call (Chroma Cloud limits the batch size)
 
 
 # ---------- Namings ----------
@@ -35,22 +57,71 @@ FREE_LOCAL_LLM_MODEL = "deepseek-r1"
 LLM_MODEL = "models/gemini-2.5-flash-lite"
 # LLM_MODEL = "models/gemini-2.5-flash"
 EMBED_MODEL = "BAAI/bge-m3"
+RERANKER_MODEL = "BAAI/bge-reranker-v2-m3"  # Cross-encoder for optional hybrid-retrieval reranking (runs locally on CPU)
 TOKEN_ENCODING_MODEL = "cl100k_base"
 LLM_API_KEY = os.getenv("LLM_API_KEY")
+LLM_RATE_LIMIT_PER_MINUTE = 60  # Report-generation LLM calls started per minute in backfills (provider quota); 0 = unlimited
+LLM_MAX_CONCURRENCY = 4  # Report-generation LLM calls in flight at once in backfills
 
 
 # ---------- File paths ----------
 CSV_LOGS_DIR = "C:/Users/jarno/Desktop/Digiole/code/automatic_reporting/csv_logs"
+CSV_ARCHIVE_DIR = None  # Successfully processed CSVs are moved here; None deletes them
+CSV_BACKFILL_WORKERS = min(os.cpu_count() or 1, 4)  # CSV files processed in parallel (one process each, and each loads the embedding model); 1 = sequential
+INCREMENTAL_LOOKBACK_MINUTES = 30  # Incremental ticks re-read this far behind the high-water mark (rows ingested late with an earlier time); seen rows are skipped
+INCREMENTAL_ASSIGN_MIN_SIMILARITY = 0.75  # New questions join the nearest existing cluster at this cosine similarity to its centroid, else noise
+INCREMENTAL_RECLUSTER_GROWTH = 2.0  # Re-cluster the whole day once it has this many times the logs of the last full clustering
+INCREMENTAL_REPORT_MIN_CHANGE = 0.2  # Regenerate today's report when this share of logs changed cluster (or is new) since the last one
+BACKFILL_WORKERS = 4  # Days clustered and summarized concurrently by `python main.py backfill` (LLM calls also respect LLM_RATE_LIMIT_PER_MINUTE)
+PIPELINE_ENABLED = True  # Nightly daily reports run as a stage pipeline: products overlap in fetch/embed/index/cluster/llm/save (False = one product at a time)
+PIPELINE_STAGE_WORKERS = {"fetch": 2, "embed": 1, "index": 1, "cluster": 1, "llm": 4, "save": 2}  # Worker threads per stage (llm also respects LLM_MAX_CONCURRENCY)
+PIPELINE_QUEUE_SIZE = 2  # Products waiting in front of each stage; a full queue blocks the stage before it (bounds the embedded data held in memory)
+PIPELINE_PROGRESS_SECONDS = 30  # Queue depths are printed this often during a pipelined run (0 = never)
+WRITE_BEHIND_ENABLED = True  # Nightly daily/aggregate reports and interactions are spooled locally and written to Supabase/Chroma in bulk by a background thread
+WRITE_BEHIND_MAX_ITEMS = 20  # Flush the write-behind spool once this many reports/interaction batches are queued
+WRITE_BEHIND_FLUSH_SECONDS = 10  # ... or once the oldest queued item waited this long (and always at exit)
 DAILY_PROMPT_PATH = "prompt_input/daily_prompt.md"
 SQL_PROMPT_PATH = "prompt_input/sql_prompt.md"
 LLM_PROMPT_PATH = "prompt_input/llm_prompt.md"
 RAG_PROMPT_PATH = "prompt_input/rag_prompt.md"
 REPORT_STRUCTURE_PATH = "prompt_input/report_structure.json"
 CONTEXT_PATH = "prompt_input/context.md"
+LANGUAGE_CACHE_PATH = "cache/languages.sqlite"  # Persistent text -> detected language cache
+INCREMENTAL_STATE_PATH = "cache/incremental.sqlite"  # Today's logs, clusters and high-water mark per talking product for `python main.py incremental`
+RUN_LEDGER_PATH = "cache/run_ledger.sqlite"  # Per-unit stages/input fingerprints of nightly runs (resume after a crash, skip unchanged input)
+WRITE_BEHIND_SPOOL_PATH = "cache/write_behind.sqlite"  # Durable spool of reports/interactions not yet written to Supabase/Chroma (retried by the next run after a crash)
+
+
+# ---------- Profiling ----------
+RUN_REPORTS_DIR = "run_reports"  # One JSON run report per product/report type is written here
+PROFILE_TRACE_MEMORY = True  # Track peak memory per stage with tracemalloc (adds some overhead)
+SHARD_SUMMARY_DIR = "run_reports/shards"  # Per-shard summaries of `python main.py nightly --shard i/N`, merged when the last shard finishes (use a shared directory across hosts)
+RUN_LEDGER_ENABLED = True  # Nightly runs skip units finished earlier in the same run or whose input is unchanged since their report
+
+
+# ---------- Tracing ----------
+TRACE_SLOW_REQUEST_SECONDS = 10  # Requests slower than this are logged as slow (and profiled, if enabled)
+TRACE_PROFILE_SLOW_REQUESTS = False  # Sample thread stacks during requests and keep the samples of slow ones
+TRACE_PROFILE_INTERVAL_MS = 10  # Stack sampling interval of the slow-request profiler
+
+
+# ---------- Caching ----------
+DATA_VERSIONS_TABLE = "data_versions"  # company_id -> version, bumped whenever interactions/reports are stored
+DATA_VERSION_TTL_SECONDS = 30  # How long the backend trusts a cached data version before re-reading it
+TENANT_DIRECTORY_TTL_SECONDS = 300  # How long the in-process company/talking product mapping is used before reloading
+TENANT_DIRECTORY_MISS_REFRESH_SECONDS = 10  # A lookup miss reloads the mapping early, at most this often
+SEMANTIC_CACHE_ENABLED = True  # Reuse /ask answers for semantically equivalent questions
+SEMANTIC_CACHE_THRESHOLD = 0.92  # Minimum cosine similarity between questions for a cache hit
+SEMANTIC_CACHE_MAX_ENTRIES = 500  # Cached answers per (company, talking product, date range) scope
+SQL_RESULT_CACHE_ENABLED = True  # Reuse execute_readonly_sql rows for identical (normalized) SQL until the company's data changes
+SQL_RESULT_CACHE_MAX_ENTRIES = 2000  # Cached query results across all companies
+SQL_RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Total JSON size of cached rows
 
 
 # ---------- SQL ----------
 READONLY_SQL_RPC = "execute_readonly_sql"
+INTENT_ROUTER_ENABLED = True  # Answer common dashboard questions with canned SQL templates instead of LLM-written SQL
+INTENT_ROUTER_THRESHOLD = 0.8  # Minimum cosine similarity to an intent's example question
 
 
 # ---------- Adding company info ----------
@@ -72,13 +143,6 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")  # Use ANON only for frontend/dev use-cases
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")  # Use SERVICE ROLE for backend cron/reporting (bypasses RLS)
 
-if not SUPABASE_URL:
-    raise RuntimeError("Missing SUPABASE_URL")
-
-if not SUPABASE_SERVICE_ROLE_KEY:
-    raise RuntimeError("Missing SUPABASE_SERVICE_ROLE_KEY (required for reporting with RLS)")
-
-SUPABASE = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 REPORT_TABLES = {
     "daily": "daily",
     "weekly": "weekly",
@@ -87,27 +151,69 @@ REPORT_TABLES = {
 }
 
 
+@lazy
+def get_supabase():
+    """Shared Supabase client, created on first use."""
+    if not SUPABASE_URL:
+        raise RuntimeError("Missing SUPABASE_URL")
+
+    if not SUPABASE_SERVICE_ROLE_KEY:
+        raise RuntimeError("Missing SUPABASE_SERVICE_ROLE_KEY (required for reporting with RLS)")
+
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+
+
 # ---------- Chroma Cloud Settings ----------
 CHROMA_DATABASE = 'Test'
 CHROMA_COLLECTION_NAME = "digiole_automatic_reporting"
 CHROMA_KEY = os.getenv("CHROMA_KEY")
 CHROMA_TENANT = os.getenv("CHROMA_TENANT")
-
-for attempt in range(3):
-    try:
-        client = chromadb.CloudClient(
-        api_key=CHROMA_KEY,
-        tenant=CHROMA_TENANT,
-        database=CHROMA_DATABASE
-        )
-        COLLECTION = client.get_or_create_collection(name=CHROMA_COLLECTION_NAME)
-        break
-    except Exception as e:
-        print(f"Connection attempt {attempt+1} failed: {e}")
-        time.sleep(3)
-else:
+CHROMA_SHARDED_COLLECTIONS = False  # One collection per company and doc_type (CHROMA_COLLECTION_NAME__<company>__<doc_type>); run `python main.py migrate-collections` before enabling
+CHROMA_MIGRATION_BATCH_SIZE = 500  # Documents (with embeddings) per read when copying into the sharded collections
+
+
+@lazy
+def get_chroma_client():
+    """Shared Chroma Cloud client, connected on first use (3 attempts)."""
+    import chromadb
+
+    for attempt in range(3):
+        try:
+            return chromadb.CloudClient(
+                api_key=CHROMA_KEY,
+                tenant=CHROMA_TENANT,
+                database=CHROMA_DATABASE
+            )
+        except Exception as e:
+            print(f"Connection attempt {attempt+1} failed: {e}")
+            time.sleep(3)
     raise RuntimeError("Failed to connect to Chroma Cloud after 3 retries.")
 
 
-GOOGLE_CLIENT_ID = "634726700514-e1mk0mlff6lacdrs6f7a6shvlj9th6d3.apps.googleusercontent.com"
+@lazy
+def get_collection():
+    """Shared Chroma collection, created on first use."""
+    return get_chroma_client().get_or_create_collection(name=CHROMA_COLLECTION_NAME)
+
 
+def __getattr__(name):
+    # Backwards compatibility: `from config import SUPABASE, COLLECTION` still works, but connects on access
+    if name == "SUPABASE":
+        return get_supabase()
+    if name == "COLLECTION":
+        return get_collection()
+    raise AttributeError(f"module 'config' has no attribute '{name}'")
+
+
+# ---------- Backend ----------
+BACKEND_WARM_UP_EMBEDDINGS = False  # Load EMBED_MODEL at server startup even if neither the semantic cache nor the intent router is enabled
+ASK_TIMEOUT_SECONDS = 60  # Per /ask request, including time spent waiting for a tenant slot
+ASK_MAX_CONCURRENCY_PER_COMPANY = 4  # Concurrent /ask requests per company_id, the rest wait
+BLOCKING_IO_WORKERS = 32  # Thread pool for blocking Supabase/Chroma/embedding calls from async code
+QUERY_EMBED_CACHE_SIZE = 4096  # LRU size for query embeddings used by RAG retrieval
+QUERY_EMBED_MAX_BATCH = 32  # Max queries encoded in one micro-batch
+QUERY_EMBED_BATCH_WAIT_MS = 5  # How long the micro-batcher waits for more queries after the first one
+
+
+GOOGLE_CLIENT_ID = "634726700514-e1mk0mlff6lacdrs6f7a6shvlj9th6d3.apps.googleusercontent.com"
@@ -1,12 +1,124 @@
-import calendar, os, glob
-from datetime import datetime, timedelta
-from src.embed import embed_fn, add_question_embeddings
+import calendar, os, sys, glob, time, shutil, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from config import WRITE_BEHIND_ENABLED
+from src.embed import embed_texts, add_question_embeddings
 from src.prompt import generate_report
-from src.store import update_db_interactions, update_db_reports
-from src.get.data import get_active_company_ids, get_active_talking_product_ids, get_latest_interaction_date, get_ids, get_company_id, fetch_questions
-from src.utils import cluster_questions, format_clusters_for_llm, parse_csv_logs
+from src.store import update_db_interactions, update_db_reports, update_db_reports_bulk, bump_data_version
+from src.get.data import get_active_company_ids, get_active_talking_product_ids, get_latest_interaction_date, get_ids, get_company_id, get_report_dates, get_daily_counts, fetch_questions, fetch_interactions_since, interaction_rows_to_logs
+from src.utils import cluster_questions, format_clusters_for_llm, iter_csv_log_chunks, new_log_totals, summarize_log_totals, split_logs_by_day
+from src.profiling import RunProfiler, format_summary_table
+from src.concurrency import get_llm_rate_limiter
+from src.ledger import get_run_ledger, interactions_fingerprint
+from src.incremental import get_incremental_store
+from src.partition import parse_shard, unit_weights, partition_units, write_shard_summary, read_shard_summaries, format_shard_table
+from src.writebehind import WriteBehindQueue, get_write_behind
 
-def main_daily(date_range, company_id, talking_product_id):
+def _skip_unchanged(unit, profiler, data):
+    """
+    Ledger check after the fetch: True if the unit's stored report was built from exactly this input
+    (embed, cluster and LLM can be skipped). Otherwise starts the unit and checkpoints each further stage.
+    """
+    if unit is None:
+        return False
+    fingerprint = interactions_fingerprint(data["logs"] if data else [])
+    if unit.unchanged(fingerprint):
+        print(f"⏭️ Input unchanged since the stored report ({unit.key}), skipping.")
+        return True
+    unit.start(fingerprint)
+    profiler.on_stage = unit.stage_done
+    return False
+
+def _finish_unit(unit, profiler, status="ok"):
+    report = profiler.finish(status=status)
+    if unit is not None:
+        unit.finish("failed" if status == "failed" else "done")  # A failed unit is never "unchanged": the next run redoes it
+    return report
+
+def _save_interactions(data, company_id, talking_product_id):
+    """update_db_interactions, or queued for the write-behind spool when WRITE_BEHIND_ENABLED."""
+    if WRITE_BEHIND_ENABLED:
+        get_write_behind().submit_interactions(data, company_id, talking_product_id)
+    else:
+        update_db_interactions(data, company_id, talking_product_id)
+
+def _save_report(data, report, report_type="daily", company_id=None, talking_product_id=None, date_range=None):
+    """
+    update_db_reports, or queued for the write-behind spool when WRITE_BEHIND_ENABLED.
+    Returns whether the report is safe: saved, or durably spooled (the spool retries failed writes).
+    """
+    if WRITE_BEHIND_ENABLED:
+        get_write_behind().submit_report(data, report, report_type, company_id, talking_product_id, date_range)
+        return True
+    return update_db_reports(data, report, embed_texts, report_type, company_id, talking_product_id, date_range)
+
+# main_daily as stage functions over a job dict, so the same steps run one product at a time
+# (main_daily) or overlapped across products (main_daily_pipelined). A job is finished once it has a "result".
+
+def _daily_job(date_range, company_id, talking_product_id, ledger=None, run_key=None, resume=False, trace_memory=None):
+    profiler = RunProfiler("daily", company_id, talking_product_id, date_range, **({} if trace_memory is None else {"trace_memory": trace_memory}))
+    unit = ledger.unit(talking_product_id, "daily", date_range, run_key, resume) if ledger is not None else None
+    return {"date_range": date_range, "company_id": company_id, "talking_product_id": talking_product_id, "profiler": profiler, "unit": unit}
+
+def _daily_fetch(job):
+    profiler, unit, date_range = job["profiler"], job["unit"], job["date_range"]
+    if unit is not None and unit.finished_in_run():
+        print(f"⏭️ Daily report for {job['talking_product_id']} {date_range} was already finished in this run.")
+        job["result"] = profiler.finish(status="skipped")
+        return
+
+    with profiler.stage("fetch") as stage:
+        data = fetch_questions(date_range, talking_product_id=job["talking_product_id"], company_id=job["company_id"])
+        stage["items"] = data["n_logs"] if data else 0
+
+    if _skip_unchanged(unit, profiler, data):
+        job["result"] = profiler.finish(status="skipped")
+    elif not data or data["n_logs"] == 0:
+        print(f"No questions found for date range {date_range}.")
+        job["result"] = _finish_unit(unit, profiler, status="empty")
+    job["data"] = data
+
+def _daily_embed(job):
+    with job["profiler"].stage("embed", items=job["data"]["n_logs"]):
+        job["data"] = add_question_embeddings(job["data"])  # Embed questions in the data
+
+def _daily_index(job):
+    if job["unit"] is None or not job["unit"].completed("chroma_upsert"):  # Already stored before a crash: upserting again changes nothing
+        with job["profiler"].stage("chroma_upsert", items=job["data"]["n_logs"]):
+            _save_interactions(job["data"], job["company_id"], job["talking_product_id"])  # Store interactions in the vector DB
+
+def _daily_cluster(job):
+    profiler, data = job["profiler"], job["data"]
+    with profiler.stage("cluster", items=data["n_logs"]) as stage:
+        clusters, noise = cluster_questions(data)  # Cluster questions based on embeddings
+        stage["items"] = len(clusters)
+    with profiler.stage("format") as stage:
+        job["logs_text"] = format_clusters_for_llm(data, clusters, noise)
+        stage["items"] = len(job["logs_text"])
+    print(job["logs_text"])  # For debugging
+
+def _daily_llm(job):
+    # Generate structured daily report with LLM
+    with job["profiler"].stage("llm") as stage:
+        with get_llm_rate_limiter().slot():
+            job["report"] = generate_report(job["logs_text"])
+        stage["items"] = len(job["report"].topics)
+
+def _daily_save(job):
+    with job["profiler"].stage("save", items=1):
+        saved = _save_report(job["data"], job["report"], company_id=job["company_id"], talking_product_id=job["talking_product_id"])  # Save report to DB
+    job["result"] = _finish_unit(job["unit"], job["profiler"], status="ok" if saved else "failed")
+
+DAILY_STAGES = (
+    ("fetch", _daily_fetch),
+    ("embed", _daily_embed),
+    ("index", _daily_index),
+    ("cluster", _daily_cluster),
+    ("llm", _daily_llm),
+    ("save", _daily_save),
+)
+
+def main_daily(date_range, company_id, talking_product_id, ledger=None, run_key=None, resume=False):
     # emails_by_date, service = fetch_emails()  # Commented out because new Prifina Ingestion, but if used later: fetch emails based on the company_id and talking_product_id
     # if not emails_by_date:
     #     print("No new emails found.")
@@ -14,99 +126,561 @@ def main_daily(date_range, company_id, talking_product_id):
     
     # for date, email_list in emails_by_date.items():
         # data = parse_email(date, email_list, service)
+        job = _daily_job(date_range, company_id, talking_product_id, ledger, run_key, resume)
+        for _, stage in DAILY_STAGES:
+            if "result" in job:
+                break
+            stage(job)
+        return job["result"]
 
-        data = fetch_questions(date_range, talking_product_id=talking_product_id, company_id=company_id)
+def main_daily_pipelined(date_range, products, ledger=None, run_key=None, resume=False, stage_workers=None):
+    """
+    Daily reports for many (company_id, talking_product_id) pairs with the stages overlapped across products:
+    each stage of DAILY_STAGES has its own workers (PIPELINE_STAGE_WORKERS) and a bounded input queue, so while
+    the LLM writes one product's report the next ones are clustering, embedding and fetching.
+    A failing product is reported with status "failed" and doesn't stop the others.
+    Returns the run reports (in completion order); the per-stage backpressure summary is printed and written to RUN_REPORTS_DIR.
+    """
+    from config import PIPELINE_STAGE_WORKERS
+    from src.pipeline import StagePipeline, format_pipeline_table
+    from src.profiling import write_run_report
 
-        if not data or data["n_logs"] == 0:
-            print(f"No questions found for date range {date_range}.")
-            return
+    workers = {**PIPELINE_STAGE_WORKERS, **(stage_workers or {})}
 
-        data = add_question_embeddings(data)  # Embed questions in the data
-        update_db_interactions(data, company_id, talking_product_id)  # Store interactions in the vector DB
+    def on_error(job, stage_name, e):
+        print(f"❌ Daily report for {job['talking_product_id']} failed in {stage_name}: {type(e).__name__}: {e}")
+        job["result"] = job["profiler"].finish(status="failed")
 
-        clusters, noise = cluster_questions(data)  # Cluster questions based on embeddings
-        logs_text = format_clusters_for_llm(data, clusters, noise)
-        print(logs_text)  # For debugging
+    pipeline = StagePipeline(
+        [(name, fn, workers[name]) for name, fn in DAILY_STAGES],
+        is_done=lambda job: "result" in job,
+        on_error=on_error,
+    )
+    # tracemalloc keeps one process-wide peak: per-stage memory isn't meaningful with overlapping stages
+    jobs = (_daily_job(date_range, c, tp, ledger, run_key, resume, trace_memory=False) for c, tp in products)
+    run_reports = [job["result"] for job in pipeline.run(jobs) if "result" in job]  # No result: its on_error failed (already printed)
 
-        # Generate structured daily report with LLM
-        report = generate_report(logs_text)
-        update_db_reports(data, report, embed_fn, talking_product_id=talking_product_id)  # Save report to DB
+    summary = pipeline.summary()
+    print(format_pipeline_table(summary, pipeline.wall_s))
+    write_run_report({"run_type": "pipeline", "date_range": date_range, "status": "ok", "total_wall_s": round(pipeline.wall_s, 4), "stages": summary})
+    return run_reports
 
-def main_aggregate(date_range, report_type, talking_product_id=None, company_id=None):
+def main_aggregate(date_range, report_type, talking_product_id=None, company_id=None, ledger=None, run_key=None, resume=False):
     """Generate aggregated reports (Weekly, Monthly, or custom) for a given date range, talking product id and company id. The talking product id should correspond to the correct company id."""
+    profiler = RunProfiler(report_type, company_id, talking_product_id, date_range)
+    unit = ledger.unit(talking_product_id or company_id, report_type, date_range, run_key, resume) if ledger is not None else None
+    if unit is not None and unit.finished_in_run():
+        print(f"⏭️ {report_type} report for {talking_product_id or company_id} {date_range} was already finished in this run.")
+        return profiler.finish(status="skipped")
+
     # Fetch questions for the given date range
-    data = fetch_questions(date_range, talking_product_id=talking_product_id, company_id=company_id)
+    with profiler.stage("fetch") as stage:
+        data = fetch_questions(date_range, talking_product_id=talking_product_id, company_id=company_id)
+        stage["items"] = data["n_logs"] if data else 0
 
+    if _skip_unchanged(unit, profiler, data):
+        return profiler.finish(status="skipped")
     if not data or data["n_logs"] == 0:
         print(f"No questions found for date range {date_range}.")
-        return
+        return _finish_unit(unit, profiler, status="empty")
 
-    clusters, noise = cluster_questions(data)
-    logs_text = format_clusters_for_llm(data, clusters, noise)
-    report = generate_report(logs_text)
-    update_db_reports(data, report, embed_fn, report_type, company_id, talking_product_id, date_range)
+    with profiler.stage("embed", items=data["n_logs"]):
+        data = add_question_embeddings(data)  # fetch_questions returns no embeddings, clustering needs them
+
+    with profiler.stage("cluster", items=data["n_logs"]) as stage:
+        clusters, noise = cluster_questions(data)
+        stage["items"] = len(clusters)
+    with profiler.stage("format") as stage:
+        logs_text = format_clusters_for_llm(data, clusters, noise)
+        stage["items"] = len(logs_text)
+    with profiler.stage("llm") as stage:
+        with get_llm_rate_limiter().slot():
+            report = generate_report(logs_text)
+        stage["items"] = len(report.topics)
+    with profiler.stage("save", items=1):
+        saved = _save_report(data, report, report_type, company_id, talking_product_id, date_range)
+    return _finish_unit(unit, profiler, status="ok" if saved else "failed")
 
 def main_csv(csv_file, company_id, talking_product_id):
-    latest_date = get_latest_interaction_date(talking_product_id)  # Fetch latest processed date for this TP
-    data = parse_csv_logs(csv_file, min_date_exclusive=latest_date)
+    profiler = RunProfiler("csv", company_id, talking_product_id)
+
+    with profiler.stage("fetch", items=1):
+        latest_date = get_latest_interaction_date(talking_product_id)  # Fetch latest processed date for this TP
+
+    # Parse, embed and upsert CSV_CHUNK_SIZE rows at a time: the file is never held in memory,
+    # only the parsed logs (with float32 embeddings) that clustering needs are kept
+    totals = new_log_totals()
+    logs = []
+    with profiler.stage("ingest") as stage:
+        timings = {"parse_s": 0.0, "embed_s": 0.0, "upsert_s": 0.0}
+        chunks = iter_csv_log_chunks(csv_file, min_date_exclusive=latest_date, totals=totals)
+        while True:
+            t0 = time.perf_counter()
+            chunk = next(chunks, None)
+            timings["parse_s"] += time.perf_counter() - t0
+            if chunk is None:
+                break
+            t0 = time.perf_counter()
+            chunk_data = add_question_embeddings({"date": datetime.today().strftime("%Y-%m-%d"), "logs": chunk})
+            timings["embed_s"] += time.perf_counter() - t0
+            t0 = time.perf_counter()
+            update_db_interactions(chunk_data, company_id, talking_product_id, bump_version=False)
+            timings["upsert_s"] += time.perf_counter() - t0
+            logs += chunk
+        stage.update({k: round(v, 4) for k, v in timings.items()}, items=totals["n_logs"])
+
+    data = {"date": datetime.today().strftime("%Y-%m-%d"), **summarize_log_totals(totals), "logs": logs}  # Date = CSV ingestion
 
     # If no new logs, just return (CSV was already fully processed)
     if data["n_logs"] == 0:
         print(f"No new data to process for talking_product_id={talking_product_id} from CSV {csv_file}.")
+        return profiler.finish(status="empty")
+    bump_data_version(company_id, talking_product_id)
+
+    with profiler.stage("cluster", items=data["n_logs"]) as stage:
+        clusters, noise = cluster_questions(data)
+        stage["items"] = len(clusters)
+    with profiler.stage("format") as stage:
+        logs_text = format_clusters_for_llm(data, clusters, noise)
+        stage["items"] = len(logs_text)
+    print(logs_text)  # For debugging
+
+    with profiler.stage("llm") as stage:
+        report = generate_report(logs_text)
+        stage["items"] = len(report.topics)
+    with profiler.stage("save", items=1):
+        saved = update_db_reports(data, report, embed_texts, report_type="aggregated", company_id=company_id, talking_product_id=talking_product_id)
+    return profiler.finish(status="ok" if saved else "failed")  # A failed save keeps the CSV file for a retry
+
+
+
+def _backfill_csv_file(csv_file, company_id, talking_product_id):
+    """main_csv for one file, run in a backfill worker process. Never raises: returns the outcome."""
+    t0 = time.perf_counter()
+    try:
+        report = main_csv(csv_file, company_id, talking_product_id)
+    except Exception as e:
+        return {"file": csv_file, "status": "failed", "error": f"{type(e).__name__}: {e}", "rows": 0, "seconds": time.perf_counter() - t0}
+    rows = next((s.get("items") or 0 for s in report["stages"] if s["stage"] == "ingest"), 0)
+    outcome = {"file": csv_file, "status": report["status"], "rows": rows, "seconds": time.perf_counter() - t0, "report": report}
+    if report["status"] == "failed":
+        outcome["error"] = "The report could not be saved"
+    return outcome
+
+
+def _retire_csv(csv_file, archive_dir):
+    """Delete a processed CSV, or move it to archive_dir (without overwriting an earlier archive)."""
+    if archive_dir is None:
+        os.remove(csv_file)
         return
-    
-    data = add_question_embeddings(data)  
-    update_db_interactions(data, company_id, talking_product_id)
+    os.makedirs(archive_dir, exist_ok=True)
+    name, ext = os.path.splitext(os.path.basename(csv_file))
+    target = os.path.join(archive_dir, f"{name}{ext}")
+    if os.path.exists(target):
+        target = os.path.join(archive_dir, f"{name}_{datetime.now():%Y%m%d_%H%M%S}{ext}")
+    shutil.move(csv_file, target)
+
+
+def backfill_csv(csv_files, workers=None, archive_dir=None, initializer=None):
+    """
+    Process Talking Product CSV exports concurrently, one file per worker process.
+
+    File names (= talking product names) are resolved up front from the tenant directory
+    (a single query). Each file succeeds or fails on its own; only successfully processed
+    files are deleted (or moved to archive_dir). Prints per-file throughput and returns
+    one outcome dict per file: file, status, rows, seconds, report or error.
+    """
+    from config import CSV_ARCHIVE_DIR, CSV_BACKFILL_WORKERS
+    from src.get.tenants import get_tenant_directory
+
+    workers = CSV_BACKFILL_WORKERS if workers is None else workers
+    archive_dir = CSV_ARCHIVE_DIR if archive_dir is None else archive_dir
+    if not csv_files:
+        return []
+
+    directory = get_tenant_directory()
+    directory.refresh()
+    outcomes, jobs = [], []
+    for csv_file in csv_files:
+        talking_product_name = os.path.splitext(os.path.basename(csv_file))[0]  # CSV file name must be equal to the corresponding talking product name!
+        talking_product_id, company_id = directory.ids(talking_product_name)
+        if talking_product_id is None:
+            outcomes.append({"file": csv_file, "status": "failed", "error": f"Unknown talking product '{talking_product_name}'", "rows": 0, "seconds": 0.0})
+        else:
+            jobs.append((csv_file, company_id, talking_product_id))
+
+    t0 = time.perf_counter()
+    if workers > 1 and len(jobs) > 1:
+        # spawn: workers open their own Supabase/Chroma clients instead of sharing forked connections
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=multiprocessing.get_context("spawn"), initializer=initializer) as pool:
+            futures = {pool.submit(_backfill_csv_file, *job): job[0] for job in jobs}
+            for future in as_completed(futures):
+                try:
+                    outcomes.append(future.result())
+                except Exception as e:  # The worker process itself died
+                    outcomes.append({"file": futures[future], "status": "failed", "error": f"{type(e).__name__}: {e}", "rows": 0, "seconds": 0.0})
+    else:
+        outcomes += [_backfill_csv_file(*job) for job in jobs]
+    wall = time.perf_counter() - t0
+
+    for o in outcomes:
+        if o["status"] == "failed":
+            continue
+        try:
+            _retire_csv(o["file"], archive_dir)
+        except OSError as e:
+            print(f"⚠️ Processed {o['file']} but could not remove/archive it: {e}")
+
+    print(f"\n{'file':<40}{'status':>8}{'rows':>9}{'seconds':>10}{'rows/s':>10}")
+    for o in sorted(outcomes, key=lambda o: o["file"]):
+        rate = o["rows"] / o["seconds"] if o["seconds"] else 0.0
+        print(f"{os.path.basename(o['file'])[:39]:<40}{o['status']:>8}{o['rows']:>9}{o['seconds']:>10.1f}{rate:>10.0f}")
+        if o.get("error"):
+            print(f"   ❌ {o['error']}")
+    total_rows = sum(o["rows"] for o in outcomes)
+    failed = sum(o["status"] == "failed" for o in outcomes)
+    print(f"📂 {len(outcomes)} CSV files ({failed} failed), {total_rows} rows in {wall:.1f}s ({total_rows / wall if wall else 0:.0f} rows/s)")
+    return outcomes
+
 
+def _select_products(company_id=None, talking_product_id=None):
+    """(company_id, talking_product_id) pairs: one talking product, a company's active products, or all active products."""
+    from src.get.tenants import get_tenant_directory
+
+    if talking_product_id is not None:
+        return [(company_id or get_tenant_directory().company_of_product(talking_product_id), talking_product_id)]
+    company_ids = [company_id] if company_id is not None else get_active_company_ids()
+    return [(c, tp) for c in company_ids for tp in get_active_talking_product_ids(c)]
+
+
+def _generate_day_report(data, limiter):
+    """Cluster one day's logs and generate its report (on a backfill worker thread, the LLM call under the rate limiter)."""
     clusters, noise = cluster_questions(data)
     logs_text = format_clusters_for_llm(data, clusters, noise)
-    print(logs_text)  # For debugging
+    with limiter.slot():
+        return generate_report(logs_text)
 
-    report = generate_report(logs_text)
-    update_db_reports(data, report, embed_fn, report_type="aggregated", company_id=company_id, talking_product_id=talking_product_id)
 
+def _backfill_product(pool, limiter, date_range, company_id, talking_product_id, force):
+    profiler = RunProfiler("backfill", company_id, talking_product_id, date_range)
 
+    # The whole range in one fetch, split into days locally
+    with profiler.stage("fetch") as stage:
+        data = fetch_questions(date_range, talking_product_id=talking_product_id, company_id=company_id)
+        existing = set() if force else get_report_dates(talking_product_id, date_range)
+        days = {day: day_data for day, day_data in split_logs_by_day(data["logs"] if data else []).items() if day not in existing}
+        stage.update(items=data["n_logs"] if data else 0, days=len(days), skipped_days=len(existing))
 
-if __name__ == "__main__":
+    if not days:
+        print(f"No days to backfill for talking_product_id={talking_product_id} in {date_range} ({len(existing)} already have a report).")
+        return profiler.finish(status="empty")
+
+    logs = [log for day_data in days.values() for log in day_data["logs"]]
+    with profiler.stage("embed", items=len(logs)):
+        add_question_embeddings({"logs": logs})  # One batched pass for all days
+    with profiler.stage("chroma_upsert", items=len(logs)):
+        update_db_interactions({"date": f"{date_range[0]} → {date_range[1]}", "logs": logs}, company_id, talking_product_id, bump_version=False)
+
+    reports, failed = [], []
+    with profiler.stage("generate", items=len(days)) as stage:
+        futures = {pool.submit(_generate_day_report, day_data, limiter): day for day, day_data in days.items()}
+        for future in as_completed(futures):
+            day = futures[future]
+            try:
+                reports.append((days[day], future.result(), company_id, talking_product_id))
+            except Exception as e:
+                failed.append(day)
+                print(f"⚠️ Backfill failed for {talking_product_id} on {day}: {e}")
+        stage["failed_days"] = sorted(failed)
+
+    with profiler.stage("save", items=len(reports)) as stage:
+        saved = update_db_reports_bulk(sorted(reports, key=lambda item: item[0]["date"]), report_type="daily")
+        stage["saved"] = saved
+    if saved < len(reports):
+        print(f"⚠️ Backfill for {talking_product_id}: only {saved}/{len(reports)} generated reports were saved")
+        return profiler.finish(status="failed")
+    return profiler.finish(status="partial" if failed else "ok")
+
+
+def main_backfill(date_range, company_id=None, talking_product_id=None, force=False, workers=None):
+    """
+    Generate daily reports for every day in date_range (inclusive) for one talking product,
+    all active products of a company, or all active products.
+
+    Per product the range is fetched once and split into days locally; days that already have
+    a daily report are skipped unless force=True. The days' clustering and report generation
+    run concurrently on `workers` threads (LLM calls under the shared LLM rate limiter) and each
+    product's reports are saved in one bulk write. Returns one run report per product.
+    """
+    from config import BACKFILL_WORKERS
+
+    products = _select_products(company_id, talking_product_id)
+
+    limiter = get_llm_rate_limiter()
+    run_reports = []
+    with ThreadPoolExecutor(max_workers=BACKFILL_WORKERS if workers is None else workers, thread_name_prefix="backfill") as pool:
+        for product_company_id, product_id in products:
+            run_reports.append(_backfill_product(pool, limiter, date_range, product_company_id, product_id, force))
+
+    if run_reports:
+        print(format_summary_table(run_reports))
+    stats = limiter.stats()
+    print(f"🤖 {stats['calls']} LLM calls, {stats['waited_s']:.1f}s waited for the rate limit")
+    return run_reports
+
+
+def main_incremental_tick(company_id, talking_product_id, day=None):
+    """
+    One intra-day tick for a talking product: fetch only the interactions past the product's high-water mark,
+    embed and index them, assign them to today's clusters, and regenerate today's daily report only when the
+    cluster composition changed meaningfully (the nightly run later replaces it with the full day's report).
+    """
+    day = day or datetime.today().date().isoformat()
+    profiler = RunProfiler("incremental", company_id, talking_product_id, (day, day))
+    store = get_incremental_store()
+    state = store.load(talking_product_id, day)
+
+    with profiler.stage("fetch") as stage:
+        rows = fetch_interactions_since(talking_product_id, day, state.fetch_after())
+        logs = state.new_logs(interaction_rows_to_logs(rows))
+        stage.update(items=len(logs), rows_read=len(rows), high_water=state.high_water)
+    if not logs:
+        return profiler.finish(status="empty", verbose=False)
+
+    with profiler.stage("embed", items=len(logs)):
+        add_question_embeddings({"logs": logs})
+    with profiler.stage("chroma_upsert", items=len(logs)):
+        update_db_interactions({"date": day, "logs": logs}, company_id, talking_product_id)
+    with profiler.stage("cluster", items=len(logs)) as stage:
+        mode = state.add(logs)
+        stage.update(mode=mode, n_logs=len(state.logs))
+
+    # A full re-clustering means the day at least doubled since the last one: always worth a new report
+    if mode == "clustered" or state.changed_meaningfully():
+        data = state.data()
+        clusters, noise = state.clusters()
+        with profiler.stage("format") as stage:
+            logs_text = format_clusters_for_llm(data, clusters, noise)
+            stage["items"] = len(logs_text)
+        with profiler.stage("llm") as stage:
+            report = generate_report(logs_text)
+            stage["items"] = len(report.topics)
+        with profiler.stage("save", items=1):
+            saved = update_db_reports(data, report, embed_texts, company_id=company_id, talking_product_id=talking_product_id)
+        if saved:
+            state.mark_reported()  # Otherwise the next tick still sees the change and regenerates the report
+        status = "ok" if saved else "failed"
+    else:
+        status = "assigned"  # New logs indexed and assigned; the report is still representative
+    store.save(state)
+    return profiler.finish(status=status)
+
+
+def main_incremental(company_id=None, talking_product_id=None):
+    """Incremental tick for one talking product, a company's active products or all active products (run every 15 minutes)."""
+    products = _select_products(company_id, talking_product_id)
+
+    run_reports = [main_incremental_tick(c, tp) for c, tp in products]
+    if run_reports:
+        print(format_summary_table(run_reports))
+    return run_reports
+
+
+def _nightly_product(yesterday, company_id, talking_product_id, ledger, run_key, resume, daily=True):
+    """The nightly reports of one talking product: daily (unless already run by the pipeline), plus weekly/monthly at the end of a week/month."""
+    run_reports = []
+    date_range = (yesterday.date(), yesterday.date())
+    if daily:
+        run_reports.append(main_daily(date_range, company_id, talking_product_id, ledger, run_key, resume))
+
+    # Weekly aggregation
+    if yesterday.weekday() == 6:  # If yesterday was Sunday (Monday=0, Sunday=6)
+        one_week_ago = yesterday.date() - timedelta(days=6)
+        date_range = (one_week_ago, yesterday.date())
+        run_reports.append(main_aggregate(date_range, report_type="weekly", talking_product_id=talking_product_id, ledger=ledger, run_key=run_key, resume=resume))
+
+    # Monthly aggregation
+    last_day = calendar.monthrange(yesterday.year, yesterday.month)[1]  # Get the last day of the current month
+    if yesterday.day == last_day:  # If yesterday was the end of the month
+        first_day_this_month = yesterday.replace(day=1)
+        date_range = (first_day_this_month.date(), yesterday.date())
+        run_reports.append(main_aggregate(date_range, report_type="monthly", talking_product_id=talking_product_id, ledger=ledger, run_key=run_key, resume=resume))
+    return run_reports
+
+
+def main_nightly(shard=None):
+    """
+    Daily reports (plus weekly/monthly on period ends) for all active talking products, CSV logs and manual aggregation.
+
+    shard=(i, N) processes only this worker's share of the talking products, split deterministically over N
+    workers and balanced by the products' interaction counts of the day before (see src/partition.py).
+    CSV logs and manual aggregation run on shard 0. Each shard writes a summary to SHARD_SUMMARY_DIR;
+    the last one to finish prints the merged summary of all shards.
+    """
+    t0 = time.perf_counter()
     today = datetime.today()
     yesterday = today - timedelta(days=1)
 
-    # 1. Process daily reports for all active talking products
-    active_company_ids = get_active_company_ids()
-    for company_id in active_company_ids:
-        active_talking_product_ids = get_active_talking_product_ids(company_id)
-        for talking_product_id in active_talking_product_ids:
-            date_range = (yesterday.date(), yesterday.date())
-            main_daily(date_range, company_id, talking_product_id)
-
-            # 1.1. Weekly aggregation
-            if yesterday.weekday() == 6:  # If yesterday was Sunday (Monday=0, Sunday=6)
-                one_week_ago = yesterday.date() - timedelta(days=6)
-                date_range = (one_week_ago, yesterday.date())
-                main_aggregate(date_range, report_type="weekly", talking_product_id=talking_product_id)
-
-            # 1.2. Monthly aggregation
-            last_day = calendar.monthrange(yesterday.year, yesterday.month)[1]  # Get the last day of the current month
-            if yesterday.day == last_day:  # If yesterday was the end of the month
-                first_day_this_month = yesterday.replace(day=1)
-                date_range = (first_day_this_month.date(), yesterday.date())
-                main_aggregate(date_range, report_type="monthly", talking_product_id=talking_product_id)
-
-    # 2. Process CSV logs for all files in the CSV_LOGS_DIR
-    try:
+    run_reports = []  # Collected per-product run reports for the final summary table
+
+    # Units finished earlier in this run (before a crash) or with unchanged input are skipped
+    from config import RUN_LEDGER_ENABLED
+    ledger = get_run_ledger() if RUN_LEDGER_ENABLED else None
+    run_key = f"nightly:{yesterday.date()}"
+    shard_run_key = run_key if shard is None else f"{run_key}:shard{shard[0]}of{shard[1]}"
+    resume = ledger.begin_run(shard_run_key) if ledger is not None else False
+    if resume:
+        print(f"🔁 Resuming {shard_run_key}: units finished before the interruption are skipped")
+
+    # Reports and interactions are written behind the run; opening the spool also retries writes an earlier run left behind
+    from config import WRITE_BEHIND_SPOOL_PATH
+    if WRITE_BEHIND_ENABLED:
+        if shard is not None and not get_write_behind.is_loaded():
+            # One spool per shard, so shards on the same host don't flush each other's writes
+            root, ext = os.path.splitext(WRITE_BEHIND_SPOOL_PATH)
+            get_write_behind.set(WriteBehindQueue(f"{root}.shard{shard[0]}of{shard[1]}{ext}"))
+        get_write_behind()
+
+    # 1. Process daily reports for all active talking products (or this shard's share of them)
+    products = _select_products()
+    weight = None
+    if shard is not None:
+        index, n_shards = shard
+        weights = unit_weights(products, get_daily_counts(yesterday.date() - timedelta(days=1)))
+        products = partition_units(products, weights, n_shards)[index]
+        weight = sum(weights[unit] for unit in products)
+        print(f"🧩 Shard {index}/{n_shards}: {len(products)} talking products, expected weight {weight}")
+    from config import PIPELINE_ENABLED
+    if PIPELINE_ENABLED:
+        # Daily reports overlapped across products; the weekly/monthly aggregates (which re-fetch the range's interactions) run afterwards
+        run_reports += main_daily_pipelined((yesterday.date(), yesterday.date()), products, ledger, shard_run_key, resume)
+    for company_id, talking_product_id in products:
+        run_reports += _nightly_product(yesterday, company_id, talking_product_id, ledger, shard_run_key, resume, daily=not PIPELINE_ENABLED)
+
+    if shard is None or shard[0] == 0:
+        # 2. Process CSV logs for all files in the CSV_LOGS_DIR (in parallel, a failing file doesn't stop the others)
         from config import CSV_LOGS_DIR
-        csv_files = glob.glob(os.path.join(CSV_LOGS_DIR, "*.csv"))
-        for csv_file in csv_files:
-            talking_product_name = os.path.splitext(os.path.basename(csv_file))[0]  # CSV file name must be equal to the corresponding talking product name!
-            talking_product_id, company_id = get_ids(talking_product_name)
-            main_csv(csv_file, company_id, talking_product_id)
-            os.remove(csv_file)  # delete after processing
-    except Exception as e:
-        print(f"Processing failed for {csv_file}: {e}")
+        outcomes = backfill_csv(glob.glob(os.path.join(CSV_LOGS_DIR, "*.csv")))
+        run_reports += [o["report"] for o in outcomes if o.get("report")]
+
+        # 2.1. Manual aggregation
+        from config import MANUAL_AGGREGATION_ENABLED, MANUAL_AGGREGATION_DATE_RANGE, MANUAL_AGGREGATION_COMPANY_NAME
+        if MANUAL_AGGREGATION_ENABLED:
+            company_id = get_company_id(MANUAL_AGGREGATION_COMPANY_NAME)
+            run_reports.append(main_aggregate(MANUAL_AGGREGATION_DATE_RANGE, report_type="aggregated", company_id=company_id, ledger=ledger, run_key=shard_run_key, resume=resume))
+
+    if get_write_behind.is_loaded():
+        get_write_behind().flush()  # The summary (and the other shards) should see the reports stored
+    if ledger is not None:
+        ledger.end_run(shard_run_key)
+    if run_reports:
+        print(format_summary_table(run_reports))
+    if shard is not None:
+        summary = {"units": products, "weight": weight, "wall_s": round(time.perf_counter() - t0, 4), "reports": run_reports}
+        write_shard_summary(run_key, shard[0], shard[1], summary)
+        print_merged_shard_summary(run_key, shard[1])
+    return run_reports
+
+
+def print_merged_shard_summary(run_key, n_shards):
+    """Merged run summary of a sharded nightly, once all N shards wrote theirs. Returns whether it was complete."""
+    summaries = read_shard_summaries(run_key, n_shards)
+    if summaries is None:
+        print(f"🧩 Waiting for the other shards of {run_key} before merging the summary")
+        return False
+    print(f"\n📊 Merged summary of {run_key} ({n_shards} shards)")
+    print(format_summary_table([r for s in summaries for r in s["reports"]]))
+    print(format_shard_table(summaries))
+    return True
+
 
-    # 2.1. Manual aggregation
-    from config import MANUAL_AGGREGATION_ENABLED, MANUAL_AGGREGATION_DATE_RANGE, MANUAL_AGGREGATION_COMPANY_NAME
-    if MANUAL_AGGREGATION_ENABLED:
-        company_id = get_company_id(MANUAL_AGGREGATION_COMPANY_NAME)
-        main_aggregate(MANUAL_AGGREGATION_DATE_RANGE, report_type="aggregated", company_id=company_id)
+def main_migrate_collections(args):
+    from src.sharding import migrate_to_sharded_collections
+    result = migrate_to_sharded_collections(batch_size=args.batch_size, delete_source=args.delete_source)
+    for name, n in sorted(result["copied"].items()):
+        print(f"  {name}: {n}")
+    print(f"✅ Copied {result['total']} documents into {len(result['copied'])} collections ({result['skipped']} skipped)")
 
+
+def main_backfill_csv(args):
+    from config import CSV_LOGS_DIR
+    csv_files = sorted(glob.glob(os.path.join(args.dir or CSV_LOGS_DIR, args.pattern)))
+    outcomes = backfill_csv(csv_files, workers=args.workers, archive_dir=args.archive_dir)
+    return 1 if any(o["status"] == "failed" for o in outcomes) else 0
+
+
+def _resolve_scope(args, parser):
+    """--company / --product names → (company_id, talking_product_id); None for an omitted filter."""
+    from src.get.tenants import get_tenant_directory
+
+    company_id = talking_product_id = None
+    if args.company:
+        company_id = get_tenant_directory().company_id(args.company)
+        if company_id is None:
+            parser.error(f"Unknown company '{args.company}'")
+    if args.product:
+        talking_product_id, product_company_id = get_tenant_directory().ids(args.product)
+        if talking_product_id is None or (company_id is not None and product_company_id != company_id):
+            parser.error(f"Unknown talking product '{args.product}'" + (f" for company '{args.company}'" if company_id else ""))
+        company_id = product_company_id
+    return company_id, talking_product_id
+
+
+def main_backfill_daily(args, parser):
+    if args.end < args.start:
+        parser.error("--end is before --start")
+    company_id, talking_product_id = _resolve_scope(args, parser)
+    run_reports = main_backfill((args.start, args.end), company_id, talking_product_id, force=args.force, workers=args.workers)
+    return 1 if any(r["status"] in ("partial", "failed") for r in run_reports) else 0
+
+
+def main_cli(argv=None):
+    """`python main.py` runs the nightly pipeline; subcommands run maintenance tasks. Returns the exit code."""
+    import argparse
+    from config import CHROMA_MIGRATION_BATCH_SIZE
+
+    parser = argparse.ArgumentParser(description="Digiole automatic reporting")
+    commands = parser.add_subparsers(dest="command")
+    nightly = commands.add_parser("nightly", help="Daily/weekly/monthly reports, CSV logs and manual aggregation (default)")
+    nightly.add_argument("--shard", type=parse_shard, default=None, help="i/N: process only shard i (0-based) of N, balanced by interaction counts")
+    merge = commands.add_parser("merge-shards", help="Print the merged summary of a sharded nightly run")
+    merge.add_argument("--date", type=date.fromisoformat, default=None, help="Reported day (default: yesterday)")
+    merge.add_argument("--shards", type=int, required=True, help="N of the --shard i/N runs")
+    migrate = commands.add_parser("migrate-collections", help="Copy the shared Chroma collection into per-company, per-doc_type collections")
+    migrate.add_argument("--batch-size", type=int, default=CHROMA_MIGRATION_BATCH_SIZE)
+    migrate.add_argument("--delete-source", action="store_true", help="Delete the shared collection once every document is copied and verified")
+    backfill = commands.add_parser("backfill", help="Daily reports for a range of past days")
+    backfill.add_argument("--start", type=date.fromisoformat, required=True, help="First day (YYYY-MM-DD)")
+    backfill.add_argument("--end", type=date.fromisoformat, required=True, help="Last day (YYYY-MM-DD), inclusive")
+    backfill.add_argument("--company", help="Only this company's active talking products (name)")
+    backfill.add_argument("--product", help="Only this talking product (name)")
+    backfill.add_argument("--force", action="store_true", help="Regenerate days that already have a daily report")
+    backfill.add_argument("--workers", type=int, default=None, help="Days processed concurrently (default: BACKFILL_WORKERS)")
+    incremental = commands.add_parser("incremental", help="Intra-day tick: index new interactions, refresh today's reports that changed (run every 15 minutes)")
+    incremental.add_argument("--company", help="Only this company's active talking products (name)")
+    incremental.add_argument("--product", help="Only this talking product (name)")
+    csv_backfill = commands.add_parser("backfill-csv", help="Process many CSV exports in parallel (file name = talking product name)")
+    csv_backfill.add_argument("--dir", help="Directory with the CSV files (default: CSV_LOGS_DIR)")
+    csv_backfill.add_argument("--pattern", default="*.csv")
+    csv_backfill.add_argument("--workers", type=int, default=None, help="Parallel worker processes (default: CSV_BACKFILL_WORKERS)")
+    csv_backfill.add_argument("--archive-dir", default=None, help="Move processed files here instead of deleting them (default: CSV_ARCHIVE_DIR)")
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate-collections":
+        return main_migrate_collections(args)
+    if args.command == "backfill":
+        return main_backfill_daily(args, parser)
+    if args.command == "merge-shards":
+        day = args.date or (datetime.today() - timedelta(days=1)).date()
+        return 0 if print_merged_shard_summary(f"nightly:{day}", args.shards) else 1
+    if args.command == "incremental":
+        main_incremental(*_resolve_scope(args, parser))
+        return 0
+    if args.command == "backfill-csv":
+        return main_backfill_csv(args)
+    run_reports = main_nightly(shard=getattr(args, "shard", None))
+    return 1 if any(r["status"] == "failed" for r in run_reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,252 @@
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    DATA_VERSION_TTL_SECONDS, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES,
+    SQL_RESULT_CACHE_ENABLED, SQL_RESULT_CACHE_MAX_ENTRIES, SQL_RESULT_CACHE_MAX_BYTES,
+)
+from .get.data import get_data_version, execute_readonly_sql
+from .lazy import lazy
+from .tracing import trace_stage
+
+
+class DataVersionCache:
+    """
+    In-process view of the per-company data versions (see store.bump_data_version).
+    Versions are re-read from Supabase at most every ttl_seconds per company, so the
+    backend notices nightly writes within that window without a round trip per request.
+    """
+
+    def __init__(self, ttl_seconds: float = DATA_VERSION_TTL_SECONDS, fetch=get_data_version):
+        self.ttl_seconds = ttl_seconds
+        self.fetch = fetch
+        self._versions: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, company_id: str) -> int:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._versions.get(company_id)
+        if cached and now - cached[1] < self.ttl_seconds:
+            return cached[0]
+        version = self.fetch(company_id)
+        with self._lock:
+            self._versions[company_id] = (version, now)
+        return version
+
+    def invalidate(self, company_id: Optional[str] = None):
+        """Forget cached versions so the next get() re-reads them."""
+        with self._lock:
+            if company_id is None:
+                self._versions.clear()
+            else:
+                self._versions.pop(company_id, None)
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed on question-embedding similarity within a scope
+    (company_id, talking_product_id, date_range). A cached answer is returned when a new
+    question's cosine similarity to a cached one is >= threshold AND the company's data
+    version is unchanged since the answer was generated. Embeddings must be normalized.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._scopes: Dict[tuple, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_s = 0.0
+
+    @staticmethod
+    def scope(company_id: str, talking_product_id: Optional[str] = None, date_range=None) -> tuple:
+        if date_range:
+            date_range = tuple(d.isoformat() if hasattr(d, "isoformat") else str(d) for d in date_range)
+        return (company_id, talking_product_id, date_range)
+
+    def lookup(self, scope: tuple, embedding, version: int) -> Optional[Dict[str, Any]]:
+        """Best matching entry above the threshold, or None."""
+        t0 = time.perf_counter()
+        with self._lock:
+            bucket = self._scopes.get(scope)
+            if bucket is not None and bucket["version"] != version:
+                del self._scopes[scope]  # Data changed since these answers were generated
+                bucket = None
+            if not bucket or not bucket["entries"]:
+                self.misses += 1
+                return None
+
+            sims = bucket["matrix"] @ np.asarray(embedding, dtype=np.float32)
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = bucket["entries"][best]
+            entry["hits"] += 1
+            entry["last_hit"] = time.monotonic()
+            self.hits += 1
+            self.saved_s += max(entry["latency_s"] - (time.perf_counter() - t0), 0)
+            return {**entry, "similarity": float(sims[best])}
+
+    def store(self, scope: tuple, question: str, embedding, answer: str, version: int, latency_s: float):
+        vector = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            bucket = self._scopes.get(scope)
+            if bucket is None or bucket["version"] != version:
+                bucket = {"version": version, "entries": [], "vectors": []}
+                self._scopes[scope] = bucket
+            if len(bucket["entries"]) >= self.max_entries:
+                # Evict the least recently used answer
+                oldest = min(range(len(bucket["entries"])), key=lambda i: bucket["entries"][i]["last_hit"])
+                del bucket["entries"][oldest]
+                del bucket["vectors"][oldest]
+            bucket["entries"].append({
+                "question": question,
+                "answer": answer,
+                "latency_s": latency_s,
+                "hits": 0,
+                "last_hit": time.monotonic(),
+            })
+            bucket["vectors"].append(vector)
+            bucket["matrix"] = np.stack(bucket["vectors"])
+
+    def invalidate(self, company_id: Optional[str] = None):
+        """Drop all cached answers, or only those of one company."""
+        with self._lock:
+            for scope in list(self._scopes):
+                if company_id is None or scope[0] == company_id:
+                    del self._scopes[scope]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "scopes": len(self._scopes),
+            "entries": sum(len(b["entries"]) for b in self._scopes.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_latency_s": round(self.saved_s, 3),
+        }
+
+
+_SQL_LITERAL_RE = re.compile(r"('(?:[^']|'')*')")
+
+
+def normalize_sql(sql: str) -> str:
+    """Cache key form of a query: whitespace collapsed, trailing ';' dropped, lowercased outside string literals."""
+    parts = _SQL_LITERAL_RE.split(sql.strip().rstrip(";").strip())
+    return "".join(p if i % 2 else re.sub(r"\s+", " ", p.lower()) for i, p in enumerate(parts))
+
+
+class SqlResultCache:
+    """
+    Rows returned by execute_readonly_sql, keyed on (company_id, normalized SQL) and tagged
+    with the company's data version; an entry from an older version is never served.
+    LRU-bounded by entry count and by the total (JSON) size of the cached rows.
+    Concurrent misses for the same key share one RPC call.
+    """
+
+    def __init__(self, max_entries: int = SQL_RESULT_CACHE_MAX_ENTRIES, max_bytes: int = SQL_RESULT_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _evict(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= entry["bytes"]
+
+    def get_or_run(self, company_id: str, sql: str, version: int, run=execute_readonly_sql) -> List[Dict[str, Any]]:
+        key = (company_id, normalize_sql(sql))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["version"] != version:
+                self._evict(key)  # Data changed since these rows were read
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["rows"]
+            self.misses += 1
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            rows = run(sql)
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        size = len(json.dumps(rows, default=str))
+        with self._lock:
+            del self._inflight[key]
+            if size <= self.max_bytes // 10:  # A single huge result should not flush the cache
+                if key in self._entries:
+                    self._evict(key)
+                self._entries[key] = {"rows": rows, "version": version, "bytes": size}
+                self.bytes += size
+                while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                    self._evict(next(iter(self._entries)))
+                    self.evictions += 1
+        future.set_result(rows)
+        return rows
+
+    def invalidate(self, company_id: Optional[str] = None):
+        """Drop all cached results, or only those of one company."""
+        with self._lock:
+            for key in list(self._entries):
+                if company_id is None or key[0] == company_id:
+                    self._evict(key)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Shared by the backend handlers and the prompt helpers
+get_data_versions = lazy(DataVersionCache)
+get_sql_result_cache = lazy(SqlResultCache)
+
+
+def cached_readonly_sql(sql: str, company_id: str) -> List[Dict[str, Any]]:
+    """execute_readonly_sql through the shared result cache, valid while the company's data version is unchanged."""
+    if not SQL_RESULT_CACHE_ENABLED:
+        with trace_stage("sql_execution"):
+            return execute_readonly_sql(sql)
+    with trace_stage("data_version"):
+        version = get_data_versions().get(company_id)
+    with trace_stage("sql_execution"):
+        return get_sql_result_cache().get_or_run(company_id, sql, version)
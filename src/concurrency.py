@@ -0,0 +1,120 @@
+import time
+import asyncio
+import functools
+import threading
+import contextvars
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+from config import BLOCKING_IO_WORKERS, LLM_RATE_LIMIT_PER_MINUTE, LLM_MAX_CONCURRENCY
+from .lazy import lazy
+from .tracing import trace_stage
+
+
+@lazy
+def get_blocking_executor() -> ThreadPoolExecutor:
+    """Shared pool for blocking work called from async code (Supabase/Chroma clients, embedding)."""
+    return ThreadPoolExecutor(max_workers=BLOCKING_IO_WORKERS, thread_name_prefix="blocking")
+
+
+@lazy
+def get_fanout_executor() -> ThreadPoolExecutor:
+    """
+    Pool for parallel sub-calls made from inside blocking work (e.g. one Supabase page per
+    time window). Separate from the blocking pool, so a saturated blocking pool cannot deadlock on it.
+    """
+    return ThreadPoolExecutor(max_workers=BLOCKING_IO_WORKERS, thread_name_prefix="fanout")
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    Run a blocking function on the shared pool without blocking the event loop.
+    The caller's context variables (e.g. the request trace) are visible inside fn.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(get_blocking_executor(), functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+class TenantLimiter:
+    """
+    Bound the number of concurrent requests per tenant (company_id), so one busy
+    dashboard cannot take all workers. Callers over the limit wait for a free slot.
+    A tenant's semaphore and counters are dropped once it has no request in flight or
+    waiting, so ids sent by clients don't accumulate.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self._semaphores = defaultdict(lambda: asyncio.Semaphore(self.max_concurrency))
+        self.in_flight = defaultdict(int)
+        self.waiting = defaultdict(int)
+
+    def _drop_if_idle(self, tenant: str):
+        # No await between the counter updates and this check: single event loop, so nothing interleaves
+        if not self.in_flight.get(tenant) and not self.waiting.get(tenant):
+            self._semaphores.pop(tenant, None)
+            self.in_flight.pop(tenant, None)
+            self.waiting.pop(tenant, None)
+
+    @asynccontextmanager
+    async def slot(self, tenant: str):
+        semaphore = self._semaphores[tenant]
+        self.waiting[tenant] += 1
+        try:
+            with trace_stage("tenant_queue"):
+                await semaphore.acquire()
+        except BaseException:
+            self.waiting[tenant] -= 1
+            self._drop_if_idle(tenant)  # E.g. cancelled by the request timeout while queued
+            raise
+        self.waiting[tenant] -= 1
+        self.in_flight[tenant] += 1
+        try:
+            yield
+        finally:
+            self.in_flight[tenant] -= 1
+            semaphore.release()
+            self._drop_if_idle(tenant)
+
+
+class RateLimiter:
+    """
+    Thread-safe limit for calls to a rate-limited API (the LLM): at most max_concurrency
+    calls in flight, and call starts spaced at least 60 / rate_per_minute seconds apart
+    (rate_per_minute=0: no rate limit). Callers block until they get a slot.
+    """
+
+    def __init__(self, rate_per_minute: float = LLM_RATE_LIMIT_PER_MINUTE, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute else 0.0
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+        self.calls = 0
+        self.waited_s = 0.0
+
+    @contextmanager
+    def slot(self):
+        t0 = time.monotonic()
+        self._semaphore.acquire()
+        try:
+            with self._lock:
+                start = max(time.monotonic(), self._next_start)
+                self._next_start = start + self.interval
+            delay = start - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            with self._lock:
+                self.calls += 1
+                self.waited_s += time.monotonic() - t0
+            yield
+        finally:
+            self._semaphore.release()
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "waited_s": round(self.waited_s, 3)}
+
+
+get_llm_rate_limiter = lazy(RateLimiter)
@@ -0,0 +1,181 @@
+import json
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, List, Tuple
+
+from json2markdown import convert_json_to_markdown_document as json2md
+
+from config import MAX_CONTEXT_CHARS, DIRECT_CONTEXT_PAGE_SIZE, DIRECT_CONTEXT_TIME_SLICES, DIRECT_CONTEXT_OVERSAMPLE, DIRECT_CONTEXT_LOW_MATCH, DIRECT_CONTEXT_LOW_MATCH_SHARE
+from .get.data import iter_rpc_pages, get_stored_report
+from .utils import rows_to_context
+from .concurrency import get_fanout_executor
+from .tracing import trace_stage
+
+
+_HEADER_RESERVE = 300  # Characters kept free for the sample header line
+
+
+def _row_bytes(row: Dict[str, Any]) -> int:
+    """Approximate JSON payload size of a fetched row: question and answer plus ~150 bytes of fixed-size fields."""
+    return len(row.get("question") or "") + len(row.get("answer") or "") + 150
+
+
+def _row_chars(row: Dict[str, Any]) -> int:
+    """Approximate length of the row as rendered by rows_to_context (the field labels and scalars add ~90 chars)."""
+    return len(row["question"]) + len(row["answer"]) + 90
+
+
+def _report_context(report_type: str, row: Dict[str, Any], budget_chars: int) -> str:
+    header = (
+        f"Stored {report_type} report for {row['date']}: n_logs={row.get('n_logs')}, "
+        f"average_match={row.get('average_match')}, complete_misses_rate={row.get('complete_misses_rate')}"
+    )
+    return f"{header}\n\n{json2md(row['report'])}"[:budget_chars]
+
+
+def _stratified_sample(candidates: Dict[str, Dict[str, Any]], budget_chars: int, low_match: float, low_share: float) -> List[Dict[str, Any]]:
+    """
+    Distinct questions, most asked first, split in a low-match stratum (< low_match) and the rest.
+    The low-match stratum gets low_share of the budget; unused budget goes to the other stratum.
+    """
+    low = sorted((c for c in candidates.values() if c["match_score"] < low_match), key=lambda c: -c["n_asked"])
+    rest = sorted((c for c in candidates.values() if c["match_score"] >= low_match), key=lambda c: -c["n_asked"])
+
+    picked, used = [], 0
+    for stratum, limit in ((low, budget_chars * low_share), (rest, budget_chars)):
+        for row in stratum:
+            size = _row_chars(row)
+            if used + size > limit:
+                break
+            picked.append(row)
+            used += size
+    picked.sort(key=lambda r: (r["date"], r["time"]))
+    return picked
+
+
+def _time_slices(date_range) -> List[Tuple[str | None, str | None]]:
+    """Split the range in up to DIRECT_CONTEXT_TIME_SLICES consecutive windows (one window without a range)."""
+    if not date_range:
+        return [(None, None)]
+    start, end = (date.fromisoformat(str(d)) for d in date_range)
+    days = (end - start).days + 1
+    n = max(min(days, DIRECT_CONTEXT_TIME_SLICES), 1)
+    bounds = [start + timedelta(days=days * i // n) for i in range(n + 1)]
+    return [(bounds[i].isoformat(), (bounds[i + 1] - timedelta(days=1)).isoformat()) for i in range(n)]
+
+
+def _rpc_params(company_id: str, talking_product_id: str | None, start_date: str | None, end_date: str | None) -> Dict[str, Any]:
+    return {
+        "_talking_product_id": talking_product_id,
+        "_company_id": company_id,
+        "_start_date": start_date,
+        "_end_date": end_date,
+    }
+
+
+def _first_page(company_id: str, talking_product_id: str | None, date_range) -> List[Dict[str, Any]]:
+    start_date, end_date = (None, None)
+    if date_range:
+        start_date, end_date = (date.fromisoformat(str(d)).isoformat() for d in date_range)
+    params = _rpc_params(company_id, talking_product_id, start_date, end_date)
+    return next(iter_rpc_pages("fetch_interactions_filtered", params, batch_size=DIRECT_CONTEXT_PAGE_SIZE), [])
+
+
+def _round_robin_pages(company_id: str, talking_product_id: str | None, date_range) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Rounds of interactions with one page from each time window, so a reader that stops
+    early still sees the whole range instead of only its first day.
+    """
+    slices = _time_slices(date_range)
+    batch_size = max(DIRECT_CONTEXT_PAGE_SIZE // len(slices), 50)
+    streams = [
+        iter_rpc_pages("fetch_interactions_filtered", _rpc_params(company_id, talking_product_id, start_date, end_date), batch_size=batch_size)
+        for start_date, end_date in slices
+    ]
+    while streams:
+        # The windows are independent, so each round's pages are fetched in parallel
+        pages = list(get_fanout_executor().map(lambda stream: next(stream, None), streams))
+        streams = [stream for stream, page in zip(streams, pages) if page is not None]
+        batch = [r for page in pages if page for r in page]
+        if batch:
+            yield batch
+
+
+@trace_stage("context_fetch")
+def build_direct_context(company_id: str, talking_product_id: str | None, date_range, budget_chars: int = MAX_CONTEXT_CHARS) -> Tuple[str, Dict[str, Any]]:
+    """
+    Context for answer_directly within budget_chars.
+
+    1) A stored report covering exactly the range (the nightly cluster summary) is used as-is.
+    2) Otherwise the interactions are used if the range fits in one page, or else streamed in
+       rounds over time windows; rows are deduplicated by question and reading stops once the
+       distinct questions fill DIRECT_CONTEXT_OVERSAMPLE x the budget. A sample stratified by
+       low match score is rendered.
+
+    Returns (context, stats) where stats reports bytes fetched vs used.
+    """
+    stats = {"source": "sample", "bytes_fetched": 0, "bytes_used": 0, "rows_scanned": 0, "rows_used": 0}
+
+    if talking_product_id is not None and date_range:
+        stored = get_stored_report(talking_product_id, date_range)
+        if stored:
+            report_type, row = stored
+            context = _report_context(report_type, row, budget_chars)
+            stats.update(source=f"{report_type}_report", bytes_fetched=len(json.dumps(row, default=str)), bytes_used=len(context.encode("utf-8")), n_logs=row.get("n_logs"))
+            _log_stats(stats)
+            return context, stats
+
+    # No stored report: probe one page over the whole range, most ranges fit in it
+    first_page = _first_page(company_id, talking_product_id, date_range)
+    if len(first_page) < DIRECT_CONTEXT_PAGE_SIZE:
+        batches = [first_page]  # The whole range fits in one page
+    else:
+        # Too many rows: sample over time windows instead (the probe rows only cover the start of the range)
+        stats["bytes_fetched"] += sum(_row_bytes(r) for r in first_page)
+        batches = _round_robin_pages(company_id, talking_product_id, date_range)
+
+    candidates: Dict[str, Dict[str, Any]] = {}
+    candidate_chars = 0
+    target_chars = budget_chars * DIRECT_CONTEXT_OVERSAMPLE
+    for batch in batches:
+        for r in batch:
+            stats["rows_scanned"] += 1
+            stats["bytes_fetched"] += _row_bytes(r)
+            key = " ".join(str(r["question"]).lower().split())
+            seen = candidates.get(key)
+            if seen is not None:
+                seen["n_asked"] += 1
+                seen["match_score"] = min(seen["match_score"], float(r.get("match_score", 0)))
+                continue
+            row = {
+                "date": r["date"],
+                "time": r["interaction_time"],
+                "question": r["question"],
+                "answer": r["answer"],
+                "match_score": float(r.get("match_score", 0)),
+                "n_asked": 1,
+            }
+            candidates[key] = row
+            candidate_chars += _row_chars(row)
+        if candidate_chars >= target_chars:
+            stats["truncated"] = True
+            break
+
+    rows = _stratified_sample(candidates, budget_chars - _HEADER_RESERVE, DIRECT_CONTEXT_LOW_MATCH, DIRECT_CONTEXT_LOW_MATCH_SHARE)
+    context = rows_to_context(rows)
+    if rows:
+        scope = "at least " if stats.get("truncated") else ""
+        context = (
+            f"Sample of {len(rows)} distinct questions out of {scope}{stats['rows_scanned']} interactions "
+            f"(questions with match_score < {DIRECT_CONTEXT_LOW_MATCH:g} are oversampled; n_asked = times asked in the scanned rows)\n"
+            + context
+        )
+    stats.update(rows_used=len(rows), distinct_questions=len(candidates), bytes_used=len(context.encode("utf-8")))
+    _log_stats(stats)
+    return context, stats
+
+
+def _log_stats(stats: Dict[str, Any]):
+    print(
+        f"📦 Direct context ({stats['source']}): fetched {stats['bytes_fetched'] / 1024:.1f} KB, "
+        f"used {stats['bytes_used'] / 1024:.1f} KB ({stats['rows_used']}/{stats['rows_scanned']} rows)"
+    )
@@ -1,11 +1,130 @@
+import re
+import time
+import queue
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+from config import QUERY_EMBED_CACHE_SIZE, QUERY_EMBED_MAX_BATCH, QUERY_EMBED_BATCH_WAIT_MS, EMBED_BATCH_SIZE
+from .lazy import lazy
 from .get.models import get_embed_model
-embed_model = get_embed_model()  # load once at import time
+
+# The model (~2GB for bge-m3) is loaded on the first embed call, not at import time
+get_shared_embed_model = lazy(get_embed_model)
 
 def embed_fn(text):
-    return embed_model.encode(text, normalize_embeddings=True).tolist()  # returns list of vectors
+    return get_shared_embed_model().encode(text, normalize_embeddings=True).tolist()  # returns list of vectors
+
+def embed_texts(texts, batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+    """Normalized embeddings of many texts as one float32 matrix (one batched encode call)."""
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.asarray(get_shared_embed_model().encode(list(texts), normalize_embeddings=True, batch_size=batch_size), dtype=np.float32)
 
 def add_question_embeddings(data):
-    """Embed all questions in the data dict in-place."""
-    for log in data["logs"]:
-        log["embedding"] = embed_fn(log["question"])
+    """Embed all questions in the data dict in-place (float32 vectors, encoded in batches)."""
+    vectors = embed_texts([log["question"] for log in data["logs"]])
+    for log, vector in zip(data["logs"], vectors):
+        log["embedding"] = vector
     return data
+
+
+class QueryEmbedder:
+    """
+    Embedding service for query-time (RAG) embeddings:
+      1) an LRU cache of query vectors, keyed on the whitespace-normalized query;
+      2) a micro-batcher: concurrent cache misses are collected for up to batch_wait_ms
+         and encoded in a single model.encode() call on a background thread.
+    """
+
+    def __init__(self, model=None, cache_size: int = QUERY_EMBED_CACHE_SIZE, max_batch: int = QUERY_EMBED_MAX_BATCH, batch_wait_ms: float = QUERY_EMBED_BATCH_WAIT_MS):
+        self._model = model
+        self.cache_size = cache_size
+        self.max_batch = max_batch
+        self.batch_wait_s = batch_wait_ms / 1000
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self.hits = 0
+        self.misses = 0
+        self.batch_sizes = Counter()
+
+    @property
+    def model(self):
+        return self._model if self._model is not None else get_shared_embed_model()
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return re.sub(r"\s+", " ", text.strip())
+
+    def embed(self, text: str):
+        """Embedding (list of floats) for a single query; blocks until its batch is encoded."""
+        key = self._key(text)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="query-embedder", daemon=True)
+                self._worker.start()
+
+        future = Future()
+        self._queue.put((key, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]  # Block until there is work
+            deadline = time.monotonic() + self.batch_wait_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._encode(batch)
+
+    def _encode(self, batch):
+        texts = list(dict.fromkeys(key for key, _ in batch))  # Identical concurrent queries are encoded once
+        self.batch_sizes[len(texts)] += 1
+        try:
+            vectors = self.model.encode(texts, normalize_embeddings=True, batch_size=len(texts)).tolist()
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        by_text = dict(zip(texts, vectors))
+        with self._lock:
+            for text, vector in by_text.items():
+                self._cache[text] = vector
+                self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        for key, future in batch:
+            future.set_result(by_text[key])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "cache_size": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "batches": sum(self.batch_sizes.values()),
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+        }
+
+
+get_query_embedder = lazy(QueryEmbedder)
+
+def embed_query(text):
+    """Embed a user query through the shared cache + micro-batcher (use embed_fn for documents)."""
+    return get_query_embedder().embed(text)
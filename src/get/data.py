@@ -1,68 +1,39 @@
 
-from config import SUPABASE, COLLECTION, RETRIEVAL_K, READONLY_SQL_RPC
-from typing import List, Dict, Any
-from datetime import datetime
-from src.embed import embed_fn
+from config import get_supabase, RETRIEVAL_K, READONLY_SQL_RPC, DATA_VERSIONS_TABLE, REPORT_TABLES, HYBRID_RETRIEVAL_ENABLED, HYBRID_CANDIDATES, REPORT_VECTOR_CACHE_ENABLED
+from typing import List, Dict, Any, Set
+from datetime import date, datetime, timedelta
+from src.embed import embed_query
+from src.get.tenants import get_tenant_directory
+from src.tracing import trace_stage
+from src.retrieval import get_hybrid_retriever, where_predicate
+from src.vector_cache import get_report_vector_cache
+from src.sharding import collections_for, query_collections
+from src.language import detect_languages
 
 def get_active_company_ids():
     """
     Fetch all active company IDs from the companies table.
     Returns a list of company IDs.
     """
-    res = (
-        SUPABASE.table("companies")
-        .select("id")
-        .eq("active", True)
-        .execute()
-    )
-
-    rows = res.data or []
-    return [r["id"] for r in rows]
+    return get_tenant_directory().active_company_ids()
 
 def get_company_id(name: str):
     """Fetch company id by name, return None if not found."""
-    res = (
-        SUPABASE.table("companies")
-        .select("id")
-        .eq("name", name)
-        .maybe_single()
-        .execute()
-    )
-    return res.data["id"] if res.data else None
+    return get_tenant_directory().company_id(name)
 
 def get_active_talking_product_ids(company_id: str):
     """
     Fetch all active talking products for a given company_id.
     Returns a list of talking product IDs.
     """
-    res = (
-        SUPABASE.table("talking_products")
-        .select("id")
-        .eq("company_id", company_id)
-        .eq("active", True)
-        .execute()
-    )
-
-    rows = res.data or []
-    return [r["id"] for r in rows]
+    return get_tenant_directory().active_talking_product_ids(company_id)
 
 def get_ids(talking_product_name: str):
     """
     Return (talking_product_id, company_id) for a given talking_product_name.
     Returns (None, None) if not found.
     """
-    res = (
-        SUPABASE.table("talking_products")
-        .select("id, company_id")
-        .eq("name", talking_product_name)
-        .maybe_single()
-        .execute()
-    )
-
-    if not res.data:
-        return None, None
-    
-    return res.data["id"], res.data["company_id"]
+    return get_tenant_directory().ids(talking_product_name)
 
 def get_latest_interaction_date(talking_product_id):
     """
@@ -70,7 +41,7 @@ def get_latest_interaction_date(talking_product_id):
     Returns a date object or None.
     """
     res = (
-        SUPABASE.table("interactions")
+        get_supabase().table("interactions")
         .select("date")
         .eq("talking_product_id", talking_product_id)
         .order("date", desc=True)
@@ -84,13 +55,35 @@ def get_latest_interaction_date(talking_product_id):
 
     return datetime.strptime(data[0]["date"], "%Y-%m-%d").date()
 
-def retrieve_context(query: str, company_id: str, talking_product_id: str | None, embed_fn = embed_fn, k: int = RETRIEVAL_K, date=None, start_date=None, end_date=None):
-    q_emb = embed_fn(query)
+def get_data_version(company_id: str) -> int:
+    """
+    Current data version of a company (0 if never bumped).
+    Bumped by store.bump_data_version whenever interactions or reports are stored.
+    """
+    res = (
+        get_supabase().table(DATA_VERSIONS_TABLE)
+        .select("version")
+        .eq("company_id", company_id)
+        .limit(1)
+        .execute()
+    )
+    data = res.data
+    return int(data[0]["version"]) if data else 0
+
+def retrieve_context(query: str, company_id: str, talking_product_id: str | None, embed_fn = embed_query, k: int = RETRIEVAL_K, date=None, start_date=None, end_date=None, doc_type=None, report_type=None):
+    with trace_stage("embedding"):
+        q_emb = embed_fn(query)
 
     clauses = [{"company_id": company_id}]
     if talking_product_id is not None:
         clauses.append({"talking_product_id": talking_product_id})
 
+    if doc_type is not None:
+        clauses.append({"doc_type": doc_type})
+
+    if report_type is not None:
+        clauses.append({"report_type": report_type})
+
     if date is not None:
         clauses.append({"date": date})
 
@@ -103,31 +96,92 @@ def retrieve_context(query: str, company_id: str, talking_product_id: str | None
     else:
         where = {"$and": clauses} # multiple filters → Chroma requires $and
 
-    # TODO: filter by report_type if needed and by doc_type!!!
-
-    res = COLLECTION.query(
-        query_embeddings=[q_emb],
-        n_results=k,
-        where=where,
-        include=["documents", "metadatas", "distances"]
-    )
-
-    docs = res["documents"][0]
-    metas = res["metadatas"][0]
-    dists = res.get("distances", [[None]*len(docs)])[0]
+    n_results = max(k, HYBRID_CANDIDATES) if HYBRID_RETRIEVAL_ENABLED else k
+    dense = None
+    if REPORT_VECTOR_CACHE_ENABLED and doc_type == "report_chunk":
+        # Report chunks are searched in the in-process copy; Chroma is the fallback
+        try:
+            with trace_stage("vector_cache_query"):
+                dense = get_report_vector_cache().query(
+                    company_id, q_emb, n_results,
+                    talking_product_id=talking_product_id, report_type=report_type,
+                    date=date, start_date=start_date, end_date=end_date,
+                )
+        except Exception as e:
+            print(f"⚠️ Local vector cache failed for company {company_id}, querying Chroma: {e}")
+
+    if dense is None:
+        with trace_stage("chroma_query"):
+            dense = query_collections(collections_for(company_id, doc_type), q_emb, n_results, where)
+
+    docs, metas, dists = dense["documents"], dense["metadatas"], dense["distances"]
+
+    if HYBRID_RETRIEVAL_ENABLED:
+        # Fuse the dense candidates with BM25 hits under the same filters (exact codes, names, error ids)
+        predicate = where_predicate(talking_product_id, date, start_date, end_date, doc_type, report_type)
+        hits = get_hybrid_retriever().search(query, company_id, dense, k, predicate)
+    else:
+        hits = [{"document": doc, "meta": meta, "distance": dist} for doc, meta, dist in zip(docs, metas, dists)]
 
     # Build compact context + citations
     context_blocks = []
     citations = []
-    for i, (doc, meta, dist) in enumerate(zip(docs, metas, dists), start=1):
+    for i, hit in enumerate(hits, start=1):
+        meta = hit["meta"]
         tag = meta.get("doc_type", "doc")
         tp = meta.get("talking_product_id", "")
         rk = meta.get("date_key") or meta.get("date")
-        context_blocks.append(f"[{i}] ({tag}, tp={tp}, date={rk})\n{doc}")
-        citations.append({"i": i, "meta": meta, "distance": dist})
+        context_blocks.append(f"[{i}] ({tag}, tp={tp}, date={rk})\n{hit['document']}")
+        citation = {"i": i, "meta": meta, "distance": hit["distance"]}
+        if "score" in hit:
+            citation.update(score=hit["score"], sources=hit["sources"])
+        citations.append(citation)
 
     return "\n\n".join(context_blocks), citations
 
+def interaction_rows_to_logs(rows) -> List[Dict[str, Any]]:
+    """Interaction rows (RPC/table) → log dicts; rows ingested without a language get one (deduplicated, cached, parallel for large batches)."""
+    logs = [
+        {
+            "question": r["question"],
+            "answer": r["answer"],
+            "match_score": float(r.get("match_score", 0)),
+            "date": r["date"],
+            "time": r["interaction_time"],
+            "language": r.get("language"),
+        }
+        for r in rows
+    ]
+    unknown = [log for log in logs if not log["language"]]
+    if unknown:
+        for log, language in zip(unknown, detect_languages([log["question"] for log in unknown])):
+            log["language"] = language
+    return logs
+
+def fetch_interactions_since(talking_product_id: str, day: str, after_time: str | None = None, page_size: int = 1000) -> List[Dict[str, Any]]:
+    """
+    Interaction rows of a talking product on one day with interaction_time > after_time (all of the day for None),
+    ordered by time. Keyset pagination on interaction_time, so only rows past the high-water mark are read.
+    """
+    rows, seen = [], set()
+    cursor, strict = after_time, True
+    while True:
+        query = (
+            get_supabase().table("interactions")
+            .select("id, question, answer, match_score, date, interaction_time, language")
+            .eq("talking_product_id", talking_product_id)
+            .eq("date", day)
+        )
+        if cursor is not None:
+            query = query.gt("interaction_time", cursor) if strict else query.gte("interaction_time", cursor)
+        page = query.order("interaction_time").limit(page_size).execute().data or []
+        new = [r for r in page if r["id"] not in seen]
+        rows += new
+        seen.update(r["id"] for r in new)
+        if len(page) < page_size or not new:
+            return rows
+        cursor, strict = page[-1]["interaction_time"], False  # gte + seen ids: rows sharing the boundary time aren't lost
+
 def fetch_questions(date_range, talking_product_id=None, company_id=None):
     """
     Fetch questions (and compute summary statistics) from Supabase within optional date range based on:
@@ -161,22 +215,9 @@ def fetch_questions(date_range, talking_product_id=None, company_id=None):
     # Call RPC
     try:
         rows = rpc_paginate("fetch_interactions_filtered", params, batch_size=1000)
-        logs, accumulated_match, complete_misses = [], 0.0, 0
-
-        for r in rows:
-            s = float(r.get("match_score", 0))
-
-            logs.append({
-                "question": r["question"],
-                "answer": r["answer"],
-                "match_score": s,
-                "date": r["date"],
-                "time": r["interaction_time"],
-            })
-
-            accumulated_match += s
-            if s == 0:
-                complete_misses += 1
+        logs = interaction_rows_to_logs(rows)
+        accumulated_match = sum(log["match_score"] for log in logs)
+        complete_misses = sum(log["match_score"] == 0 for log in logs)
 
         n_logs = len(logs)
         avg_match = round(accumulated_match / n_logs, 2) if n_logs > 0 else 0
@@ -212,9 +253,8 @@ def fetch_questions(date_range, talking_product_id=None, company_id=None):
             "logs": []
         }
 
-def rpc_paginate(rpc_name, params, batch_size=1000):
-    """Helper to paginate through Supabase RPC calls with _limit and _offset."""
-    all_rows = []
+def iter_rpc_pages(rpc_name, params, batch_size=1000):
+    """Yield the pages of a paginated (_limit/_offset) Supabase RPC one at a time, so callers can stop early."""
     offset = 0
 
     while True:
@@ -222,23 +262,87 @@ def rpc_paginate(rpc_name, params, batch_size=1000):
         chunk_params["_limit"] = batch_size
         chunk_params["_offset"] = offset
 
-        res = SUPABASE.rpc(rpc_name, chunk_params).execute()
+        res = get_supabase().rpc(rpc_name, chunk_params).execute()
         data = res.data or []
 
         if not data:
             break
 
-        all_rows.extend(data)
+        yield data
         offset += batch_size
 
         if len(data) < batch_size:
             break
 
+def rpc_paginate(rpc_name, params, batch_size=1000):
+    """Helper to paginate through Supabase RPC calls with _limit and _offset."""
+    all_rows = []
+    for page in iter_rpc_pages(rpc_name, params, batch_size):
+        all_rows.extend(page)
     return all_rows
 
+def get_stored_report(talking_product_id: str, date_range):
+    """
+    The nightly report covering exactly date_range for a talking product, if one was stored:
+    daily for a single day, weekly for a 7-day range, monthly for a full calendar month.
+    Returns (report_type, row) or None.
+    """
+    start, end = (date.fromisoformat(str(d)) for d in date_range)
+    candidates = []
+    if start == end:
+        candidates.append("daily")
+    if (end - start).days == 6:
+        candidates.append("weekly")
+    if start.day == 1 and end.month == start.month and (end + timedelta(days=1)).day == 1:
+        candidates.append("monthly")
+
+    for report_type in candidates:
+        try:
+            res = (
+                get_supabase().table(REPORT_TABLES[report_type])
+                .select("date, n_logs, average_match, complete_misses, complete_misses_rate, report")
+                .eq("talking_product_id", talking_product_id)
+                .eq("date", start.isoformat())
+                .limit(1)
+                .execute()
+            )
+        except Exception as e:
+            print(f"⚠️ Error reading stored {report_type} report: {e}")
+            continue
+        if res.data and res.data[0].get("report"):
+            return report_type, res.data[0]
+    return None
+
+def get_report_dates(talking_product_id: str, date_range, report_type: str = "daily") -> Set[str]:
+    """Dates (ISO strings) in date_range that already have a stored report of report_type for a talking product (one query)."""
+    start, end = (date.fromisoformat(str(d)).isoformat() for d in date_range)
+    res = (
+        get_supabase().table(REPORT_TABLES[report_type])
+        .select("date")
+        .eq("talking_product_id", talking_product_id)
+        .gte("date", start)
+        .lte("date", end)
+        .execute()
+    )
+    return {str(row["date"])[:10] for row in res.data or []}
+
+def get_daily_counts(day, page_size: int = 1000) -> Dict[str, int]:
+    """n_logs of every talking product's daily report for day (keyset-paginated on talking_product_id)."""
+    counts: Dict[str, int] = {}
+    cursor = None
+    while True:
+        query = get_supabase().table(REPORT_TABLES["daily"]).select("talking_product_id, n_logs").eq("date", str(day))
+        if cursor is not None:
+            query = query.gt("talking_product_id", cursor)
+        page = query.order("talking_product_id").limit(page_size).execute().data or []
+        counts.update((row["talking_product_id"], int(row.get("n_logs") or 0)) for row in page)
+        if len(page) < page_size:
+            return counts
+        cursor = page[-1]["talking_product_id"]
+
 def execute_readonly_sql(sql: str, rpc_name: str = READONLY_SQL_RPC) -> List[Dict[str, Any]]:
     try:
-        res = SUPABASE.rpc(rpc_name, {"query": sql}).execute()
+        res = get_supabase().rpc(rpc_name, {"query": sql}).execute()
     except Exception as e:
         raise RuntimeError(f"SQL execution failed via RPC '{rpc_name}': {e}")
 
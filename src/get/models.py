@@ -1,16 +1,23 @@
-from sentence_transformers import SentenceTransformer
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_ollama import ChatOllama  
-from config import EMBED_MODEL, LLM_MODEL, LLM_API_KEY, FREE_LOCAL_LLM_MODEL
+from config import EMBED_MODEL, RERANKER_MODEL, LLM_MODEL, LLM_API_KEY, FREE_LOCAL_LLM_MODEL
+
+# Model libraries are imported inside the factories: importing them alone takes seconds
+# (torch for sentence-transformers), which every CLI command and the backend would pay otherwise.
 
 
 def get_embed_model(embed_model: str = EMBED_MODEL):
+    from sentence_transformers import SentenceTransformer
     return SentenceTransformer(embed_model)
 
 
+def get_reranker_model(reranker_model: str = RERANKER_MODEL):
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(reranker_model, device="cpu")
+
+
 def get_llm_model(llm_model: str = LLM_MODEL):
     # Placeholder for LLM model retrieval logic
     # Gemini LLM via LangChain
+    from langchain_google_genai import ChatGoogleGenerativeAI
     return ChatGoogleGenerativeAI(
         model=llm_model,
         temperature=0,
@@ -25,6 +32,7 @@ def get_free_local_llm(llm_model: str = FREE_LOCAL_LLM_MODEL):
     Make sure Ollama is running and the model is pulled:
       ollama pull <model>
     """
+    from langchain_ollama import ChatOllama
     return ChatOllama(
         model=llm_model,
         temperature=0.2,
@@ -0,0 +1,125 @@
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import get_supabase, TENANT_DIRECTORY_TTL_SECONDS, TENANT_DIRECTORY_MISS_REFRESH_SECONDS
+from ..lazy import lazy
+
+
+def load_tenants() -> List[Dict[str, Any]]:
+    """
+    All companies with their talking products (ids, names, active flags) in a single query,
+    using the talking_products.company_id foreign key.
+    """
+    res = (
+        get_supabase().table("companies")
+        .select("id, name, active, talking_products(id, name, active)")
+        .execute()
+    )
+    return res.data or []
+
+
+class TenantDirectory:
+    """
+    In-process company -> talking product mapping, so ownership checks and id/name
+    lookups are answered from memory instead of a Supabase round trip each.
+
+    The mapping is reloaded when it is older than ttl_seconds. A lookup that misses
+    (e.g. a product created minutes ago) triggers an early reload, at most once per
+    miss_refresh_seconds. invalidate() forces a reload on the next lookup.
+    """
+
+    def __init__(self, ttl_seconds: float = TENANT_DIRECTORY_TTL_SECONDS, miss_refresh_seconds: float = TENANT_DIRECTORY_MISS_REFRESH_SECONDS, load=load_tenants):
+        self.ttl_seconds = ttl_seconds
+        self.miss_refresh_seconds = miss_refresh_seconds
+        self.load = load
+        self._lock = threading.Lock()
+        self._index = None
+        self._loaded_at = 0.0
+        self.loads = 0
+        self.lookups = 0
+
+    # ----- loading -----
+    @staticmethod
+    def _build_index(companies: List[Dict[str, Any]]) -> Dict[str, Any]:
+        index = {"companies": {}, "company_by_name": {}, "products": {}, "product_by_name": {}}
+        for company in companies:
+            index["companies"][company["id"]] = company
+            index["company_by_name"].setdefault(company["name"], company["id"])
+            for product in company.get("talking_products") or []:
+                product = {**product, "company_id": company["id"]}
+                index["products"][product["id"]] = product
+                index["product_by_name"].setdefault(product["name"], product["id"])
+        return index
+
+    def refresh(self):
+        """Reload the mapping now."""
+        index = self._build_index(self.load())
+        with self._lock:
+            self._index = index
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+        return index
+
+    def invalidate(self):
+        """Drop the mapping so the next lookup reloads it (e.g. after adding or deactivating products)."""
+        with self._lock:
+            self._index = None
+
+    def _current(self) -> Dict[str, Any]:
+        with self._lock:
+            self.lookups += 1
+            index = self._index
+            fresh = index is not None and time.monotonic() - self._loaded_at < self.ttl_seconds
+        return index if fresh else self.refresh()
+
+    def _lookup(self, fn):
+        """fn(index) from the current mapping; reload once and retry if it finds nothing."""
+        result = fn(self._current())
+        if result is None and time.monotonic() - self._loaded_at >= self.miss_refresh_seconds:
+            result = fn(self.refresh())
+        return result
+
+    # ----- lookups -----
+    def active_company_ids(self) -> List[str]:
+        return [c["id"] for c in self._current()["companies"].values() if c.get("active")]
+
+    def company_id(self, name: str) -> Optional[str]:
+        return self._lookup(lambda ix: ix["company_by_name"].get(name))
+
+    def active_talking_product_ids(self, company_id: str) -> List[str]:
+        company = self._lookup(lambda ix: ix["companies"].get(company_id))
+        if company is None:
+            return []
+        return [p["id"] for p in company.get("talking_products") or [] if p.get("active")]
+
+    def ids(self, talking_product_name: str) -> Tuple[Optional[str], Optional[str]]:
+        """(talking_product_id, company_id) for a talking product name, (None, None) if unknown."""
+        def find(ix):
+            product_id = ix["product_by_name"].get(talking_product_name)
+            return (product_id, ix["products"][product_id]["company_id"]) if product_id else None
+        return self._lookup(find) or (None, None)
+
+    def company_of_product(self, talking_product_id: str) -> Optional[str]:
+        product = self._lookup(lambda ix: ix["products"].get(talking_product_id))
+        return product["company_id"] if product else None
+
+    def product_belongs_to_company(self, talking_product_id: str, company_id: str) -> bool:
+        """Whether the talking product is active and owned by the company."""
+        def owned(ix):
+            product = ix["products"].get(talking_product_id)
+            return True if product and product["company_id"] == company_id and product.get("active") else None
+        return bool(self._lookup(owned))
+
+    def stats(self) -> Dict[str, Any]:
+        index = self._index or {"companies": {}, "products": {}}
+        return {
+            "companies": len(index["companies"]),
+            "talking_products": len(index["products"]),
+            "loads": self.loads,
+            "lookups": self.lookups,
+            "age_s": round(time.monotonic() - self._loaded_at, 1) if self._index is not None else None,
+        }
+
+
+get_tenant_directory = lazy(TenantDirectory)
@@ -0,0 +1,190 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    INCREMENTAL_STATE_PATH, INCREMENTAL_LOOKBACK_MINUTES, INCREMENTAL_ASSIGN_MIN_SIMILARITY,
+    INCREMENTAL_RECLUSTER_GROWTH, INCREMENTAL_REPORT_MIN_CHANGE,
+)
+from .lazy import lazy
+from .store import interaction_id
+from .utils import cluster_questions
+
+NOISE = -1
+
+
+class DayState:
+    """
+    Today's incremental state of one talking product: the logs seen so far (with their cluster
+    label and embedding), the high-water mark and the cluster sizes the last report was built from.
+    """
+
+    def __init__(self, talking_product_id: str, day: str):
+        self.talking_product_id = talking_product_id
+        self.day = day
+        self.logs: List[Dict[str, Any]] = []
+        self.labels: List[int] = []
+        self.embeddings: Optional[np.ndarray] = None
+        self.seen_ids = set()
+        self.high_water: Optional[str] = None
+        self.clustered_at = 0  # Number of logs at the last full clustering
+        self.reported_sizes: Optional[Dict[int, int]] = None  # Cluster sizes at the last generated report
+
+    def fetch_after(self) -> Optional[str]:
+        """Fetch cursor: the high-water mark minus the lookback, for rows ingested late with an earlier time."""
+        if self.high_water is None:
+            return None
+        hwm = datetime.strptime(f"{self.day} {self.high_water}", "%Y-%m-%d %H:%M:%S")
+        after = hwm - timedelta(minutes=INCREMENTAL_LOOKBACK_MINUTES)
+        return None if after.date() < hwm.date() else after.strftime("%H:%M:%S")
+
+    def new_logs(self, logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """The logs not seen before (the lookback window re-reads some)."""
+        out = []
+        for log in logs:
+            key = interaction_id(self.talking_product_id, log["date"], log["time"], log["question"])
+            if key not in self.seen_ids:
+                self.seen_ids.add(key)
+                out.append(log)
+        return out
+
+    def clusters(self) -> Tuple[Dict[int, List[int]], List[int]]:
+        clusters: Dict[int, List[int]] = {}
+        noise = []
+        for idx, label in enumerate(self.labels):
+            if label == NOISE:
+                noise.append(idx)
+            else:
+                clusters.setdefault(label, []).append(idx)
+        return clusters, noise
+
+    def sizes(self) -> Dict[int, int]:
+        return {label: len(indices) for label, indices in self.clusters()[0].items()}
+
+    def data(self) -> Dict[str, Any]:
+        """All of today's logs (with embeddings) as a data dict, like fetch_questions + add_question_embeddings."""
+        logs = [{**log, "embedding": self.embeddings[i]} for i, log in enumerate(self.logs)]
+        n_logs = len(logs)
+        complete_misses = sum(log["match_score"] == 0 for log in logs)
+        return {
+            "date": self.day,
+            "n_logs": n_logs,
+            "average_match": round(sum(log["match_score"] for log in logs) / n_logs, 2) if n_logs else 0,
+            "complete_misses": complete_misses,
+            "complete_misses_rate": round(complete_misses / n_logs * 100, 2) if n_logs else 0,
+            "logs": logs,
+        }
+
+    def add(self, logs: List[Dict[str, Any]]) -> str:
+        """
+        Add embedded new logs. They join the nearest existing cluster (cosine >= INCREMENTAL_ASSIGN_MIN_SIMILARITY
+        to its centroid) or become noise; the whole day is re-clustered once it grew by INCREMENTAL_RECLUSTER_GROWTH
+        since the last full clustering. Returns "clustered" or "assigned".
+        """
+        vectors = np.asarray([log.pop("embedding") for log in logs], dtype=np.float32)
+        self.embeddings = vectors if self.embeddings is None else np.vstack([self.embeddings, vectors])
+        self.logs += logs
+        self.high_water = max([self.high_water or ""] + [str(log["time"]) for log in logs])
+
+        if not self.clustered_at or len(self.logs) >= self.clustered_at * INCREMENTAL_RECLUSTER_GROWTH:
+            clusters, _ = cluster_questions({"logs": [{"embedding": e} for e in self.embeddings]})
+            self.labels = [NOISE] * len(self.logs)
+            for label, indices in clusters.items():
+                for i in indices:
+                    self.labels[i] = int(label)
+            self.clustered_at = len(self.logs)
+            return "clustered"
+
+        clusters, _ = self.clusters()
+        labels = list(clusters)
+        if not labels:
+            self.labels += [NOISE] * len(logs)
+            return "assigned"
+        centroids = np.stack([self.embeddings[clusters[label]].mean(axis=0) for label in labels])
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        similarity = vectors @ centroids.T
+        best = similarity.argmax(axis=1)
+        self.labels += [labels[j] if similarity[i, j] >= INCREMENTAL_ASSIGN_MIN_SIMILARITY else NOISE for i, j in enumerate(best)]
+        return "assigned"
+
+    def changed_meaningfully(self) -> bool:
+        """
+        Whether today's report should be regenerated: no report yet, or the share of logs that moved
+        in or out of a cluster (or noise) since the last report is at least INCREMENTAL_REPORT_MIN_CHANGE.
+        """
+        if self.reported_sizes is None:
+            return True
+        now = self.sizes()
+        now[NOISE] = len(self.logs) - sum(now.values())
+        before = dict(self.reported_sizes)
+        before.setdefault(NOISE, 0)
+        delta = sum(abs(now.get(label, 0) - before.get(label, 0)) for label in set(now) | set(before))
+        return delta >= INCREMENTAL_REPORT_MIN_CHANGE * max(sum(before.values()), 1)
+
+    def mark_reported(self):
+        sizes = self.sizes()
+        sizes[NOISE] = len(self.logs) - sum(sizes.values())
+        self.reported_sizes = sizes
+
+    def to_row(self) -> Tuple[str, bytes]:
+        meta = {
+            "logs": self.logs,
+            "labels": self.labels,
+            "seen_ids": sorted(self.seen_ids),
+            "high_water": self.high_water,
+            "clustered_at": self.clustered_at,
+            "reported_sizes": None if self.reported_sizes is None else list(self.reported_sizes.items()),
+            "dim": 0 if self.embeddings is None else self.embeddings.shape[1],
+        }
+        blob = b"" if self.embeddings is None else self.embeddings.astype(np.float32).tobytes()
+        return json.dumps(meta, default=str), blob
+
+    @classmethod
+    def from_row(cls, talking_product_id: str, day: str, meta_json: str, blob: bytes) -> "DayState":
+        meta = json.loads(meta_json)
+        state = cls(talking_product_id, day)
+        state.logs = meta["logs"]
+        state.labels = meta["labels"]
+        state.seen_ids = set(meta["seen_ids"])
+        state.high_water = meta["high_water"]
+        state.clustered_at = meta["clustered_at"]
+        state.reported_sizes = None if meta["reported_sizes"] is None else {int(k): v for k, v in meta["reported_sizes"]}
+        if meta["dim"]:
+            state.embeddings = np.frombuffer(blob, dtype=np.float32).reshape(-1, meta["dim"]).copy()
+        return state
+
+
+class IncrementalStore:
+    """Persistent (sqlite) DayState per talking product; only the current day is kept."""
+
+    def __init__(self, path: str = INCREMENTAL_STATE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS day_state (talking_product_id TEXT PRIMARY KEY, day TEXT NOT NULL, meta TEXT NOT NULL, embeddings BLOB NOT NULL)")
+        self._lock = threading.Lock()
+
+    def load(self, talking_product_id: str, day: str) -> DayState:
+        """The product's state for day (a fresh one on the first tick of a day)."""
+        with self._lock:
+            row = self._conn.execute("SELECT day, meta, embeddings FROM day_state WHERE talking_product_id = ?", (talking_product_id,)).fetchone()
+        if row is None or row[0] != day:
+            return DayState(talking_product_id, day)
+        return DayState.from_row(talking_product_id, day, row[1], row[2])
+
+    def save(self, state: DayState):
+        meta, blob = state.to_row()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO day_state (talking_product_id, day, meta, embeddings) VALUES (?, ?, ?, ?)",
+                (state.talking_product_id, state.day, meta, blob),
+            )
+
+
+get_incremental_store = lazy(IncrementalStore)
@@ -0,0 +1,241 @@
+import re
+import threading
+from datetime import date, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from config import INTENT_ROUTER_THRESHOLD
+from .embed import get_shared_embed_model, embed_query
+from .lazy import lazy
+from .tracing import trace_stage
+from .utils import validate_readonly_sql
+
+
+# ----------------- Canned SQL intents -----------------
+# Every template is scoped to one company (and active talking products) like the LLM SQL prompt requires.
+# {period} is replaced by an optional date filter extracted from the question ("this week", "yesterday", ...).
+
+_FROM_COMPANY = (
+    "FROM interactions JOIN talking_products ON interactions.talking_product_id = talking_products.id "
+    "WHERE talking_products.company_id = '{company_id}' AND talking_products.active = true{period} "
+)
+_MISSES = "SUM(CASE WHEN interactions.match_score = 0 THEN 1 ELSE 0 END)"
+
+INTENTS = [
+    {
+        "name": "top_topics",
+        "examples": [
+            "What are the top topics?",
+            "What are the most asked topics this week?",
+            "Which questions are asked most often?",
+            "Which topic is most frequently asked?",
+            "What do visitors ask about the most?",
+            "Most popular questions",
+            "Wat zijn de meest gestelde vragen?",
+        ],
+        "sql": (
+            "SELECT interactions.question, COUNT(*) AS n_asked, ROUND(AVG(interactions.match_score)::numeric, 1) AS average_match "
+            + _FROM_COMPANY
+            + "GROUP BY interactions.question ORDER BY n_asked DESC, interactions.question LIMIT 50"
+        ),
+    },
+    {
+        "name": "average_match_over_time",
+        "examples": [
+            "What is the average match score over time?",
+            "How did the average match evolve?",
+            "Show the match score trend per day",
+            "What was the average match score this month?",
+            "Is the answer quality improving over time?",
+            "Hoe evolueert de gemiddelde match score?",
+        ],
+        "sql": (
+            "SELECT interactions.date, COUNT(*) AS n_logs, ROUND(AVG(interactions.match_score)::numeric, 2) AS average_match "
+            + _FROM_COMPANY
+            + "GROUP BY interactions.date ORDER BY interactions.date LIMIT 400"
+        ),
+    },
+    {
+        "name": "miss_rate",
+        "examples": [
+            "What is the miss rate?",
+            "How many questions were complete misses?",
+            "How often could the talking product not answer?",
+            "What percentage of questions got no answer?",
+            "Which product has the most unanswered questions?",
+            "Hoeveel vragen konden niet beantwoord worden?",
+        ],
+        "sql": (
+            f"SELECT talking_products.name, COUNT(*) AS n_logs, {_MISSES} AS complete_misses, "
+            f"ROUND(100.0 * {_MISSES} / COUNT(*), 2) AS complete_misses_rate "
+            + _FROM_COMPANY
+            + "GROUP BY talking_products.name ORDER BY complete_misses_rate DESC, talking_products.name LIMIT 200"
+        ),
+    },
+    {
+        "name": "busiest_products",
+        "examples": [
+            "Which talking product is the busiest?",
+            "Which products get the most questions?",
+            "How many interactions per talking product?",
+            "Where do visitors interact the most?",
+            "Rank the talking products by number of questions",
+            "Welk product krijgt de meeste vragen?",
+        ],
+        "sql": (
+            "SELECT talking_products.name, COUNT(*) AS n_logs, ROUND(AVG(interactions.match_score)::numeric, 2) AS average_match "
+            + _FROM_COMPANY
+            + "GROUP BY talking_products.name ORDER BY n_logs DESC, talking_products.name LIMIT 200"
+        ),
+    },
+]
+
+_SAFE_ID_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def _match_period(q: str, today: date) -> Tuple[Optional[Tuple[date, date]], Optional[Tuple[int, int]]]:
+    """(date range, span of the matched phrase) for the first period phrase extract_period understands."""
+    m = re.search(r"(?:last|past|afgelopen|laatste)\s+(\d{1,3})\s+(?:days|dagen)", q)
+    if m:
+        return (today - timedelta(days=max(int(m.group(1)), 1) - 1), today), m.span()  # N days including today
+    m = re.search(r"\b(yesterday|gisteren)\b", q)
+    if m:
+        y = today - timedelta(days=1)
+        return (y, y), m.span()
+    m = re.search(r"\b(today|vandaag)\b", q)
+    if m:
+        return (today, today), m.span()
+    m = re.search(r"\b(last|previous|vorige)\s+(week)\b", q)
+    if m:
+        start = today - timedelta(days=today.weekday() + 7)
+        return (start, start + timedelta(days=6)), m.span()
+    m = re.search(r"\b(this|deze)\s+week\b", q)
+    if m:
+        return (today - timedelta(days=today.weekday()), today), m.span()
+    m = re.search(r"\b(last|previous|vorige)\s+(month|maand)\b", q)
+    if m:
+        end = today.replace(day=1) - timedelta(days=1)
+        return (end.replace(day=1), end), m.span()
+    m = re.search(r"\b(this|deze)\s+(month|maand)\b", q)
+    if m:
+        return (today.replace(day=1), today), m.span()
+    return None, None
+
+
+def extract_period(question: str, today: Optional[date] = None) -> Optional[Tuple[date, date]]:
+    """Date range mentioned in the question (English/Dutch), or None for all time."""
+    return _match_period(question.lower(), today or date.today())[0]
+
+
+# Time references extract_period doesn't turn into a range ("in January", "Q1", "last 3 weeks", "since 2024", "15/03")
+_PERIOD_WORDS_RE = re.compile(
+    r"\b(january|february|march|april|may|june|july|august|september|october|november|december"
+    r"|januari|februari|maart|mei|juni|juli|augustus|oktober"
+    r"|jan|feb|mar|apr|jun|jul|aug|sep|sept|oct|okt|nov|dec"
+    r"|q[1-4]|quarter|kwartaal|year|years|jaar|jaren|month|months|maand|maanden|week|weeks|weken|weekend"
+    r"|day|days|dag|dagen|today|yesterday|tomorrow|vandaag|gisteren|morgen|since|sinds|until|tot en met|between|tussen"
+    r"|before|after|during|tijdens|ago|geleden|(?:19|20)\d\d|\d{1,2}[/.-]\d{1,2})\b"
+)
+# Filters and orderings no template can express: a different ranking direction, a subject or language filter, a row count
+_UNSUPPORTED_QUALIFIER_RE = re.compile(
+    r"\b(least|fewest|lowest|rarest|rarely|bottom|worst|minst|minste|laagste|zelden"
+    r"|about(?!\s+(?:the\s+)?most\b)|regarding|concerning|related to|relating to|containing|mentioning|mention|mentions"
+    r"|excluding|except|behalve|betreffende|met betrekking tot|over(?!\s+(?:time|de tijd)\b)"
+    r"|in (?:english|dutch|french|german|spanish|italian|het engels|het nederlands|het frans|het duits)"
+    r"|(?:top|bottom)\s+\d+)\b"
+)
+
+
+def unsupported_by_templates(question: str, today: Optional[date] = None) -> bool:
+    """
+    True if the question asks for something a template would silently ignore: a period extract_period
+    can't parse, or a qualifier (reverse order, subject/language filter, row count). Such questions go
+    to the LLM instead of getting confidently wrong numbers from a canned query.
+    """
+    q = question.lower()
+    _, span = _match_period(q, today or date.today())
+    if span is not None:
+        q = q[:span[0]] + " " + q[span[1]:]  # The parsed phrase is handled; look for anything beyond it
+    q = re.sub(r"\b(?:per|each|every|elke|iedere)\s+(?:day|dag)\b", " ", q)  # The per-date grouping of average_match_over_time
+    return bool(_PERIOD_WORDS_RE.search(q) or _UNSUPPORTED_QUALIFIER_RE.search(q))
+
+
+def render_intent_sql(intent: Dict[str, Any], company_id: str, period: Optional[Tuple[date, date]] = None) -> str:
+    """Fill in a template. Parameters are validated, never free text, so the result stays injection-safe."""
+    if not _SAFE_ID_RE.match(str(company_id)):
+        raise ValueError(f"Unexpected company_id format: {company_id!r}")
+    period_sql = ""
+    if period is not None:
+        start, end = period
+        period_sql = f" AND interactions.date BETWEEN '{date.fromisoformat(str(start)).isoformat()}' AND '{date.fromisoformat(str(end)).isoformat()}'"
+    return validate_readonly_sql(intent["sql"].format(company_id=company_id, period=period_sql))
+
+
+class IntentRouter:
+    """
+    Nearest-neighbour intent matching: the question embedding is compared with the
+    embeddings of curated example questions; above the threshold the intent's SQL template is used.
+    """
+
+    def __init__(self, intents=INTENTS, threshold: float = INTENT_ROUTER_THRESHOLD, embed=embed_query, model=None):
+        # Validate every template once up front: a broken template should fail loudly, not per request
+        for intent in intents:
+            render_intent_sql(intent, "00000000-0000-0000-0000-000000000000")
+            render_intent_sql(intent, "00000000-0000-0000-0000-000000000000", (date(2025, 1, 1), date(2025, 1, 31)))
+
+        self.intents = intents
+        self.threshold = threshold
+        self.embed = embed
+        model = model if model is not None else get_shared_embed_model()
+        examples, self._owner = [], []
+        for i, intent in enumerate(intents):
+            examples += intent["examples"]
+            self._owner += [i] * len(intent["examples"])
+        self._matrix = np.asarray(model.encode(examples, normalize_embeddings=True), dtype=np.float32)
+        self._lock = threading.Lock()
+        self.routed = {intent["name"]: 0 for intent in intents}
+        self.fallbacks = 0
+        self.unsupported = 0  # Fallbacks because of a period/qualifier the templates can't express
+
+    def match(self, question: str) -> Tuple[Optional[Dict[str, Any]], float]:
+        """(intent, similarity) of the closest example; intent is None below the threshold."""
+        sims = self._matrix @ np.asarray(self.embed(question), dtype=np.float32)
+        best = int(np.argmax(sims))
+        intent = self.intents[self._owner[best]] if sims[best] >= self.threshold else None
+        with self._lock:
+            if intent is None:
+                self.fallbacks += 1
+            else:
+                self.routed[intent["name"]] += 1
+        return intent, float(sims[best])
+
+    def route(self, question: str, company_id: str) -> Optional[Tuple[str, str]]:
+        """(intent name, SQL) for a recognised question, or None to fall back to the LLM."""
+        if unsupported_by_templates(question):
+            with self._lock:
+                self.fallbacks += 1
+                self.unsupported += 1
+            return None
+        intent, _ = self.match(question)
+        if intent is None:
+            return None
+        return intent["name"], render_intent_sql(intent, company_id, extract_period(question))
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.fallbacks + sum(self.routed.values())
+        return {
+            "routed": dict(self.routed),
+            "fallbacks": self.fallbacks,
+            "unsupported": self.unsupported,
+            "routed_rate": round(1 - self.fallbacks / total, 4) if total else 0.0,
+        }
+
+
+get_intent_router = lazy(IntentRouter)
+
+
+def route_intent(question: str, company_id: str) -> Optional[Tuple[str, str]]:
+    """(intent name, SQL) from the shared router, or None when the LLM should write the SQL."""
+    with trace_stage("intent_routing"):
+        return get_intent_router().route(question, company_id)
@@ -0,0 +1,135 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import (
+    LANG_CONFIDENCE_THRESHOLD, LANGUAGE_CACHE_PATH, LANGUAGE_DETECT_WORKERS,
+    LANGUAGE_DETECT_PARALLEL_MIN, LANGUAGE_DETECT_BATCH_SIZE,
+)
+from .lazy import lazy
+
+
+@lazy
+def get_language_identifier():
+    """langid identifier with normalized probabilities, so the confidence is in [0, 1] (loaded once per process)."""
+    from langid.langid import LanguageIdentifier, model
+    return LanguageIdentifier.from_modelstring(model, norm_probs=True)
+
+
+def normalize_text(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+def _classify_batch(texts: List[str]) -> List[Tuple[str, float]]:
+    """Runs in the worker processes: (language, confidence) per text."""
+    identifier = get_language_identifier()
+    return [tuple(identifier.classify(t)) for t in texts]
+
+
+class LanguageCache:
+    """Persistent (sqlite) text -> (language, confidence) cache, keyed on the hash of the normalized text."""
+
+    def __init__(self, path: str = LANGUAGE_CACHE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS languages (key TEXT PRIMARY KEY, lang TEXT NOT NULL, prob REAL NOT NULL)")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(normalized: str) -> str:
+        return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, Tuple[str, float]]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):  # sqlite caps the number of bound parameters
+                part = keys[i:i + 500]
+                rows = self._conn.execute(f"SELECT key, lang, prob FROM languages WHERE key IN ({','.join('?' * len(part))})", part)
+                found.update((k, (lang, prob)) for k, lang, prob in rows)
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, str, float]]):
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO languages (key, lang, prob) VALUES (?, ?, ?)", list(items))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM languages").fetchone()[0]
+
+
+class LanguageDetector:
+    """
+    Language detection for many texts at once: texts are deduplicated (after whitespace
+    normalization), looked up in the persistent cache, and only the misses are classified,
+    across a process pool when there are at least parallel_min of them.
+    The cache stores the confidence, so the threshold is applied on read and can change freely.
+    """
+
+    def __init__(self, cache: Optional[LanguageCache] = None, threshold: float = LANG_CONFIDENCE_THRESHOLD, workers: int = LANGUAGE_DETECT_WORKERS, parallel_min: int = LANGUAGE_DETECT_PARALLEL_MIN, batch_size: int = LANGUAGE_DETECT_BATCH_SIZE):
+        self.cache = cache if cache is not None else LanguageCache()
+        self.threshold = threshold
+        self.workers = workers
+        self.parallel_min = parallel_min
+        self.batch_size = batch_size
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.texts = 0
+        self.cache_hits = 0
+        self.classified = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn: forking a process that runs threads (write-behind, pipeline workers, backend pools) can copy a held lock
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _classify(self, texts: List[str]) -> List[Tuple[str, float]]:
+        if len(texts) < self.parallel_min or self.workers <= 1:
+            return _classify_batch(texts)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        return [result for batch in self._get_pool().map(_classify_batch, batches) for result in batch]
+
+    def detect_many(self, texts: List[str]) -> List[Optional[str]]:
+        """2-letter ISO code per text, None for empty texts or confidence below the threshold."""
+        normalized = [normalize_text(t) for t in texts]
+        keys = {n: LanguageCache.key(n) for n in set(normalized) if n}
+        results = self.cache.get_many(list(keys.values()))
+
+        missing = [n for n, k in keys.items() if k not in results]
+        if missing:
+            classified = self._classify(missing)
+            self.cache.put_many((keys[n], lang, float(prob)) for n, (lang, prob) in zip(missing, classified))
+            results.update((keys[n], (lang, prob)) for n, (lang, prob) in zip(missing, classified))
+
+        self.texts += len(texts)
+        self.cache_hits += len(keys) - len(missing)
+        self.classified += len(missing)
+        out = []
+        for n in normalized:
+            lang, prob = results[keys[n]] if n else (None, 0.0)
+            out.append(lang if lang is not None and prob >= self.threshold else None)
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        return {"texts": self.texts, "cache_hits": self.cache_hits, "classified": self.classified}
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+get_language_detector = lazy(LanguageDetector)
+
+
+def detect_languages(texts: List[str]) -> List[Optional[str]]:
+    """Batched detect_language through the shared detector (dedupe + persistent cache + process pool)."""
+    return get_language_detector().detect_many(texts)
@@ -0,0 +1,37 @@
+import threading
+from functools import wraps
+
+
+def lazy(factory):
+    """
+    Turn a zero-argument factory into a thread-safe singleton getter.
+
+    The factory runs on the first call only (double-checked locking), later calls
+    return the same object. The getter also exposes:
+      - getter.is_loaded(): whether the object was created already
+      - getter.set(obj): install an object without calling the factory (e.g. offline stand-ins)
+      - getter.reset(): drop the object so the next call creates a new one
+    """
+    lock = threading.Lock()
+    state = {}
+
+    @wraps(factory)
+    def getter():
+        if "value" not in state:
+            with lock:
+                if "value" not in state:
+                    state["value"] = factory()
+        return state["value"]
+
+    def set(value):
+        with lock:
+            state["value"] = value
+
+    def reset():
+        with lock:
+            state.pop("value", None)
+
+    getter.is_loaded = lambda: "value" in state
+    getter.set = set
+    getter.reset = reset
+    return getter
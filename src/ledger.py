@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from config import RUN_LEDGER_PATH, LLM_MODEL
+from .lazy import lazy
+
+
+def interactions_fingerprint(logs: List[Dict[str, Any]]) -> str:
+    """
+    Order-independent hash of the interactions a report is generated from (plus the LLM model):
+    the same fingerprint means the stored report was built from exactly this input.
+    """
+    digests = sorted(
+        hashlib.sha1(f"{log['date']}|{log['time']}|{log['question']}|{log['answer']}|{log['match_score']}".encode("utf-8")).digest()
+        for log in logs
+    )
+    h = hashlib.sha1(LLM_MODEL.encode("utf-8"))
+    for digest in digests:
+        h.update(digest)
+    return h.hexdigest()
+
+
+def unit_key(owner_id: str, report_type: str, date_range) -> str:
+    """Ledger key of one unit of work: a talking product (or company) + report type + date range."""
+    start, end = date_range if date_range else (None, None)
+    return f"{owner_id}|{report_type}|{start}_{end}"
+
+
+class RunLedger:
+    """
+    Persistent (sqlite) record of pipeline units: per (talking product, report type, date range)
+    the run that last touched it, the input fingerprint, the stages completed and the status.
+    Lets a rerun of a crashed nightly skip finished units, and any run skip units whose input
+    is unchanged since their report was stored. Runs themselves are recorded too, so a rerun
+    can tell a restart after a crash (resume) from a fresh run (re-check every unit's input).
+    """
+
+    def __init__(self, path: str = RUN_LEDGER_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS units ("
+            "key TEXT PRIMARY KEY, run_key TEXT, fingerprint TEXT, stages TEXT NOT NULL, status TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS runs (run_key TEXT PRIMARY KEY, status TEXT NOT NULL, updated_at REAL NOT NULL)")
+        self._lock = threading.Lock()
+
+    def begin_run(self, run_key: str) -> bool:
+        """Mark a run as started; True if the same run was started before and never finished (resume)."""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT status FROM runs WHERE run_key = ?", (run_key,)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO runs (run_key, status, updated_at) VALUES (?, 'running', ?)", (run_key, time.time()))
+        return row is not None and row[0] == "running"
+
+    def end_run(self, run_key: str):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO runs (run_key, status, updated_at) VALUES (?, 'done', ?)", (run_key, time.time()))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT run_key, fingerprint, stages, status, updated_at FROM units WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        run_key, fingerprint, stages, status, updated_at = row
+        return {"run_key": run_key, "fingerprint": fingerprint, "stages": json.loads(stages), "status": status, "updated_at": updated_at}
+
+    def put(self, key: str, run_key: Optional[str], fingerprint: Optional[str], stages: List[str], status: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO units (key, run_key, fingerprint, stages, status, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, run_key, fingerprint, json.dumps(stages), status, time.time()),
+            )
+
+    def unit(self, owner_id: str, report_type: str, date_range, run_key: Optional[str] = None, resume: bool = False) -> "LedgerUnit":
+        return LedgerUnit(self, unit_key(owner_id, report_type, date_range), run_key, resume)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM units GROUP BY status").fetchall())
+
+
+class LedgerUnit:
+    """One unit's ledger entry, as seen by the run processing it."""
+
+    def __init__(self, ledger: RunLedger, key: str, run_key: Optional[str] = None, resume: bool = False):
+        self.ledger = ledger
+        self.key = key
+        self.run_key = run_key
+        self.resume = resume
+        self.entry = ledger.get(key)
+        self.fingerprint: Optional[str] = None
+        self.stages: List[str] = []
+
+    def finished_in_run(self) -> bool:
+        """Resuming a crashed run and this unit was completed before the crash: skip without even fetching."""
+        return self.resume and self.run_key is not None and self.entry is not None and self.entry["status"] == "done" and self.entry["run_key"] == self.run_key
+
+    def unchanged(self, fingerprint: str) -> bool:
+        """Completed before from exactly this input: the stored report is still current."""
+        return self.entry is not None and self.entry["status"] == "done" and self.entry["fingerprint"] == fingerprint
+
+    def start(self, fingerprint: str):
+        """Begin (or resume) processing this input; stages done for the same input are kept."""
+        self.fingerprint = fingerprint
+        same_input = self.entry is not None and self.entry["fingerprint"] == fingerprint
+        self.stages = list(self.entry["stages"]) if same_input else []
+        self.ledger.put(self.key, self.run_key, fingerprint, self.stages, "running")
+
+    def completed(self, stage: str) -> bool:
+        return stage in self.stages
+
+    def stage_done(self, record: Dict[str, Any]):
+        """RunProfiler on_stage callback: checkpoint a finished stage."""
+        if record["stage"] not in self.stages:
+            self.stages.append(record["stage"])
+        self.ledger.put(self.key, self.run_key, self.fingerprint, self.stages, "running")
+
+    def finish(self, status: str = "done"):
+        self.ledger.put(self.key, self.run_key, self.fingerprint, self.stages, status)
+
+
+get_run_ledger = lazy(RunLedger)
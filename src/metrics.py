@@ -0,0 +1,121 @@
+import bisect
+import threading
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Seconds; covers cache hits (ms) up to slow LLM answers (tens of seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with optional labels (Prometheus text format)."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels_text(self.labels, values)} {v:g}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels (Prometheus text format)."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], Dict[str, object]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, series["counts"]):
+                    cumulative += n
+                    le = f'le="{bound:g}"'
+                    lines.append(f"{self.name}_bucket{_labels_text(self.labels, values, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_labels_text(self.labels, values, le)} {series['count']}")
+                lines.append(f"{self.name}_sum{_labels_text(self.labels, values)} {series['sum']:.6f}")
+                lines.append(f"{self.name}_count{_labels_text(self.labels, values)} {series['count']}")
+        return lines
+
+
+class Gauges:
+    """Gauges read from a callback at scrape time, e.g. cache stats() dicts: {metric suffix: value}."""
+
+    def __init__(self, prefix: str, help: str, read: Callable[[], Dict[str, float]]):
+        self.prefix, self.help, self.read = prefix, help, read
+
+    def render(self) -> List[str]:
+        try:
+            values = self.read()
+        except Exception:
+            return []  # A collector that is not available (e.g. model not loaded) is skipped
+        lines = []
+        for key, v in values.items():
+            if isinstance(v, bool) or not isinstance(v, (int, float)):
+                continue
+            name = f"{self.prefix}_{key}"
+            lines += [f"# HELP {name} {self.help}: {key}", f"# TYPE {name} gauge", f"{name} {v:g}"]
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter("digiole_http_requests_total", "HTTP requests by route and status", ("method", "route", "status")))
+HTTP_SECONDS = REGISTRY.register(Histogram("digiole_http_request_seconds", "HTTP request latency (until the last body byte)", ("method", "route")))
+STAGE_SECONDS = REGISTRY.register(Histogram("digiole_stage_seconds", "Time spent per /ask stage", ("stage",)))
+STAGE_ERRORS = REGISTRY.register(Counter("digiole_stage_errors_total", "Stages that raised", ("stage",)))
+SLOW_REQUESTS = REGISTRY.register(Counter("digiole_slow_requests_total", "Requests slower than TRACE_SLOW_REQUEST_SECONDS", ("route",)))
@@ -0,0 +1,82 @@
+import os
+import json
+import glob
+import heapq
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import SHARD_SUMMARY_DIR
+from .profiling import fetched_items
+
+Unit = Tuple[str, str]  # (company_id, talking_product_id)
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """"i/N" → (i, N), with 0 <= i < N."""
+    try:
+        index, n_shards = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must look like i/N, got '{spec}'")
+    if n_shards < 1 or not 0 <= index < n_shards:
+        raise ValueError(f"Shard index must be in [0, {n_shards}), got '{spec}'")
+    return index, n_shards
+
+
+def unit_weights(units: Sequence[Unit], counts: Dict[str, int]) -> Dict[Unit, int]:
+    """Expected cost per unit: its interaction count, the median count for products without one (new products)."""
+    known = sorted(counts[tp] for _, tp in units if tp in counts)
+    default = known[len(known) // 2] if known else 1
+    return {unit: max(counts.get(unit[1], default), 1) for unit in units}
+
+
+def partition_units(units: Sequence[Unit], weights: Dict[Unit, int], n_shards: int) -> List[List[Unit]]:
+    """
+    Deterministic, balanced split of units over n_shards (greedy longest-processing-time):
+    heaviest unit first, each to the currently lightest shard (lowest index on ties).
+    Every process computes the same split from the same units and weights.
+    """
+    shards: List[List[Unit]] = [[] for _ in range(n_shards)]
+    loads = [(0, i) for i in range(n_shards)]
+    for unit in sorted(units, key=lambda u: (-weights[u], u)):
+        load, i = heapq.heappop(loads)
+        shards[i].append(unit)
+        heapq.heappush(loads, (load + weights[unit], i))
+    return shards
+
+
+def _summary_dir(run_key: str, n_shards: int, out_dir: str) -> str:
+    return os.path.join(out_dir, f"{run_key.replace(':', '_')}_{n_shards}")
+
+
+def write_shard_summary(run_key: str, index: int, n_shards: int, summary: Dict[str, Any], out_dir: str = SHARD_SUMMARY_DIR) -> str:
+    """Write one shard's run summary (units, weight, wall time, run reports) as JSON and return its path."""
+    directory = _summary_dir(run_key, n_shards, out_dir)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"shard-{index}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({**summary, "run_key": run_key, "shard": index, "n_shards": n_shards}, f, indent=2, default=str)
+    os.replace(tmp, path)  # Readers never see a half-written summary
+    return path
+
+
+def read_shard_summaries(run_key: str, n_shards: int, out_dir: str = SHARD_SUMMARY_DIR) -> Optional[List[Dict[str, Any]]]:
+    """All N shard summaries of a run, ordered by shard; None while some shard hasn't finished."""
+    paths = glob.glob(os.path.join(_summary_dir(run_key, n_shards, out_dir), "shard-*.json"))
+    if len(paths) < n_shards:
+        return None
+    summaries = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            summaries.append(json.load(f))
+    return sorted(summaries, key=lambda s: s["shard"])
+
+
+def format_shard_table(summaries: List[Dict[str, Any]]) -> str:
+    """One row per shard: units, expected weight, processed items and wall time (the balance check)."""
+    lines = ["\n🧩 Shards", f"{'shard':<8}{'units':>8}{'weight':>10}{'items':>10}{'wall_s':>10}"]
+    for s in summaries:
+        items = sum(fetched_items(r) or 0 for r in s["reports"])
+        lines.append(f"{s['shard']:<8}{len(s['units']):>8}{s['weight']:>10}{items:>10}{s['wall_s']:>10.2f}")
+    walls = [s["wall_s"] for s in summaries]
+    lines.append(f"makespan {max(walls):.2f}s | mean {sum(walls) / len(walls):.2f}s | imbalance {max(walls) / max(sum(walls) / len(walls), 1e-9):.2f}x")
+    return "\n".join(lines)
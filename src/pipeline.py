@@ -0,0 +1,174 @@
+import time
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+from config import PIPELINE_QUEUE_SIZE, PIPELINE_PROGRESS_SECONDS
+
+_STOP = object()
+
+
+class StageStats:
+    """Counters of one pipeline stage (updated by its workers)."""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.failed = 0
+        self.busy_s = 0.0  # Running the stage function
+        self.starved_s = 0.0  # Waiting for input (upstream is the bottleneck)
+        self.blocked_s = 0.0  # Waiting for room downstream (backpressure: downstream is the bottleneck)
+        self.max_depth = 0  # Deepest the input queue got
+        self._lock = threading.Lock()
+
+    def add(self, busy: float, starved: float, blocked: float, failed: bool):
+        with self._lock:
+            self.items += 1
+            self.failed += failed
+            self.busy_s += busy
+            self.starved_s += starved
+            self.blocked_s += blocked
+
+
+class StagePipeline:
+    """
+    Run items through a sequence of stages, each with its own worker threads and a bounded
+    input queue, so different items are in different stages at the same time (while one
+    product waits for the LLM, the next one embeds and a third one fetches). A full queue
+    blocks the upstream workers (backpressure), which bounds the items held in memory.
+
+    stages: [(name, fn, workers)]; fn(item) works on the item in place. An item for which
+    is_done(item) is true after a stage skips the remaining stages. An exception calls
+    on_error(item, stage_name, exc) and ends the item.
+    """
+
+    def __init__(
+        self,
+        stages: Sequence[Tuple[str, Callable[[Any], Any], int]],
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        is_done: Callable[[Any], bool] = lambda item: False,
+        on_error: Callable[[Any, str, Exception], None] = None,
+        progress_seconds: float = PIPELINE_PROGRESS_SECONDS,
+    ):
+        self.stages = list(stages)
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in self.stages]
+        self.stats = [StageStats(name, workers) for name, _, workers in self.stages]
+        self.is_done = is_done
+        self.on_error = on_error
+        self.progress_seconds = progress_seconds
+        self._results: List[Any] = []
+        self._results_lock = threading.Lock()
+        self._alive = [workers for _, _, workers in self.stages]
+        self._alive_lock = threading.Lock()
+        self.wall_s = 0.0
+
+    def _put(self, index: int, item) -> float:
+        """Hand an item to stage index (or the results); returns the seconds spent blocked on a full queue."""
+        if index >= len(self.stages) or item is _STOP:
+            if item is not _STOP:
+                with self._results_lock:
+                    self._results.append(item)
+            return 0.0
+        t0 = time.perf_counter()
+        self.queues[index].put(item)
+        stats = self.stats[index]
+        stats.max_depth = max(stats.max_depth, self.queues[index].qsize())
+        return time.perf_counter() - t0
+
+    def _report_error(self, item, stage_name: str, e: Exception):
+        if self.on_error is None:
+            return
+        try:
+            self.on_error(item, stage_name, e)
+        except Exception as callback_error:  # A broken callback must not kill the worker (run() would wait forever)
+            print(f"⚠️ Pipeline on_error callback failed in {stage_name}: {type(callback_error).__name__}: {callback_error}")
+
+    def _worker(self, index: int):
+        _, fn, _ = self.stages[index]
+        stats = self.stats[index]
+        try:
+            while True:
+                t0 = time.perf_counter()
+                item = self.queues[index].get()
+                t1 = time.perf_counter()
+                if item is _STOP:
+                    break
+                failed = False
+                try:
+                    fn(item)
+                    done = self.is_done(item)
+                except Exception as e:
+                    failed = done = True
+                    self._report_error(item, stats.name, e)
+                t2 = time.perf_counter()
+                blocked = self._put(len(self.stages) if done else index + 1, item)
+                stats.add(busy=t2 - t1, starved=t1 - t0, blocked=blocked, failed=failed)
+        finally:
+            # The last worker of a stage out stops the next stage (also if this worker died)
+            with self._alive_lock:
+                self._alive[index] -= 1
+                last = self._alive[index] == 0
+            if last and index + 1 < len(self.stages):
+                for _ in range(self.stages[index + 1][2]):
+                    self.queues[index + 1].put(_STOP)
+
+    def _monitor(self, stop: threading.Event):
+        while not stop.wait(self.progress_seconds):
+            depths = " | ".join(f"{s.name} {q.qsize()}q {s.items}✓" for s, q in zip(self.stats, self.queues))
+            print(f"🚰 {depths}")
+
+    def run(self, items: Iterable[Any]) -> List[Any]:
+        """Push all items through the stages; returns them in completion order."""
+        t0 = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._worker, args=(i,), name=f"pipeline-{name}-{w}", daemon=True)
+            for i, (name, _, workers) in enumerate(self.stages)
+            for w in range(workers)
+        ]
+        for t in threads:
+            t.start()
+        stop = threading.Event()
+        if self.progress_seconds:
+            threading.Thread(target=self._monitor, args=(stop,), name="pipeline-monitor", daemon=True).start()
+
+        for item in items:
+            self._put(0, item)  # Blocks while the first stage is saturated
+        for _ in range(self.stages[0][2]):
+            self.queues[0].put(_STOP)
+        for t in threads:
+            t.join()
+        stop.set()
+        self.wall_s = time.perf_counter() - t0
+        return self._results
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Per stage: items, failures, busy/starved/blocked seconds, utilization of its workers and max queue depth."""
+        return [
+            {
+                "stage": s.name,
+                "workers": s.workers,
+                "items": s.items,
+                "failed": s.failed,
+                "busy_s": round(s.busy_s, 4),
+                "starved_s": round(s.starved_s, 4),
+                "blocked_s": round(s.blocked_s, 4),
+                "utilization": round(s.busy_s / (s.workers * self.wall_s), 3) if self.wall_s else 0.0,
+                "max_queue_depth": s.max_depth,
+            }
+            for s in self.stats
+        ]
+
+
+def format_pipeline_table(summary: List[Dict[str, Any]], wall_s: float) -> str:
+    """Stage table of a pipeline run: the busiest stage with blocked upstream stages is the bottleneck."""
+    lines = [
+        f"\n🚰 Pipeline | wall {wall_s:.2f}s",
+        f"{'stage':<16}{'workers':>8}{'items':>8}{'busy_s':>10}{'util':>7}{'starved_s':>11}{'blocked_s':>11}{'max_q':>7}",
+    ]
+    for s in summary:
+        lines.append(
+            f"{s['stage']:<16}{s['workers']:>8}{s['items']:>8}{s['busy_s']:>10.2f}{s['utilization']:>7.0%}"
+            f"{s['starved_s']:>11.2f}{s['blocked_s']:>11.2f}{s['max_queue_depth']:>7}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List
+
+from config import RUN_REPORTS_DIR, PROFILE_TRACE_MEMORY
+
+
+class RunProfiler:
+    """
+    Collect per-stage wall time, CPU time, peak memory and item counts for one
+    pipeline run (one product / report type), and emit them as a JSON run report.
+
+    Usage:
+        profiler = RunProfiler("daily", talking_product_id=tp_id, date_range=date_range)
+        with profiler.stage("fetch") as stage:
+            data = fetch_questions(...)
+            stage["items"] = data["n_logs"]
+        report = profiler.finish()
+
+    Stages are meant to be sequential: tracemalloc only keeps one peak, so nested
+    stages would reset the peak of their parent. on_stage, if set, is called with the
+    record of every stage that completes without an error (e.g. to checkpoint progress).
+    A stage that raises finishes the run with status "failed" (run report written, tracing
+    stopped); a later finish() returns that report.
+    """
+
+    def __init__(self, run_type: str, company_id=None, talking_product_id=None, date_range=None, trace_memory: bool = PROFILE_TRACE_MEMORY):
+        self.meta = {
+            "run_type": run_type,
+            "company_id": company_id,
+            "talking_product_id": talking_product_id,
+            "date_range": date_range,
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        self.stages: List[Dict[str, Any]] = []
+        self.on_stage = None
+        self.report = None  # Set by finish()
+        self.trace_memory = trace_memory
+        self._owns_tracing = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+        self._wall0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+
+    @contextmanager
+    def stage(self, name: str, items: int | None = None):
+        """Time a single stage. The yielded dict can be updated (e.g. stage["items"] = n)."""
+        record: Dict[str, Any] = {"stage": name, "items": items}
+        mem0 = 0
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            mem0 = tracemalloc.get_traced_memory()[0]
+        wall0 = time.perf_counter()
+        cpu0 = time.process_time()
+        try:
+            yield record
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record["wall_s"] = round(time.perf_counter() - wall0, 4)
+            record["cpu_s"] = round(time.process_time() - cpu0, 4)
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                record["peak_mem_mb"] = round(max(peak - mem0, 0) / 1024 / 1024, 2)
+            self.stages.append(record)
+            if "error" in record:
+                self.finish(status="failed")  # The exception ends the run: nobody else will finish it
+        if self.on_stage is not None:
+            self.on_stage(record)
+
+    def finish(self, status: str = "ok", write: bool = True, verbose: bool = True) -> Dict[str, Any]:
+        """Close the run, write the JSON run report and print the per-stage table (once: later calls return the same report)."""
+        if self.report is not None:
+            return self.report
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+
+        report = {
+            **self.meta,
+            "status": status,
+            "total_wall_s": round(time.perf_counter() - self._wall0, 4),
+            "total_cpu_s": round(time.process_time() - self._cpu0, 4),
+            "stages": self.stages,
+        }
+        if write:
+            report["path"] = write_run_report(report)
+        if verbose:
+            print(format_stage_table(report))
+        self.report = report
+        return report
+
+
+def write_run_report(report: Dict[str, Any], out_dir: str = RUN_REPORTS_DIR) -> str:
+    """Write a run report as JSON and return its path."""
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    owner = report.get("talking_product_id") or report.get("company_id") or "all"
+    path = os.path.join(out_dir, f"{stamp}_{report['run_type']}_{owner}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    return path
+
+
+def format_stage_table(report: Dict[str, Any]) -> str:
+    """Render the stages of a single run report as a fixed-width table."""
+    owner = report.get("talking_product_id") or report.get("company_id") or "all"
+    lines = [
+        f"\n⏱️ {report['run_type']} | {owner} | {report['status']} | "
+        f"wall {report['total_wall_s']:.2f}s | cpu {report['total_cpu_s']:.2f}s",
+        f"{'stage':<16}{'items':>10}{'wall_s':>10}{'cpu_s':>10}{'peak_mb':>10}",
+    ]
+    for s in report["stages"]:
+        items = "" if s.get("items") is None else s["items"]
+        peak = s.get("peak_mem_mb", "")
+        lines.append(f"{s['stage']:<16}{items:>10}{s['wall_s']:>10.3f}{s['cpu_s']:>10.3f}{peak:>10}")
+    return "\n".join(lines)
+
+
+def fetched_items(report: Dict[str, Any]):
+    """Input items of a run: the ingest stage's row count (CSV runs), else the fetch/parse stage's items."""
+    for names in (("ingest",), ("fetch", "parse")):
+        items = next((s["items"] for s in report["stages"] if s["stage"] in names), None)
+        if items is not None:
+            return items
+    return None
+
+
+def format_summary_table(reports: List[Dict[str, Any]]) -> str:
+    """Render one row per run, with the total wall time per stage as columns."""
+    stage_names: List[str] = []
+    for r in reports:
+        for s in r["stages"]:
+            if s["stage"] not in stage_names:
+                stage_names.append(s["stage"])
+
+    header = f"{'run':<10}{'product':<38}{'status':<8}{'items':>8}" + "".join(f"{n:>14}" for n in stage_names) + f"{'total':>10}"
+    lines = ["\n📊 Run summary (wall seconds per stage)", header]
+    for r in reports:
+        per_stage = {}
+        for s in r["stages"]:
+            per_stage[s["stage"]] = per_stage.get(s["stage"], 0) + s["wall_s"]
+        fetched = fetched_items(r)
+        owner = str(r.get("talking_product_id") or r.get("company_id") or "all")
+        row = f"{r['run_type']:<10}{owner:<38}{r['status']:<8}{'' if fetched is None else fetched:>8}"
+        row += "".join(f"{per_stage[n]:>14.3f}" if n in per_stage else f"{'':>14}" for n in stage_names)
+        row += f"{r['total_wall_s']:>10.2f}"
+        lines.append(row)
+    return "\n".join(lines)
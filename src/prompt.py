@@ -2,10 +2,16 @@ from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 
 from .get.templates import get_daily_prompt, get_sql_prompt, get_llm_prompt, get_rag_prompt, get_context
-from .get.data import execute_readonly_sql, retrieve_context, fetch_questions 
+from .get.data import retrieve_context
+from .cache import cached_readonly_sql
 from .get.models import get_llm_model, get_free_local_llm
 from .utils import rows_to_context, validate_readonly_sql
-from config import MAX_CONTEXT_CHARS 
+from .lazy import lazy
+from .concurrency import run_blocking
+from .intents import route_intent
+from .context import build_direct_context
+from .tracing import trace_stage
+from config import INTENT_ROUTER_ENABLED, RAG_DOC_TYPE
 from .report import Report
 
 
@@ -25,56 +31,156 @@ LLM_PROMPT = ChatPromptTemplate.from_template(get_llm_prompt())
 RAG_PROMPT = ChatPromptTemplate.from_template(get_rag_prompt())
 
 
-# Get LLM models ONCE
-LLM = get_llm_model()  
-FREE_LLM = get_free_local_llm()
+# Get LLM models ONCE, on first use (building the clients is slow and not every caller needs them)
+get_llm = lazy(get_llm_model)
+get_free_llm = lazy(get_free_local_llm)
 
 
-# Build the chains ONCE
-REPORT_CHAIN = REPORT_INFO | DAILY_PROMPT | LLM | parser
-SQL_CHAIN = SQL_PROMPT | LLM
-LLM_CHAIN = LLM_PROMPT | LLM
-RAG_CHAIN = RAG_PROMPT | LLM
+# Build the chains ONCE, on first use
+@lazy
+def get_report_chain():
+    return REPORT_INFO | DAILY_PROMPT | get_llm() | parser
+
+@lazy
+def get_sql_chain():
+    return SQL_PROMPT | get_llm()
+
+@lazy
+def get_llm_chain():
+    return LLM_PROMPT | get_llm()
+
+@lazy
+def get_rag_chain():
+    return RAG_PROMPT | get_llm()
 
 
 def generate_report(logs_text: str) -> Report:
-    """Use the pre-built REPORT_CHAIN."""
+    """Use the shared report chain."""
     try:
-        report: Report = REPORT_CHAIN.invoke({"logs_text": logs_text})
+        report: Report = get_report_chain().invoke({"logs_text": logs_text})
         return report
     except Exception as e:
         raise RuntimeError(f"Failed to generate report: {e}")
 
 
-def answer_with_rag(question: str, company_id: str, talking_product_id: str):
-    """Use the pre-built RAG_CHAIN."""
-    context, citations = retrieve_context(
-        query=question,
-        company_id=company_id,
-        talking_product_id=talking_product_id
-    )
-    return RAG_CHAIN.invoke({"question": question, "context": context}), citations
+# ----------------- Question answering -----------------
+# The non-LLM steps (retrieval, intent routing, SQL execution, context building) are shared
+# helpers; the sync entry points call the LLM with invoke, the async ones (used by the backend)
+# with ainvoke and run the blocking helpers on the shared thread pool, so the event loop keeps
+# serving other requests.
 
+def _rag_context(question: str, company_id: str, talking_product_id: str):
+    return retrieve_context(query=question, company_id=company_id, talking_product_id=talking_product_id, doc_type=RAG_DOC_TYPE)
 
-def generate_readonly_sql(question: str, company_id: str) -> str:
-    resp = SQL_CHAIN.invoke({"question": question, "company_id": company_id})
+
+def _routed_sql(question: str, company_id: str):
+    """(sql, intent) from a canned template when the intent router recognises the question, else None."""
+    if INTENT_ROUTER_ENABLED:
+        routed = route_intent(question, company_id)
+        if routed:
+            intent, sql = routed
+            return sql, intent
+    return None
+
+
+def _validated_sql(resp) -> str:
     raw_sql = resp.content if hasattr(resp, "content") else str(resp)
     return validate_readonly_sql(raw_sql)
 
 
+def _sql_context(sql: str, company_id: str) -> str:
+    return rows_to_context(cached_readonly_sql(sql, company_id))
+
+
+def answer_with_rag(question: str, company_id: str, talking_product_id: str):
+    """Use the shared RAG chain."""
+    context, citations = _rag_context(question, company_id, talking_product_id)
+    with trace_stage("llm"):
+        return get_rag_chain().invoke({"question": question, "context": context}), citations
+
+
+def generate_readonly_sql(question: str, company_id: str) -> str:
+    with trace_stage("sql_generation"):
+        return _validated_sql(get_sql_chain().invoke({"question": question, "company_id": company_id}))
+
+
+def resolve_sql(question: str, company_id: str):
+    """
+    (sql, intent): the canned template when the intent router recognises the question
+    (one LLM call saved), otherwise LLM-generated SQL with intent None.
+    """
+    return _routed_sql(question, company_id) or (generate_readonly_sql(question, company_id), None)
+
+
 def answer_with_sql(question: str, company_id: str):
-    sql = generate_readonly_sql(question, company_id)
-    rows = execute_readonly_sql(sql)
-    context = rows_to_context(rows)
-    print(context)
-    return LLM_CHAIN.invoke({"question": question, "sql": sql, "context": context})
+    sql, _ = resolve_sql(question, company_id)
+    context = _sql_context(sql, company_id)
+    with trace_stage("llm"):
+        return get_llm_chain().invoke({"question": question, "sql": sql, "context": context})
 
 
 def answer_directly(question, company_id, talking_product_id, date_range):
-    data = fetch_questions(date_range, talking_product_id=talking_product_id, company_id=company_id)
-    logs = data["logs"]
-    context = rows_to_context(logs)
-    if len(context) > MAX_CONTEXT_CHARS:
-        context = context[:MAX_CONTEXT_CHARS]
-    return LLM_CHAIN.invoke({"question": question, "sql": None, "context": context})
+    context, _ = build_direct_context(company_id, talking_product_id, date_range)
+    with trace_stage("llm"):
+        return get_llm_chain().invoke({"question": question, "sql": None, "context": context})
+
+
+async def aanswer_with_rag(question: str, company_id: str, talking_product_id: str):
+    context, citations = await run_blocking(_rag_context, question, company_id, talking_product_id)
+    with trace_stage("llm"):
+        return await get_rag_chain().ainvoke({"question": question, "context": context}), citations
+
+
+async def agenerate_readonly_sql(question: str, company_id: str) -> str:
+    with trace_stage("sql_generation"):
+        return _validated_sql(await get_sql_chain().ainvoke({"question": question, "company_id": company_id}))
+
+
+async def aresolve_sql(question: str, company_id: str):
+    return await run_blocking(_routed_sql, question, company_id) or (await agenerate_readonly_sql(question, company_id), None)
+
+
+async def aanswer_with_sql(question: str, company_id: str):
+    sql, _ = await aresolve_sql(question, company_id)
+    context = await run_blocking(_sql_context, sql, company_id)
+    with trace_stage("llm"):
+        return await get_llm_chain().ainvoke({"question": question, "sql": sql, "context": context})
+
+
+async def aanswer_directly(question, company_id, talking_product_id, date_range):
+    context, _ = await run_blocking(build_direct_context, company_id, talking_product_id, date_range)
+    with trace_stage("llm"):
+        return await get_llm_chain().ainvoke({"question": question, "sql": None, "context": context})
+
+
+# ----------------- Streaming variants -----------------
+# Async generators yielding (event, payload) tuples: first a "meta" event as soon as the
+# SQL / citations / context are known, then one "token" event per streamed LLM chunk.
+
+def _chunk_text(chunk) -> str:
+    return chunk.content if hasattr(chunk, "content") else str(chunk)
+
+
+async def astream_with_sql(question: str, company_id: str):
+    sql, intent = await aresolve_sql(question, company_id)
+    yield "meta", {"mode": "sql", "sql": sql, "intent": intent}
+    context = await run_blocking(_sql_context, sql, company_id)
+    with trace_stage("llm"):
+        async for chunk in get_llm_chain().astream({"question": question, "sql": sql, "context": context}):
+            yield "token", _chunk_text(chunk)
+
+
+async def astream_directly(question, company_id, talking_product_id, date_range):
+    context, stats = await run_blocking(build_direct_context, company_id, talking_product_id, date_range)
+    yield "meta", {"mode": "direct", "context": stats}
+    with trace_stage("llm"):
+        async for chunk in get_llm_chain().astream({"question": question, "sql": None, "context": context}):
+            yield "token", _chunk_text(chunk)
+
 
+async def astream_with_rag(question: str, company_id: str, talking_product_id: str):
+    context, citations = await run_blocking(_rag_context, question, company_id, talking_product_id)
+    yield "meta", {"mode": "rag", "citations": citations}
+    with trace_stage("llm"):
+        async for chunk in get_rag_chain().astream({"question": question, "context": context}):
+            yield "token", _chunk_text(chunk)
@@ -0,0 +1,258 @@
+import re
+import math
+import heapq
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from config import (
+    HYBRID_CANDIDATES, HYBRID_RRF_K, HYBRID_INDEX_PAGE_SIZE,
+    RERANKER_ENABLED, RERANKER_TOP_N, RERANKER_BATCH_SIZE,
+)
+from .get.models import get_reranker_model
+from .lazy import lazy
+from .sharding import collections_for
+from .tracing import trace_stage
+
+# Words plus compound codes: "XR-4821" yields "xr-4821" as well as "xr" and "4821"
+_TOKEN_RE = re.compile(r"\w+(?:[-_./]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for tok in _TOKEN_RE.findall((text or "").lower()):
+        tokens.append(tok)
+        parts = re.findall(r"\w+", tok)
+        if len(parts) > 1:
+            tokens += parts
+    return tokens
+
+
+class BM25Index:
+    """Incremental in-memory BM25 (Okapi) index: add/remove single documents, search with a metadata filter."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.total_len = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, doc_id: str, text: str, meta: Optional[Dict[str, Any]] = None):
+        if doc_id in self.docs:
+            self.remove(doc_id)
+        tf = Counter(tokenize(text))
+        length = sum(tf.values())
+        self.docs[doc_id] = {"text": text, "meta": meta or {}, "len": length, "terms": list(tf)}
+        self.total_len += length
+        for term, n in tf.items():
+            self.postings.setdefault(term, {})[doc_id] = n
+
+    def remove(self, doc_id: str):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self.total_len -= doc["len"]
+        for term in doc["terms"]:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def search(self, query: str, k: int, predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[tuple]:
+        """Top-k (doc_id, score) for the query, only over documents whose metadata passes the predicate."""
+        n = len(self.docs)
+        if not n:
+            return []
+        avgdl = self.total_len / n
+        scores: Dict[str, float] = {}
+        allowed: Dict[str, bool] = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                ok = allowed.get(doc_id)
+                if ok is None:
+                    ok = allowed[doc_id] = predicate is None or predicate(self.docs[doc_id]["meta"])
+                if not ok:
+                    continue
+                dl = self.docs[doc_id]["len"]
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * dl / avgdl))
+        return heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+
+
+def load_company_documents(company_id: str, page_size: int = HYBRID_INDEX_PAGE_SIZE):
+    """All documents (report chunks and interactions) of a company from Chroma, page by page."""
+    for collection in collections_for(company_id):
+        offset = 0
+        while True:
+            res = collection.get(where={"company_id": company_id}, include=["documents", "metadatas"], limit=page_size, offset=offset)
+            ids = res.get("ids") or []
+            yield from zip(ids, res.get("documents") or [], res.get("metadatas") or [])
+            if len(ids) < page_size:
+                break
+            offset += page_size
+
+
+def where_predicate(talking_product_id=None, date=None, start_date=None, end_date=None, doc_type=None, report_type=None) -> Callable[[Dict[str, Any]], bool]:
+    """Python equivalent of the Chroma where clause built in retrieve_context (company is implied by the index)."""
+    def check(meta: Dict[str, Any]) -> bool:
+        if talking_product_id is not None and meta.get("talking_product_id") != talking_product_id:
+            return False
+        if doc_type is not None and meta.get("doc_type") != doc_type:
+            return False
+        if report_type is not None and meta.get("report_type") != report_type:
+            return False
+        if date is not None and meta.get("date") != date:
+            return False
+        if start_date is not None and end_date is not None:
+            d = meta.get("date")
+            if d is None or not (str(start_date) <= str(d) <= str(end_date)):
+                return False
+        return True
+    return check
+
+
+def rrf_fuse(rankings: List[List[str]], rrf_k: int = HYBRID_RRF_K) -> List[tuple]:
+    """Reciprocal rank fusion of several ranked id lists: [(id, score)], best first."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+
+
+class HybridRetriever:
+    """
+    Per-company BM25 indexes over the Chroma documents, fused with dense hits.
+
+    A company's index is built from Chroma on its first query and kept up to date by
+    index_documents()/remove_documents() (called by the store functions in this process).
+    Writes from other processes (the nightly pipeline) bump the company's data version;
+    the index is then rebuilt in the background while the old one keeps serving.
+    """
+
+    def __init__(self, rrf_k: int = HYBRID_RRF_K, rerank: bool = RERANKER_ENABLED, load=load_company_documents, version_of=None):
+        self.rrf_k = rrf_k
+        self.rerank = rerank
+        self.load = load
+        self.version_of = version_of
+        self._indexes: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._company_locks: Dict[str, threading.Lock] = {}
+        self.builds = 0
+
+    def _version(self, company_id: str) -> int:
+        if self.version_of is None:
+            from .cache import get_data_versions  # deferred: src.cache imports src.get.data
+            self.version_of = get_data_versions().get
+        return self.version_of(company_id)
+
+    def _build(self, company_id: str, version: int):
+        index = BM25Index()
+        for doc_id, text, meta in self.load(company_id):
+            index.add(doc_id, text, meta)
+        with self._lock:
+            self._indexes[company_id] = {"index": index, "version": version, "building": False}
+            self.builds += 1
+        return index
+
+    def _rebuild(self, company_id: str, version: int, entry: Dict[str, Any]):
+        """Background refresh of a stale index: on failure the old index keeps serving and a later query retries."""
+        try:
+            self._build(company_id, version)
+        except Exception as e:
+            print(f"⚠️ BM25 rebuild failed for company {company_id}, keeping the stale index: {e}")
+        finally:
+            entry["building"] = False
+
+    def _company_lock(self, company_id: str) -> threading.Lock:
+        with self._lock:
+            return self._company_locks.setdefault(company_id, threading.Lock())
+
+    def index_for(self, company_id: str) -> BM25Index:
+        version = self._version(company_id)
+        with self._lock:
+            entry = self._indexes.get(company_id)
+        if entry is None:
+            with self._company_lock(company_id):  # One build per company, concurrent first queries wait for it
+                with self._lock:
+                    entry = self._indexes.get(company_id)
+                if entry is None:
+                    with trace_stage("bm25_build"):
+                        return self._build(company_id, version)
+        if entry["version"] != version and not entry["building"]:
+            entry["building"] = True
+            threading.Thread(target=self._rebuild, args=(company_id, version, entry), name=f"bm25-{company_id}", daemon=True).start()
+        return entry["index"]
+
+    def index_documents(self, company_id: str, ids, documents, metadatas):
+        """Add/replace documents in the company's index, if that index is loaded in this process."""
+        with self._lock:
+            entry = self._indexes.get(company_id)
+        if entry is None:
+            return
+        for doc_id, text, meta in zip(ids, documents, metadatas):
+            entry["index"].add(doc_id, text, meta)
+
+    def remove_documents(self, company_id: str, ids):
+        with self._lock:
+            entry = self._indexes.get(company_id)
+        if entry is not None:
+            for doc_id in ids:
+                entry["index"].remove(doc_id)
+
+    def search(self, query: str, company_id: str, dense: Dict[str, List], k: int, predicate=None, candidates: int = HYBRID_CANDIDATES) -> List[Dict[str, Any]]:
+        """
+        Fuse a Chroma query result (single query: ids/documents/metadatas/distances lists)
+        with BM25 hits. Returns the top-k hits as {id, document, meta, distance, score, sources}.
+        """
+        index = self.index_for(company_id)
+        with trace_stage("bm25_query"):
+            lexical = index.search(query, candidates, predicate)
+
+        hits: Dict[str, Dict[str, Any]] = {}
+        for doc_id, doc, meta, dist in zip(dense["ids"], dense["documents"], dense["metadatas"], dense["distances"]):
+            hits[doc_id] = {"id": doc_id, "document": doc, "meta": meta, "distance": dist, "sources": ["dense"]}
+        for doc_id, _ in lexical:
+            if doc_id in hits:
+                hits[doc_id]["sources"].append("bm25")
+            else:
+                doc = index.docs[doc_id]
+                hits[doc_id] = {"id": doc_id, "document": doc["text"], "meta": doc["meta"], "distance": None, "sources": ["bm25"]}
+
+        fused = rrf_fuse([list(dense["ids"]), [doc_id for doc_id, _ in lexical]], self.rrf_k)
+        ranked = []
+        for doc_id, score in fused:
+            hits[doc_id]["score"] = round(score, 6)
+            ranked.append(hits[doc_id])
+
+        if self.rerank and ranked:
+            ranked = rerank(query, ranked[:RERANKER_TOP_N]) + ranked[RERANKER_TOP_N:]
+        return ranked[:k]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "companies": len(self._indexes),
+                "documents": sum(len(e["index"]) for e in self._indexes.values()),
+                "builds": self.builds,
+            }
+
+
+get_hybrid_retriever = lazy(HybridRetriever)
+get_reranker = lazy(get_reranker_model)
+
+
+def rerank(query: str, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Order hits by cross-encoder relevance (one batched CPU pass)."""
+    with trace_stage("rerank"):
+        scores = get_reranker().predict([(query, h["document"]) for h in hits], batch_size=RERANKER_BATCH_SIZE)
+    for h, s in zip(hits, scores):
+        h["rerank_score"] = float(s)
+    return sorted(hits, key=lambda h: h["rerank_score"], reverse=True)
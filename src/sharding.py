@@ -0,0 +1,121 @@
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import get_chroma_client, get_collection, CHROMA_COLLECTION_NAME, CHROMA_SHARDED_COLLECTIONS, CHROMA_MIGRATION_BATCH_SIZE
+from .concurrency import get_fanout_executor
+
+DOC_TYPES = ("interaction", "report_chunk")
+
+_collections: Dict[str, Any] = {}
+_collections_lock = threading.Lock()
+
+
+def collection_name(company_id: str, doc_type: str) -> str:
+    """Chroma name of a company's collection for one doc_type (only [a-zA-Z0-9._-], alphanumeric at both ends)."""
+    company = re.sub(r"[^a-zA-Z0-9._-]", "-", str(company_id)).strip("._-")
+    return f"{CHROMA_COLLECTION_NAME}__{company}__{doc_type}"
+
+
+def collection_for(company_id: str, doc_type: str, sharded: Optional[bool] = None):
+    """The collection that holds (and receives) a company's documents of doc_type."""
+    if not (CHROMA_SHARDED_COLLECTIONS if sharded is None else sharded):
+        return get_collection()
+    name = collection_name(company_id, doc_type)
+    with _collections_lock:
+        collection = _collections.get(name)
+        if collection is None:
+            collection = _collections[name] = get_chroma_client().get_or_create_collection(name=name)
+    return collection
+
+
+def collections_for(company_id: str, doc_type: Optional[str] = None, sharded: Optional[bool] = None) -> List[Any]:
+    """Collections to search for a company: one for a doc_type, all of them for None (just the shared one unsharded)."""
+    if not (CHROMA_SHARDED_COLLECTIONS if sharded is None else sharded):
+        return [get_collection()]
+    return [collection_for(company_id, t, sharded=True) for t in ((doc_type,) if doc_type else DOC_TYPES)]
+
+
+def reset_collections():
+    """Forget the cached collection handles (e.g. after switching Chroma clients)."""
+    with _collections_lock:
+        _collections.clear()
+
+
+def query_collections(collections: List[Any], query_embedding, n_results: int, where: Dict[str, Any]) -> Dict[str, List]:
+    """
+    One embedding against one or more collections, merged by distance: a single query
+    result shaped like Chroma's (ids/documents/metadatas/distances lists).
+    """
+    def query(collection):
+        return collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            where=where,
+            include=["documents", "metadatas", "distances"]
+        )
+
+    # Shards are independent: query them in parallel
+    results = [query(collections[0])] if len(collections) == 1 else list(get_fanout_executor().map(query, collections))
+    merged: List[Tuple[float, str, str, Dict[str, Any]]] = []
+    for res in results:
+        docs = res["documents"][0]
+        dists = res.get("distances", [[None]*len(docs)])[0]
+        merged += zip(dists, res["ids"][0], docs, res["metadatas"][0])
+    if len(collections) > 1:
+        merged.sort(key=lambda hit: float("inf") if hit[0] is None else hit[0])
+        merged = merged[:n_results]
+    return {
+        "ids": [h[1] for h in merged],
+        "documents": [h[2] for h in merged],
+        "metadatas": [h[3] for h in merged],
+        "distances": [h[0] for h in merged],
+    }
+
+
+def migrate_to_sharded_collections(batch_size: int = CHROMA_MIGRATION_BATCH_SIZE, delete_source: bool = False, source=None) -> Dict[str, Any]:
+    """
+    Copy every document (with its embedding) of the shared collection into the per-company,
+    per-doc_type collections, batch_size documents per read and one upsert per target per batch.
+    Idempotent (ids are kept, writes are upserts), so an interrupted migration can be rerun.
+    The shared collection is only emptied with delete_source=True, after all copies succeeded.
+    """
+    source = source or get_collection()
+    copied: Counter = Counter()
+    skipped = 0
+    offset = 0
+    while True:
+        res = source.get(include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=offset)
+        ids = res.get("ids") or []
+        groups: Dict[Tuple[str, str], Dict[str, List]] = {}
+        for doc_id, doc, meta, emb in zip(ids, res["documents"], res["metadatas"], res["embeddings"]):
+            meta = meta or {}
+            if not meta.get("company_id") or meta.get("doc_type") not in DOC_TYPES:
+                skipped += 1
+                continue
+            group = groups.setdefault((meta["company_id"], meta["doc_type"]), {"ids": [], "documents": [], "metadatas": [], "embeddings": []})
+            group["ids"].append(doc_id)
+            group["documents"].append(doc)
+            group["metadatas"].append(meta)
+            group["embeddings"].append(emb)
+        for (company_id, doc_type), group in groups.items():
+            collection_for(company_id, doc_type, sharded=True).upsert(**group)
+            copied[collection_name(company_id, doc_type)] += len(group["ids"])
+        print(f"🚚 Migrated {offset + len(ids)} documents ({sum(copied.values())} copied, {skipped} skipped)")
+        if len(ids) < batch_size:
+            break
+        offset += batch_size
+
+    for name, n in copied.items():  # Verify before anything is deleted
+        count = get_chroma_client().get_collection(name=name).count()
+        if count < n:
+            raise RuntimeError(f"Collection {name} holds {count} documents, expected at least {n}")
+
+    if delete_source and skipped:
+        print(f"⚠️ Keeping the shared collection {source.name}: {skipped} documents without company_id/doc_type were not migrated")
+    elif delete_source and copied:
+        get_chroma_client().delete_collection(name=source.name)
+        get_collection.reset()
+        print(f"🗑️ Deleted the shared collection {source.name}")
+    return {"copied": dict(copied), "total": sum(copied.values()), "skipped": skipped}
@@ -1,10 +1,25 @@
+import time
 import hashlib
 from typing import Any, Dict, List
 from json2markdown import convert_json_to_markdown_document as json2md
 from langchain_text_splitters import RecursiveCharacterTextSplitter, MarkdownHeaderTextSplitter
 from langchain_core.documents import Document
 
-from config import SUPABASE, COLLECTION, CHUNK_SIZE, CHUNK_OVERLAP
+from config import get_supabase, CHUNK_SIZE, CHUNK_OVERLAP, DATA_VERSIONS_TABLE, CHROMA_UPSERT_BATCH_SIZE
+from .get.tenants import get_tenant_directory
+from .retrieval import get_hybrid_retriever
+from .vector_cache import get_report_vector_cache
+from .sharding import collection_for
+from .embed import embed_texts
+
+# Built once: both splitters only hold their configuration
+_SECTION_SPLITTER = MarkdownHeaderTextSplitter(
+    headers_to_split_on=[("#", "section_title")]  # Only split on level-1 headers ('#') – add ('##', 'Subsection') etc. if you want deeper
+)
+_CHUNK_SPLITTER = RecursiveCharacterTextSplitter(
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=CHUNK_OVERLAP,
+)
 
 def interaction_id(talking_product_id: str, date: str, time: str, question: str) -> str:
     q_hash = hashlib.md5(question.encode("utf-8")).hexdigest()
@@ -14,21 +29,38 @@ def report_chunk_id(talking_product_id: str, report_type: str, date_key: str, ch
     # date_key could be "2025-12-15" for daily or "2025-12-01_2025-12-31" for ranges
     return f"r_{talking_product_id}_{report_type}_{date_key}_c{chunk_idx:03d}"
 
-def update_db_interactions(data, company_id=None, talking_product_id=None):
-    """Insert interactions into Supabase and Chroma Cloud."""
+def bump_data_version(company_id=None, talking_product_id=None):
+    """
+    Mark a company's data as changed, so answer/result caches built on the old data are invalidated.
+    The version is a nanosecond timestamp: monotonic enough, and no read-modify-write needed.
+    """
+    try:
+        if company_id is None and talking_product_id is not None:
+            company_id = get_tenant_directory().company_of_product(talking_product_id)
+        if company_id is None:
+            return
+        get_supabase().table(DATA_VERSIONS_TABLE).upsert(
+            {"company_id": company_id, "version": time.time_ns()}, on_conflict="company_id"
+        ).execute()
+    except Exception as e:
+        print(f"⚠️ Error bumping data version for company {company_id}: {e}")
+
+def interaction_records(data, company_id=None, talking_product_id=None):
+    """The logs of data as Chroma records: (ids, documents, metadatas, embeddings)."""
+    ids, documents, metadatas, embeddings = [], [], [], []
     for log in data["logs"]:
         Q = log["question"]
         A = log["answer"]
         S = log["match_score"]
         D = log["date"]
         T = log["time"]
-        # L = log["language"]
+        L = log.get("language")
         E = log["embedding"]
 
         # 1️⃣ Supabase insert (Relational DB)
         # Commented out since we now have Prifina's ingestion!
         # try:
-        #     SUPABASE.table("interactions").insert({
+        #     get_supabase().table("interactions").insert({
         #         "date": D,
         #         "time": T,
         #         "question": Q,
@@ -40,34 +72,61 @@ def update_db_interactions(data, company_id=None, talking_product_id=None):
         # except Exception as e:
         #     print(f"⚠️ Duplicate or error: {Q[:30]}... {e}")
 
-        # 2️⃣ Chroma Cloud (Vector DB)
-        COLLECTION.upsert(
-            ids=[interaction_id(talking_product_id, D, T, Q)],
-            documents=[f"Q: {Q}\nA: {A}"],   # better than Q alone
-            metadatas=[{
-                "doc_type": "interaction",
-                "company_id": company_id,
-                "talking_product_id": talking_product_id,
-                "date": D,
-                "time": T,
-                "match_score": S,
-                # "language": L
-            }],
-            embeddings=[E]
+        # 2️⃣ Chroma Cloud (Vector DB), collected and upserted in batches by _store_interactions
+        ids.append(interaction_id(talking_product_id, D, T, Q))
+        documents.append(f"Q: {Q}\nA: {A}")   # better than Q alone
+        metadata = {
+            "doc_type": "interaction",
+            "company_id": company_id,
+            "talking_product_id": talking_product_id,
+            "date": D,
+            "time": T,
+            "match_score": S,
+        }
+        if L:
+            metadata["language"] = L  # Chroma metadata can't hold None
+        metadatas.append(metadata)
+        embeddings.append(E)
+    return _dedupe_ids(ids, documents, metadatas, embeddings)
+
+def _dedupe_ids(ids, documents, metadatas, embeddings):
+    # Chroma rejects duplicate ids within one call: keep the last occurrence (what per-row upserts did)
+    last = {doc_id: i for i, doc_id in enumerate(ids)}
+    if len(last) < len(ids):
+        keep = sorted(last.values())
+        ids, documents, metadatas, embeddings = ([xs[i] for i in keep] for xs in (ids, documents, metadatas, embeddings))
+    return ids, documents, metadatas, embeddings
+
+def _store_interactions(company_id: str, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]], embeddings):
+    """Upsert interaction records of one company to Chroma (in batches) and mirror them into the keyword index."""
+    collection = collection_for(company_id, "interaction")
+    for start in range(0, len(ids), CHROMA_UPSERT_BATCH_SIZE):
+        end = start + CHROMA_UPSERT_BATCH_SIZE
+        collection.upsert(
+            ids=ids[start:end],
+            documents=documents[start:end],
+            metadatas=metadatas[start:end],
+            embeddings=embeddings[start:end]
         )
-        
+
+    # 3️⃣ Keyword index, if this process serves hybrid retrieval
+    if get_hybrid_retriever.is_loaded():
+        get_hybrid_retriever().index_documents(company_id, ids, documents, metadatas)
+
+def update_db_interactions(data, company_id=None, talking_product_id=None, bump_version=True):
+    """
+    Insert interactions into Supabase and Chroma Cloud (upserted in batches of CHROMA_UPSERT_BATCH_SIZE).
+    bump_version=False leaves the data version bump to the caller (e.g. once after a chunked ingest).
+    """
+    ids, documents, metadatas, embeddings = interaction_records(data, company_id, talking_product_id)
+    _store_interactions(company_id, ids, documents, metadatas, embeddings)
+    if bump_version:
+        bump_data_version(company_id, talking_product_id)
     print(f"✅ Stored {len(data['logs'])} questions in both Relational and Vector DB for {data['date']}")
     return
 
-def upsert_report_to_chroma(
-    report: Any,
-    company_id: str,
-    talking_product_id: str,
-    report_type: str,
-    date: str,
-    embed_fn,
-    date_range: tuple = None
-):
+def report_chunks(report: Any, company_id: str, talking_product_id: str, report_type: str, date: str, date_range: tuple = None):
+    """A report split into Chroma chunks: (ids, documents, metadatas)."""
     # 1) Convert pydantic/dict → plain dict for json2md
     r = report.model_dump() if hasattr(report, "model_dump") else report
 
@@ -75,11 +134,7 @@ def upsert_report_to_chroma(
     md_report: str = json2md(r)
 
     # 3) Use LangChain's MarkdownHeaderTextSplitter to split by headers
-    # Only split on level-1 headers ('#') – add ('##', 'Subsection') etc. if you want deeper
-    md_splitter = MarkdownHeaderTextSplitter(
-        headers_to_split_on=[("#", "section_title")]
-    )
-    md_docs: List[Document] = md_splitter.split_text(md_report)
+    md_docs: List[Document] = _SECTION_SPLITTER.split_text(md_report)
 
     # 4) Add base metadata
     base_metadata: Dict[str, Any] = {
@@ -106,42 +161,106 @@ def upsert_report_to_chroma(
         metadatas.append(meta)
 
     # 5) Recursive splitter per section (won't split if below CHUNK_SIZE)
-    recursive_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-    )
-    docs: List[Document] = recursive_splitter.create_documents(
+    docs: List[Document] = _CHUNK_SPLITTER.create_documents(
         texts=texts,
         metadatas=metadatas,
     )
 
-    # 6) Prepare ids, contents, metadata, embeddings
-    ids: List[str] = []
-    documents: List[str] = []
-    metadatas_for_chroma: List[Dict[str, Any]] = []
-    embeddings: List[List[float]] = []
-
-    for idx, doc in enumerate(docs):
-        ids.append(report_chunk_id(talking_product_id, report_type, date, idx))
-        documents.append(doc.page_content)
-        metadatas_for_chroma.append(doc.metadata)
-        if embed_fn:
-            embeddings.append(embed_fn(doc.page_content))
-
-    COLLECTION.upsert(
-        ids=ids,
-        documents=documents,
-        metadatas=metadatas_for_chroma,
-        embeddings=embeddings if embeddings else None,
-    )
+    # 6) Prepare ids, contents, metadata (with a content hash, so unchanged chunks aren't re-embedded)
+    ids = [report_chunk_id(talking_product_id, report_type, date, idx) for idx in range(len(docs))]
+    for doc in docs:
+        doc.metadata["content_hash"] = chunk_hash(doc.page_content, doc.metadata.get("section_title"))
+    return ids, [doc.page_content for doc in docs], [doc.metadata for doc in docs]
+
+def chunk_hash(text: str, section_title: str = None) -> str:
+    return hashlib.md5(f"{section_title}\n{text}".encode("utf-8")).hexdigest()
+
+def _store_report_chunks(company_id: str, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]], embeddings=None):
+    """Upsert report chunks of one company to Chroma (in batches) and mirror them into the in-process indexes."""
+    collection = collection_for(company_id, "report_chunk")
+    for start in range(0, len(ids), CHROMA_UPSERT_BATCH_SIZE):
+        end = start + CHROMA_UPSERT_BATCH_SIZE
+        collection.upsert(
+            ids=ids[start:end],
+            documents=documents[start:end],
+            metadatas=metadatas[start:end],
+            embeddings=embeddings[start:end] if embeddings is not None and len(embeddings) else None,
+        )
+    if get_hybrid_retriever.is_loaded():
+        get_hybrid_retriever().index_documents(company_id, ids, documents, metadatas)
+    if get_report_vector_cache.is_loaded():
+        if embeddings is not None and len(embeddings):
+            get_report_vector_cache().upsert(company_id, ids, documents, metadatas, embeddings)
+        else:
+            get_report_vector_cache().invalidate(company_id)  # Chroma embedded them itself: reload from there
 
-def update_db_reports(data, report, embed_fn, report_type="daily", company_id=None, talking_product_id=None, date_range=None):
+def _delete_report_chunks(company_id: str, ids: List[str]):
+    """Delete report chunks of one company from Chroma (one call) and from the in-process indexes."""
+    collection_for(company_id, "report_chunk").delete(ids=ids)
+    if get_hybrid_retriever.is_loaded():
+        get_hybrid_retriever().remove_documents(company_id, ids)
+    if get_report_vector_cache.is_loaded():
+        get_report_vector_cache().remove(company_id, ids)
+
+def _stored_chunk_hashes(company_id: str, reports) -> Dict[str, str]:
     """
-    Save the generated daily report into the Relational database.
-    data is the dict from parse_email()
-    report is the markdown string generated by the LLM
-    report_type is one of "daily", "weekly", "monthly" or "aggregated"
+    {chunk id: content hash} of the chunks stored for reports [(talking_product_id, report_type, date)]
+    (one Chroma get). Chunks stored before content hashes existed map to None.
+    """
+    prefixes = {report_chunk_id(tp, report_type, date, 0)[:-3] for tp, report_type, date in reports}  # "r_<tp>_<type>_<date>_c"
+    clauses = [
+        {"doc_type": "report_chunk"},
+        {"report_type": {"$in": sorted({report_type for _, report_type, _ in reports})}},
+        {"date": {"$in": sorted({date for _, _, date in reports})}},
+    ]
+    # Scope the get to these reports' owners: the shared collection holds every company's chunks
+    # (None isn't a stored metadata value, so unowned reports rely on the id prefix check alone)
+    if company_id is not None:
+        clauses.append({"company_id": company_id})
+    talking_product_ids = {tp for tp, _, _ in reports}
+    if None not in talking_product_ids:
+        clauses.append({"talking_product_id": {"$in": sorted(talking_product_ids)}})
+    got = collection_for(company_id, "report_chunk").get(where={"$and": clauses}, include=["metadatas"])
+    return {
+        doc_id: (meta or {}).get("content_hash")
+        for doc_id, meta in zip(got["ids"], got["metadatas"])
+        if doc_id[:doc_id.rindex("_c") + 2] in prefixes
+    }
+
+def _sync_report_chunks(company_id: str, reports, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]], embed_many=embed_texts) -> Dict[str, int]:
+    """
+    Bring the stored chunks of reports [(talking_product_id, report_type, date)] of one company in line with
+    their new chunks: only new or changed chunks (by content hash) are embedded (in one batch) and upserted,
+    and chunks the reports no longer have (a shorter regenerated report) are deleted in one call.
+    embed_many=None lets Chroma embed the chunks. Returns chunk counts.
     """
+    stored = _stored_chunk_hashes(company_id, reports)
+    changed = [i for i, (doc_id, meta) in enumerate(zip(ids, metadatas)) if stored.get(doc_id) != meta["content_hash"]]
+    if changed:
+        changed_documents = [documents[i] for i in changed]
+        embeddings = embed_many(changed_documents) if embed_many else None
+        _store_report_chunks(company_id, [ids[i] for i in changed], changed_documents, [metadatas[i] for i in changed], embeddings)
+    current = set(ids)
+    orphans = [doc_id for doc_id in stored if doc_id not in current]
+    if orphans:
+        _delete_report_chunks(company_id, orphans)
+    return {"chunks": len(ids), "upserted": len(changed), "deleted": len(orphans)}
+
+def upsert_report_to_chroma(
+    report: Any,
+    company_id: str,
+    talking_product_id: str,
+    report_type: str,
+    date: str,
+    embed_many=embed_texts,
+    date_range: tuple = None
+):
+    """Store a report's chunks in Chroma, re-embedding only chunks that changed since the stored version."""
+    ids, documents, metadatas = report_chunks(report, company_id, talking_product_id, report_type, date, date_range)
+    return _sync_report_chunks(company_id, [(talking_product_id, report_type, date)], ids, documents, metadatas, embed_many)
+
+def report_payload(data, report, report_type="daily", company_id=None, talking_product_id=None, date_range=None) -> Dict[str, Any]:
+    """The Supabase row of a report in the report_type table."""
     # Base fields shared by all report tables
     payload = {
         "date": data["date"],
@@ -149,7 +268,7 @@ def update_db_reports(data, report, embed_fn, report_type="daily", company_id=No
         "average_match": data["average_match"],
         "complete_misses": data["complete_misses"],
         "complete_misses_rate": data["complete_misses_rate"],
-        "report": report.model_dump(),
+        "report": report.model_dump() if hasattr(report, "model_dump") else report,
         "talking_product_id": talking_product_id
     }
 
@@ -157,13 +276,56 @@ def update_db_reports(data, report, embed_fn, report_type="daily", company_id=No
     if report_type == "aggregated":
         payload["date_range"] = date_range
         payload["company_id"] = company_id
+    return payload
+
+def update_db_reports(data, report, embed_many=embed_texts, report_type="daily", company_id=None, talking_product_id=None, date_range=None):
+    """
+    Save the generated daily report into the Relational database.
+    data is the dict from parse_email()
+    report is the markdown string generated by the LLM
+    report_type is one of "daily", "weekly", "monthly" or "aggregated"
+    Returns whether the report was saved (False if the Supabase upsert failed).
+    """
+    payload = report_payload(data, report, report_type, company_id, talking_product_id, date_range)
 
     # Insert or replace the report
     try:
-        SUPABASE.table(report_type).upsert(payload).execute()
+        get_supabase().table(report_type).upsert(payload).execute()
     except Exception as e:
         print(f"⚠️ Error saving report for {data['date']}: {e}")
-        return
-    upsert_report_to_chroma(report, company_id, talking_product_id, report_type, data['date'], embed_fn, date_range)
+        return False
+    upsert_report_to_chroma(report, company_id, talking_product_id, report_type, data['date'], embed_many, date_range)
+    bump_data_version(company_id, talking_product_id)
     print(f"✅ Saved report for {data['date']}")
-    return
+    return True
+
+def update_db_reports_bulk(items, report_type="daily", embed_many=embed_texts):
+    """
+    Save many reports of one report_type ("daily", "weekly" or "monthly") at once, e.g. a backfill:
+    one Supabase upsert for all rows, one batched embedding pass over the new or changed report chunks,
+    batched Chroma upserts per company and one data version bump per company.
+    items: [(data, report, company_id, talking_product_id)]. embed_many=None lets Chroma embed the chunks.
+    Returns the number of reports saved.
+    """
+    if not items:
+        return 0
+    payloads = [report_payload(data, report, report_type, talking_product_id=talking_product_id) for data, report, _, talking_product_id in items]
+    try:
+        get_supabase().table(report_type).upsert(payloads).execute()
+    except Exception as e:
+        print(f"⚠️ Error saving {len(payloads)} {report_type} reports: {e}")
+        return 0
+
+    chunks: Dict[str, Dict[str, List]] = {}
+    for data, report, company_id, talking_product_id in items:
+        ids, documents, metadatas = report_chunks(report, company_id, talking_product_id, report_type, data["date"])
+        group = chunks.setdefault(company_id, {"reports": [], "ids": [], "documents": [], "metadatas": []})
+        group["reports"].append((talking_product_id, report_type, data["date"]))
+        group["ids"] += ids
+        group["documents"] += documents
+        group["metadatas"] += metadatas
+    for company_id, group in chunks.items():
+        _sync_report_chunks(company_id, **group, embed_many=embed_many)
+        bump_data_version(company_id)
+    print(f"✅ Saved {len(payloads)} {report_type} reports")
+    return len(payloads)
@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import uuid
+import threading
+from collections import Counter as _StackCounter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from config import RUN_REPORTS_DIR, TRACE_SLOW_REQUEST_SECONDS, TRACE_PROFILE_SLOW_REQUESTS, TRACE_PROFILE_INTERVAL_MS
+from .lazy import lazy
+from .metrics import HTTP_REQUESTS, HTTP_SECONDS, STAGE_SECONDS, STAGE_ERRORS, SLOW_REQUESTS
+
+
+class RequestTrace:
+    """Trace id and stage timings of one request. Stages may run concurrently (e.g. embedding + version lookup)."""
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.stages: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float, error: bool = False):
+        with self._lock:
+            self.stages.append({"stage": stage, "s": seconds, "error": error})
+
+    def breakdown(self) -> Dict[str, float]:
+        """Total seconds per stage name (a stage that ran twice is summed)."""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for s in self.stages:
+                totals[s["stage"]] = totals.get(s["stage"], 0.0) + s["s"]
+        return totals
+
+    def format(self) -> str:
+        return " ".join(f"{stage}={s:.3f}s" for stage, s in self.breakdown().items())
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def trace_log(message: str):
+    """print() prefixed with the current request's trace id (if any)."""
+    trace = current_trace()
+    print(f"[trace {trace.trace_id}] {message}" if trace else message)
+
+
+@contextmanager
+def trace_stage(name: str):
+    """
+    Time a block as a named stage: always recorded in the stage histogram, and in the
+    current request trace when there is one. Works in sync code, async code and in the
+    thread pool (run_blocking copies the context).
+    """
+    t0 = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        STAGE_ERRORS.inc(name)
+        raise
+    finally:
+        seconds = time.perf_counter() - t0
+        STAGE_SECONDS.observe(seconds, name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, seconds, error)
+
+
+class SamplingProfiler:
+    """
+    Opt-in stack sampler for slow requests. While requests are in flight, a background thread
+    samples all thread stacks every interval_ms; when a request turns out slower than the
+    threshold, the samples taken during its lifetime are written as folded stacks
+    (flamegraph.pl / speedscope format). Samples are process-wide, so concurrent requests
+    show up in each other's profiles.
+    """
+
+    def __init__(self, interval_ms: float = TRACE_PROFILE_INTERVAL_MS, out_dir: str = os.path.join(RUN_REPORTS_DIR, "profiles")):
+        self.interval_s = interval_ms / 1000
+        self.out_dir = out_dir
+        self._active: Dict[str, _StackCounter] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        threading.Thread(target=self._run, name="trace-sampler", daemon=True).start()
+
+    def start(self, trace_id: str):
+        with self._lock:
+            self._active[trace_id] = _StackCounter()
+        self._wake.set()
+
+    def stop(self, trace_id: str, keep: bool) -> Optional[str]:
+        with self._lock:
+            samples = self._active.pop(trace_id, None)
+        if not keep or not samples:
+            return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"{trace_id}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in samples.most_common():
+                f.write(f"{stack} {n}\n")
+        return path
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            self._wake.wait()
+            with self._lock:
+                if not self._active:
+                    self._wake.clear()
+                    continue
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks.append(";".join([names.get(ident, str(ident))] + frames[::-1]))
+            with self._lock:
+                for counter in self._active.values():
+                    counter.update(stacks)
+            time.sleep(self.interval_s)
+
+
+get_sampling_profiler = lazy(SamplingProfiler)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware: gives every HTTP request a trace id (the X-Request-ID header if sent),
+    returns it as X-Trace-Id, records request count/latency metrics and logs the stage
+    breakdown once the last body byte is sent, so streamed responses are measured in full.
+    """
+
+    def __init__(self, app, slow_seconds: float = TRACE_SLOW_REQUEST_SECONDS, profile_slow: bool = TRACE_PROFILE_SLOW_REQUESTS, skip_paths=("/metrics",)):
+        self.app = app
+        self.slow_seconds = slow_seconds
+        self.profile_slow = profile_slow
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        trace = RequestTrace(headers.get(b"x-request-id", b"").decode("latin-1")[:64] or None)
+        token = _current_trace.set(trace)
+        profiler = get_sampling_profiler() if self.profile_slow else None
+        if profiler:
+            profiler.start(trace.trace_id)
+        state = {"status": 500, "done": False}
+
+        def finish():
+            if state["done"]:
+                return
+            state["done"] = True
+            seconds = time.perf_counter() - trace.started
+            route = getattr(scope.get("route"), "path", None) or "unmatched"  # Route templates keep label cardinality bounded
+            HTTP_REQUESTS.inc(scope["method"], route, str(state["status"]))
+            HTTP_SECONDS.observe(seconds, scope["method"], route)
+            slow = seconds >= self.slow_seconds
+            profile_path = profiler.stop(trace.trace_id, keep=slow) if profiler else None
+            if slow:
+                SLOW_REQUESTS.inc(route)
+            line = f"[trace {trace.trace_id}] {scope['method']} {route} {state['status']} {seconds:.3f}s | {trace.format()}"
+            if slow:
+                line = f"🐢 slow request {line}" + (f" | profile {profile_path}" if profile_path else "")
+            print(line)
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-trace-id", trace.trace_id.encode("latin-1"))]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            finish()
+            _current_trace.reset(token)
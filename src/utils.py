@@ -1,30 +1,142 @@
 import re
 import csv
-import langid
-import hdbscan
 import tiktoken
 import numpy as np
 from datetime import datetime
 from collections import Counter
 from typing import List, Dict, Any
-from sklearn.metrics.pairwise import euclidean_distances
 
-from config import LANG_CONFIDENCE_THRESHOLD, TOKEN_ENCODING_MODEL, CONTEXT_WINDOW, MIN_TOKENS_PER_CLUSTER
+from config import TOKEN_ENCODING_MODEL, CONTEXT_WINDOW, MIN_TOKENS_PER_CLUSTER, CSV_CHUNK_SIZE
 from .get.templates import get_daily_prompt, get_context
+from .language import detect_languages
 
 
-def parse_csv_logs(csv_path, min_date_exclusive=None):
-    """
-    Read Talking Product CSV logs and produce the same aggregated data structure
-    as parse_email(), but allow multiple dates inside one CSV.
+CSV_DATETIME_FORMAT = "%d/%m/%Y, %H:%M:%S"
+_CSV_DATETIME_WIDTH = 20  # "31/12/2025, 23:59:59"
 
-    If min_date_exclusive is provided (datetime.date), any CSV rows whose date
-    is <= min_date_exclusive will be ignored.
+
+def parse_csv_datetimes(values: List[str]):
+    """
+    Vectorized parsing of the CSV "Date/Time" column.
+    Returns (dates "YYYY-MM-DD", times "HH:MM:SS", days as datetime64[D]) numpy arrays.
+    Values that are not in the zero-padded CSV_DATETIME_FORMAT fall back to strptime.
     """
-    complete_misses = 0
-    accumulated_match = 0
+    raw = np.char.strip(np.asarray(values, dtype=str))
+    fixed = np.char.str_len(raw) == _CSV_DATETIME_WIDTH
+    chars = np.asarray(raw[fixed], dtype=f"U{_CSV_DATETIME_WIDTH}").view("U1").reshape(-1, _CSV_DATETIME_WIDTH)
+    # Reorder the characters "dd/mm/YYYY, HH:MM:SS" -> "YYYY-mm-dd" with a dash column in between
+    dash = np.full((len(chars), 1), "-", dtype="U1")
+    dates = np.empty(len(raw), dtype="U10")
+    times = np.empty(len(raw), dtype="U8")
+    dates[fixed] = np.hstack([chars[:, 6:10], dash, chars[:, 3:5], dash, chars[:, 0:2]]).copy().view("U10").ravel()
+    times[fixed] = np.ascontiguousarray(chars[:, 12:20]).view("U8").ravel()
+
+    ok = fixed.copy()
+    days = np.full(len(raw), np.datetime64("NaT"), dtype="datetime64[D]")
+    if len(chars):
+        # Layout, digits and ranges per row (what strptime checks); only rows failing them take the slow path
+        sep_ok = (chars[:, 2] == "/") & (chars[:, 5] == "/") & (chars[:, 10] == ",") & (chars[:, 11] == " ") & (chars[:, 14] == ":") & (chars[:, 17] == ":")
+        digit_cols = [0, 1, 3, 4, 6, 7, 8, 9, 12, 13, 15, 16, 18, 19]
+        is_digit = (chars >= "0") & (chars <= "9")
+        digits_ok = is_digit[:, digit_cols].all(axis=1)
+        n = np.where(is_digit, chars, "0").astype(np.int64)
+        day, month, year = n[:, 0] * 10 + n[:, 1], n[:, 3] * 10 + n[:, 4], n[:, 6] * 1000 + n[:, 7] * 100 + n[:, 8] * 10 + n[:, 9]
+        hour, minute, second = n[:, 12] * 10 + n[:, 13], n[:, 15] * 10 + n[:, 16], n[:, 18] * 10 + n[:, 19]
+        month_ok = (year >= 1) & (month >= 1) & (month <= 12)
+        first = ((np.where(month_ok, year, 1970) - 1970) * 12 + np.where(month_ok, month, 1) - 1).astype("datetime64[M]")
+        month_days = ((first + 1).astype("datetime64[D]") - first.astype("datetime64[D]")).astype(np.int64)
+        day_ok = month_ok & (day >= 1) & (day <= month_days)  # Rejects impossible dates like 31/02
+        time_ok = (hour <= 23) & (minute <= 59) & (second <= 59)
+        ok[fixed] = sep_ok & digits_ok & day_ok & time_ok
+        days[ok] = dates[ok].astype("datetime64[D]")
+    for i in np.flatnonzero(~ok):  # Odd rows (e.g. unpadded days): the original per-row parse
+        dt = datetime.strptime(str(raw[i]), CSV_DATETIME_FORMAT)
+        dates[i], times[i] = dt.strftime("%Y-%m-%d"), dt.strftime("%H:%M:%S")
+        days[i] = np.datetime64(dates[i], "D")
+    return dates, times, days
+
+
+def _parse_csv_scores(rows: List[Dict[str, str]]) -> np.ndarray:
+    raw = np.char.replace(np.char.strip(np.asarray([row["Score"] for row in rows], dtype=str)), "%", "")
+    try:
+        return raw.astype(float)
+    except ValueError:
+        for row, value in zip(rows, raw):
+            try:
+                float(value)
+            except ValueError:
+                print("SCORE PARSE ERROR:", value, row)
+                raise
+
+
+def new_log_totals() -> Dict[str, Any]:
+    return {"n_logs": 0, "accumulated_match": 0.0, "complete_misses": 0}
+
+
+def summarize_log_totals(totals: Dict[str, Any]) -> Dict[str, Any]:
+    """n_logs / average_match / complete_misses / complete_misses_rate from running totals."""
+    n_logs = totals["n_logs"]
+    return {
+        "n_logs": n_logs,
+        "average_match": round(totals["accumulated_match"] / n_logs, 2) if n_logs > 0 else 0,
+        "complete_misses": totals["complete_misses"],
+        "complete_misses_rate": round((totals["complete_misses"] / n_logs) * 100, 2) if n_logs > 0 else 0,
+    }
+
+
+def split_logs_by_day(logs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Group logs spanning several days into per-day data dicts (date, summary statistics, logs), keyed and ordered by date."""
+    by_day: Dict[str, List[Dict[str, Any]]] = {}
+    for log in logs:
+        by_day.setdefault(str(log["date"])[:10], []).append(log)
+    days = {}
+    for day in sorted(by_day):
+        totals = new_log_totals()
+        for log in by_day[day]:
+            totals["n_logs"] += 1
+            totals["accumulated_match"] += log["match_score"]
+            totals["complete_misses"] += log["match_score"] == 0
+        days[day] = {"date": day, **summarize_log_totals(totals), "logs": by_day[day]}
+    return days
+
+
+def _parse_csv_chunk(rows: List[Dict[str, str]], min_date_exclusive, totals: Dict[str, Any]) -> List[Dict[str, Any]]:
+    dates, times, days = parse_csv_datetimes([row["Date/Time"] for row in rows])
+    keep = np.ones(len(rows), dtype=bool)
+    if min_date_exclusive is not None:
+        keep = days > np.datetime64(min_date_exclusive, "D")  # Already-processed dates are skipped
+    scores = _parse_csv_scores(rows)
+
+    kept = scores[keep]
+    totals["n_logs"] += int(keep.sum())
+    totals["accumulated_match"] += float(kept.sum())
+    totals["complete_misses"] += int((kept == 0).sum())
+
+    kept_rows = np.flatnonzero(keep)
+    questions = [rows[i]["Statement"].strip() for i in kept_rows]
+    languages = detect_languages(questions)  # One deduplicated, cached batch per chunk
     logs = []
+    for i, question, language in zip(kept_rows, questions, languages):
+        logs.append(
+            {
+                "question": question,
+                "answer": rows[i]["Answer"].strip(),
+                "match_score": float(scores[i]),
+                "date": str(dates[i]),
+                "time": str(times[i]),
+                "language": language,
+            }
+        )
+    return logs
+
 
+def iter_csv_log_chunks(csv_path, min_date_exclusive=None, chunk_size: int = CSV_CHUNK_SIZE, totals: Dict[str, Any] | None = None):
+    """
+    Stream Talking Product CSV logs as lists of up to chunk_size parsed logs (same fields
+    as parse_csv_logs), reading the file incrementally. Rows dated <= min_date_exclusive
+    are skipped. Pass totals (new_log_totals()) to keep running n_logs/match/miss counts.
+    """
+    totals = totals if totals is not None else new_log_totals()
     with open(csv_path, mode="r", encoding="utf-8") as f:
         reader = csv.DictReader(
             f,
@@ -33,57 +145,34 @@ def parse_csv_logs(csv_path, min_date_exclusive=None):
             escapechar="\\",
             skipinitialspace=True,
         )
-        rows = list(reader)
+        rows = []
+        for row in reader:
+            rows.append(row)
+            if len(rows) == chunk_size:
+                logs = _parse_csv_chunk(rows, min_date_exclusive, totals)
+                rows = []
+                if logs:
+                    yield logs
+        if rows:
+            logs = _parse_csv_chunk(rows, min_date_exclusive, totals)
+            if logs:
+                yield logs
 
-    # Build structure grouped by date
-    for row in rows:
-        datetime_str = row["Date/Time"].strip()
-        dt = datetime.strptime(datetime_str, "%d/%m/%Y, %H:%M:%S")
 
-        # Date used in DB: "YYYY-MM-DD"
-        date = dt.strftime("%Y-%m-%d")
-        time = dt.strftime("%H:%M:%S")
-
-        # Filter out already-processed dates: remove all rows with date <= latest date
-        if min_date_exclusive is not None:
-            if dt.date() <= min_date_exclusive:
-                continue  # skip this row entirely
-
-        question = row["Statement"].strip()
-        answer = row["Answer"].strip()
-        raw_score = row["Score"].strip().replace("%", "")
-        try:
-            match_score = float(raw_score)
-        except:
-            print("SCORE PARSE ERROR:", raw_score, row)
-            raise
-
-        if match_score == 0:
-            complete_misses += 1
-
-        accumulated_match += match_score
-
-        logs.append(
-            {
-                "question": question,
-                "answer": answer,
-                "match_score": match_score,
-                "date": date,
-                "time": time,
-                "language": detect_language(question),
-            }
-        )
+def parse_csv_logs(csv_path, min_date_exclusive=None):
+    """
+    Read Talking Product CSV logs and produce the same aggregated data structure
+    as parse_email(), but allow multiple dates inside one CSV.
 
-    n_logs = len(logs)
-    complete_misses_rate = round((complete_misses / n_logs) * 100, 2) if n_logs > 0 else 0
-    average_match = round(accumulated_match / n_logs, 2) if n_logs > 0 else 0
+    If min_date_exclusive is provided (datetime.date), any CSV rows whose date
+    is <= min_date_exclusive will be ignored.
+    """
+    totals = new_log_totals()
+    logs = [log for chunk in iter_csv_log_chunks(csv_path, min_date_exclusive, totals=totals) for log in chunk]
 
     data = {
         "date": datetime.today().strftime("%Y-%m-%d"),  # Timestamp of CSV ingestion
-        "n_logs": n_logs,
-        "average_match": average_match,
-        "complete_misses": complete_misses,
-        "complete_misses_rate": complete_misses_rate,
+        **summarize_log_totals(totals),
         "logs": logs,
     }
 
@@ -92,16 +181,10 @@ def parse_csv_logs(csv_path, min_date_exclusive=None):
 
 def detect_language(text: str):
     """
-    Detect language using langid.
+    Detect language using langid (see src/language.py; prefer detect_languages for many texts).
     Returns a 2-letter ISO code (e.g. 'nl', 'en', 'fr') or None if confidence is low.
     """
-    if not text or not text.strip():
-        return None
-
-    lang, prob = langid.classify(text)
-    if prob < LANG_CONFIDENCE_THRESHOLD:
-        return None
-    return lang
+    return detect_languages([text])[0]
 
 
 def cluster_questions(data, min_cluster_size=2):
@@ -123,7 +206,8 @@ def cluster_questions(data, min_cluster_size=2):
     # Extract embeddings
     X = np.array([log["embedding"] for log in logs])
 
-    # HDBSCAN clustering
+    # HDBSCAN clustering (imported here: hdbscan/sklearn take ~1s to import)
+    import hdbscan
     clusterer = hdbscan.HDBSCAN(min_cluster_size=min_cluster_size)
     labels = clusterer.fit_predict(X)
 
@@ -160,6 +244,8 @@ def get_representative_questions(indices, questions, embeddings):
     Returns:
       list of representative questions (1 or 2 strings)
     """
+    from sklearn.metrics.pairwise import euclidean_distances
+
     cluster_questions = [questions[i] for i in indices]
     cluster_embeddings = np.array([embeddings[i] for i in indices])
 
@@ -307,6 +393,7 @@ def rows_to_context(rows: List[Dict[str, Any]]) -> str:
         "question",
         "answer",
         "match_score",
+        "n_asked",
         "talking_product_id",
         "language",
         "name",
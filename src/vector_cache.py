@@ -0,0 +1,232 @@
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config import REPORT_VECTOR_CACHE_PAGE_SIZE
+from .lazy import lazy
+from .sharding import collection_for
+from .tracing import trace_stage
+
+_FILTER_FIELDS = ("talking_product_id", "report_type", "date")
+
+
+class CompanyVectors:
+    """
+    Report chunks of one company: a float32 matrix of normalized embeddings (grown by
+    doubling) plus ids, documents, metadata and the filter fields as columns.
+    Exact dot-product search; a company's reports are thousands of chunks, not millions.
+    """
+
+    def __init__(self, dim: int, capacity: int = 256):
+        self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.columns = {f: np.empty(capacity, dtype=object) for f in _FILTER_FIELDS}
+        self.ids: List[Optional[str]] = []
+        self.documents: List[Optional[str]] = []
+        self.metadatas: List[Optional[Dict[str, Any]]] = []
+        self.row_of: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def _grow(self):
+        capacity = self.matrix.shape[0] * 2
+        self.matrix = np.resize(self.matrix, (capacity, self.matrix.shape[1]))
+        self.alive = np.concatenate([self.alive, np.zeros(capacity - len(self.alive), dtype=bool)])
+        for f, col in self.columns.items():
+            grown = np.empty(capacity, dtype=object)
+            grown[:len(col)] = col
+            self.columns[f] = grown
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        for doc_id, doc, meta, emb in zip(ids, documents, metadatas, embeddings):
+            row = self.row_of.get(doc_id)
+            if row is None:
+                row = len(self.ids)
+                if row == self.matrix.shape[0]:
+                    self._grow()
+                self.ids.append(doc_id)
+                self.documents.append(doc)
+                self.metadatas.append(meta)
+                self.row_of[doc_id] = row
+            else:
+                self.documents[row], self.metadatas[row] = doc, meta
+            self.matrix[row] = emb
+            self.alive[row] = True
+            for f, col in self.columns.items():
+                col[row] = meta.get(f)
+
+    def remove(self, ids):
+        for doc_id in ids:
+            row = self.row_of.pop(doc_id, None)
+            if row is not None:
+                self.alive[row] = False
+                self.ids[row] = self.documents[row] = self.metadatas[row] = None
+
+    def query(self, embedding, k: int, talking_product_id=None, report_type=None, date=None, start_date=None, end_date=None) -> Dict[str, List]:
+        """Top-k rows passing the filters, shaped like one Chroma query result (squared L2 distances)."""
+        n = len(self.ids)
+        mask = self.alive[:n].copy()
+        if talking_product_id is not None:
+            mask &= self.columns["talking_product_id"][:n] == talking_product_id
+        if report_type is not None:
+            mask &= self.columns["report_type"][:n] == report_type
+        if date is not None:
+            mask &= self.columns["date"][:n] == date
+        if start_date is not None and end_date is not None:
+            dates = self.columns["date"][:n]
+            has_date = dates != None  # noqa: E711 (elementwise)
+            mask &= has_date
+            mask[has_date] &= (dates[has_date] >= str(start_date)) & (dates[has_date] <= str(end_date))
+
+        rows = np.flatnonzero(mask)
+        out = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if not len(rows):
+            return out
+        q = np.asarray(embedding, dtype=np.float32)
+        # Few rows pass: gather them; most pass: score the whole matrix (no copy) and pick
+        scores = self.matrix[rows] @ q if len(rows) * 4 < n else (self.matrix[:n] @ q)[rows]
+        top = np.argpartition(-scores, k - 1)[:k] if len(rows) > k else np.arange(len(rows))
+        top = top[np.argsort(-scores[top])]
+        for j in top:
+            row = rows[j]
+            out["ids"].append(self.ids[row])
+            out["documents"].append(self.documents[row])
+            out["metadatas"].append(self.metadatas[row])
+            out["distances"].append(float(2 - 2 * scores[j]))  # = squared L2 for unit vectors, like Chroma's default space
+        return out
+
+
+def load_company_report_chunks(company_id: str, page_size: int = REPORT_VECTOR_CACHE_PAGE_SIZE):
+    """(ids, documents, metadatas, embeddings) pages of a company's report chunks from Chroma."""
+    offset = 0
+    while True:
+        res = collection_for(company_id, "report_chunk").get(
+            where={"$and": [{"company_id": company_id}, {"doc_type": "report_chunk"}]},
+            include=["documents", "metadatas", "embeddings"],
+            limit=page_size,
+            offset=offset,
+        )
+        ids = res.get("ids") or []
+        if ids:
+            yield ids, res["documents"], res["metadatas"], res["embeddings"]
+        if len(ids) < page_size:
+            return
+        offset += page_size
+
+
+class ReportVectorCache:
+    """
+    In-process copy of each company's report-chunk vectors, so RAG over reports is answered
+    without a Chroma round trip. Chroma stays the source of truth: a company is loaded from it
+    on first use, kept in sync by upsert_report_to_chroma in this process, and reloaded in the
+    background when the company's data version changes (writes by the nightly pipeline).
+    """
+
+    def __init__(self, load=load_company_report_chunks, version_of=None):
+        self.load = load
+        self.version_of = version_of
+        self._companies: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._company_locks: Dict[str, threading.Lock] = {}
+        self.loads = 0
+        self.queries = 0
+
+    def _version(self, company_id: str) -> int:
+        if self.version_of is None:
+            from .cache import get_data_versions  # deferred: src.cache imports src.get.data
+            self.version_of = get_data_versions().get
+        return self.version_of(company_id)
+
+    def _load(self, company_id: str, version: int) -> Optional[CompanyVectors]:
+        vectors = None
+        for ids, documents, metadatas, embeddings in self.load(company_id):
+            if vectors is None:
+                vectors = CompanyVectors(len(embeddings[0]), capacity=max(256, len(ids)))
+            vectors.upsert(ids, documents, metadatas, embeddings)
+        with self._lock:
+            self._companies[company_id] = {"vectors": vectors, "version": version, "loading": False}
+            self.loads += 1
+        return vectors
+
+    def _reload(self, company_id: str, version: int, entry: Dict[str, Any]):
+        """
+        Background refresh of stale vectors. On failure the entry is dropped, so the next query
+        loads the company again (and retrieve_context queries Chroma if that fails too).
+        """
+        try:
+            self._load(company_id, version)
+        except Exception as e:
+            print(f"⚠️ Vector cache reload failed for company {company_id}, dropping its stale vectors: {e}")
+            with self._lock:
+                if self._companies.get(company_id) is entry:
+                    del self._companies[company_id]
+        finally:
+            entry["loading"] = False
+
+    def _company_lock(self, company_id: str) -> threading.Lock:
+        with self._lock:
+            return self._company_locks.setdefault(company_id, threading.Lock())
+
+    def vectors_for(self, company_id: str) -> Optional[CompanyVectors]:
+        """The company's vectors (None if it has no report chunks), loading them on first use."""
+        version = self._version(company_id)
+        with self._lock:
+            entry = self._companies.get(company_id)
+        if entry is None:
+            with self._company_lock(company_id):
+                with self._lock:
+                    entry = self._companies.get(company_id)
+                if entry is None:
+                    with trace_stage("vector_cache_load"):
+                        return self._load(company_id, version)
+        if entry["version"] != version and not entry["loading"]:
+            entry["loading"] = True
+            threading.Thread(target=self._reload, args=(company_id, version, entry), name=f"vectors-{company_id}", daemon=True).start()
+        return entry["vectors"]
+
+    def query(self, company_id: str, embedding, k: int, **filters) -> Dict[str, List]:
+        self.queries += 1
+        vectors = self.vectors_for(company_id)
+        if vectors is None:
+            return {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        return vectors.query(embedding, k, **filters)
+
+    def upsert(self, company_id: str, ids, documents, metadatas, embeddings):
+        """Mirror a Chroma upsert of report chunks, if the company is loaded in this process."""
+        with self._lock:
+            entry = self._companies.get(company_id)
+            if entry is None:
+                return
+            if entry["vectors"] is None:
+                entry["vectors"] = CompanyVectors(len(embeddings[0]))
+            entry["vectors"].upsert(ids, documents, metadatas, embeddings)
+
+    def remove(self, company_id: str, ids):
+        with self._lock:
+            entry = self._companies.get(company_id)
+            if entry is not None and entry["vectors"] is not None:
+                entry["vectors"].remove(ids)
+
+    def invalidate(self, company_id: Optional[str] = None):
+        """Drop a company (or all) so the next query reloads from Chroma."""
+        with self._lock:
+            if company_id is None:
+                self._companies.clear()
+            else:
+                self._companies.pop(company_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = list(self._companies.values())
+        return {
+            "companies": len(entries),
+            "chunks": sum(len(e["vectors"]) for e in entries if e["vectors"] is not None),
+            "bytes": sum(e["vectors"].matrix.nbytes for e in entries if e["vectors"] is not None),
+            "loads": self.loads,
+            "queries": self.queries,
+        }
+
+
+get_report_vector_cache = lazy(ReportVectorCache)
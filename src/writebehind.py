@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import threading
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from config import get_supabase, WRITE_BEHIND_SPOOL_PATH, WRITE_BEHIND_MAX_ITEMS, WRITE_BEHIND_FLUSH_SECONDS
+from .lazy import lazy
+from .embed import embed_texts
+from .store import (
+    report_payload, report_chunks, interaction_records, bump_data_version,
+    _dedupe_ids, _sync_report_chunks, _store_interactions,
+)
+
+
+class WriteBehindQueue:
+    """
+    Asynchronous persistence of reports and interaction batches. submit_* only appends the item to a
+    local sqlite spool (durable once it returns, so a crash never loses a report that cost an LLM call)
+    and returns; a background thread flushes the spool once WRITE_BEHIND_MAX_ITEMS items are queued
+    or the oldest one waited WRITE_BEHIND_FLUSH_SECONDS, and at shutdown.
+
+    A flush coalesces everything spooled: one Supabase upsert per report table, one embedding pass
+    over the new or changed report chunks and batched Chroma upserts per company, and one data
+    version bump per company. A report submitted twice (same table, product, date) is written once,
+    the last version. Items whose write fails stay in the spool and are retried by the next flush,
+    or by the next process that opens the spool.
+    """
+
+    def __init__(
+        self,
+        path: str = WRITE_BEHIND_SPOOL_PATH,
+        max_items: int = WRITE_BEHIND_MAX_ITEMS,
+        flush_seconds: float = WRITE_BEHIND_FLUSH_SECONDS,
+        embed_many=embed_texts,
+    ):
+        self.path = path
+        self.max_items = max_items
+        self.flush_seconds = flush_seconds
+        self.embed_many = embed_many
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, company_id TEXT, meta TEXT NOT NULL, embeddings BLOB, created_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()  # sqlite connection
+        self._flush_lock = threading.Lock()  # One flush at a time
+        self._cond = threading.Condition()
+        self._pending = self._count()
+        self._oldest = time.monotonic() - flush_seconds if self._pending else None  # Left by an earlier process: flush right away
+        self._retrying = False  # The last flush left items behind: wait flush_seconds instead of flushing on size
+        self._closed = False
+        self._flushes = self._written = self._failed_flushes = 0
+        self._last_flush_s = 0.0
+        if self._pending:
+            print(f"📮 {self._pending} writes left in the spool by an earlier run, flushing them")
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def _spool(self, kind: str, company_id, meta: Dict[str, Any], blob: bytes = None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO spool (kind, company_id, meta, embeddings, created_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, company_id, json.dumps(meta, default=str), blob, time.time()),
+            )
+        with self._cond:
+            self._pending += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._cond.notify()
+
+    def submit_report(self, data, report, report_type="daily", company_id=None, talking_product_id=None, date_range=None):
+        """Queue a report for its Supabase table and Chroma (what update_db_reports writes)."""
+        meta = {
+            "report_type": report_type,
+            "talking_product_id": talking_product_id,
+            "date": data["date"],
+            "date_range": date_range,
+            "payload": report_payload(data, report, report_type, company_id, talking_product_id, date_range),
+        }
+        self._spool("report", company_id, meta)
+
+    def submit_interactions(self, data, company_id=None, talking_product_id=None):
+        """Queue embedded interactions for Chroma (what update_db_interactions writes)."""
+        ids, documents, metadatas, embeddings = interaction_records(data, company_id, talking_product_id)
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        meta = {"talking_product_id": talking_product_id, "ids": ids, "documents": documents, "metadatas": metadatas, "dim": vectors.shape[1]}
+        self._spool("interactions", company_id, meta, vectors.tobytes())
+
+    def _due(self) -> bool:
+        if not self._pending:
+            return False
+        if self._pending >= self.max_items and not self._retrying:
+            return True
+        return time.monotonic() - self._oldest >= self.flush_seconds
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and not self._due():
+                    timeout = None if self._oldest is None else max(self.flush_seconds - (time.monotonic() - self._oldest), 0.01)
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+            self.flush()
+
+    def _write_reports(self, report_type: str, items: List[Tuple[List[int], Any, Dict[str, Any]]]):
+        """One table's reports: one Supabase upsert, then the new or changed chunks embedded and upserted per company."""
+        get_supabase().table(report_type).upsert([meta["payload"] for _, _, meta in items]).execute()
+        chunks: Dict[Any, Dict[str, List]] = {}
+        for _, company_id, meta in items:
+            ids, documents, metadatas = report_chunks(
+                meta["payload"]["report"], company_id, meta["talking_product_id"], report_type, meta["date"], meta["date_range"]
+            )
+            group = chunks.setdefault(company_id, {"reports": [], "ids": [], "documents": [], "metadatas": []})
+            group["reports"].append((meta["talking_product_id"], report_type, meta["date"]))
+            group["ids"] += ids
+            group["documents"] += documents
+            group["metadatas"] += metadatas
+        for company_id, group in chunks.items():
+            _sync_report_chunks(company_id, **group, embed_many=self.embed_many)
+
+    def _write_interactions(self, company_id, batches: List[Tuple[Dict[str, Any], bytes]]):
+        """One company's interaction batches as one deduplicated, batched Chroma upsert."""
+        ids, documents, metadatas, embeddings = [], [], [], []
+        for meta, blob in batches:
+            ids += meta["ids"]
+            documents += meta["documents"]
+            metadatas += meta["metadatas"]
+            embeddings += list(np.frombuffer(blob, dtype=np.float32).reshape(-1, meta["dim"]))
+        _store_interactions(company_id, *_dedupe_ids(ids, documents, metadatas, embeddings))
+
+    def flush(self) -> int:
+        """Write everything spooled so far; returns the number of items written. Failed items stay spooled."""
+        with self._flush_lock:
+            with self._lock:
+                rows = self._conn.execute("SELECT id, kind, company_id, meta, embeddings FROM spool ORDER BY id").fetchall()
+            if not rows:
+                return 0
+            t0 = time.perf_counter()
+
+            # Coalesce: reports per table (last version per report wins), interaction batches per company
+            reports: Dict[str, Dict[tuple, Tuple[List[int], Any, Dict[str, Any]]]] = {}
+            interactions: Dict[Any, Tuple[List[int], List]] = {}
+            for row_id, kind, company_id, meta, blob in rows:
+                meta = json.loads(meta)
+                if kind == "report":
+                    table = reports.setdefault(meta["report_type"], {})
+                    key = (meta["talking_product_id"], company_id, meta["date"], json.dumps(meta["date_range"]))
+                    superseded = table[key][0] if key in table else []
+                    table[key] = (superseded + [row_id], company_id, meta)
+                else:
+                    row_ids, batches = interactions.setdefault(company_id, ([], []))
+                    row_ids.append(row_id)
+                    batches.append((meta, blob))
+
+            done: List[int] = []
+            touched = set()  # (company_id, talking_product_id) whose data version is bumped
+            for report_type, table in reports.items():
+                items = list(table.values())
+                try:
+                    self._write_reports(report_type, items)
+                except Exception as e:
+                    print(f"⚠️ Write-behind: error saving {len(items)} {report_type} reports, kept in the spool: {e}")
+                    continue
+                for row_ids, company_id, meta in items:
+                    done += row_ids
+                    touched.add((company_id, None if company_id is not None else meta["talking_product_id"]))
+            for company_id, (row_ids, batches) in interactions.items():
+                try:
+                    self._write_interactions(company_id, batches)
+                except Exception as e:
+                    print(f"⚠️ Write-behind: error storing {len(batches)} interaction batches of company {company_id}, kept in the spool: {e}")
+                    continue
+                done += row_ids
+                touched.add((company_id, None if company_id is not None else batches[0][0]["talking_product_id"]))
+            for company_id, talking_product_id in touched:
+                bump_data_version(company_id, talking_product_id)
+
+            with self._lock, self._conn:
+                self._conn.executemany("DELETE FROM spool WHERE id = ?", [(row_id,) for row_id in done])
+            failed = len(rows) - len(done)
+            pending = self._count()  # Includes items submitted during the flush
+            with self._cond:
+                self._pending = pending
+                self._oldest = time.monotonic() if pending else None
+                self._retrying = bool(failed)
+                self._flushes += 1
+                self._written += len(done)
+                self._failed_flushes += bool(failed)
+                self._last_flush_s = time.perf_counter() - t0
+            print(f"📮 Flushed {len(done)}/{len(rows)} spooled writes in {self._last_flush_s:.2f}s")
+            return len(done)
+
+    def close(self):
+        """Stop the background thread and flush what is left (called at interpreter exit too)."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+        if self._pending:
+            print(f"⚠️ {self._pending} writes remain in the spool at {self.path}; the next run retries them")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "pending": self._pending,
+                "flushes": self._flushes,
+                "written": self._written,
+                "failed_flushes": self._failed_flushes,
+                "last_flush_s": round(self._last_flush_s, 4),
+            }
+
+
+get_write_behind = lazy(WriteBehindQueue)
@@ -0,0 +1,79 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from src.intents import INTENTS, IntentRouter, extract_period, unsupported_by_templates
+
+TODAY = date(2026, 10, 19)  # A Monday
+COMPANY_ID = "00000000-0000-0000-0000-000000000000"
+
+
+class _SameVector:
+    """Embeds every text to the same unit vector: every question matches (the first) intent."""
+
+    def encode(self, texts, normalize_embeddings=True):
+        return np.ones((len(texts), 4), dtype=np.float32) / 2
+
+
+@pytest.fixture
+def router():
+    return IntentRouter(embed=lambda text: np.ones(4, dtype=np.float32) / 2, model=_SameVector())
+
+
+@pytest.mark.parametrize("example", [q for intent in INTENTS for q in intent["examples"]])
+def test_examples_are_supported(example):
+    assert not unsupported_by_templates(example, TODAY)
+
+
+@pytest.mark.parametrize("question, period", [
+    ("What are the top topics this week?", (date(2026, 10, 19), TODAY)),
+    ("Most asked questions yesterday", (date(2026, 10, 18), date(2026, 10, 18))),
+    ("Miss rate last month", (date(2026, 9, 1), date(2026, 9, 30))),
+    ("Top topics in the last 7 days", (date(2026, 10, 13), TODAY)),
+    ("Miss rate in the past 30 days", (date(2026, 9, 20), TODAY)),
+    ("Average match score per day this month", (date(2026, 10, 1), TODAY)),
+])
+def test_parsed_periods_are_supported(question, period):
+    assert extract_period(question, TODAY) == period
+    assert not unsupported_by_templates(question, TODAY)
+
+
+@pytest.mark.parametrize("question", [
+    "What are the top topics in January?",
+    "Miss rate in Q1",
+    "Most asked questions in the last 3 weeks",
+    "Top topics since 2024",
+    "Busiest products between 01/03 and 15/03",
+    "Miss rate last week of January",  # "last week" parses, "January" doesn't
+    "Hoeveel vragen konden niet beantwoord worden in maart?",
+])
+def test_unparsed_periods_are_unsupported(question):
+    assert unsupported_by_templates(question, TODAY)
+
+
+@pytest.mark.parametrize("question", [
+    "What are the least asked questions?",
+    "Which product has the fewest questions?",
+    "Which questions about billing are asked most?",
+    "Top questions in French",
+    "Top 5 topics",
+    "Average match score per week",
+    "Wat zijn de minst gestelde vragen?",
+])
+def test_unsupported_qualifiers(question):
+    assert unsupported_by_templates(question, TODAY)
+
+
+def test_route_falls_back_to_llm_for_unsupported_questions(router):
+    assert router.route("What are the least asked questions?", COMPANY_ID) is None
+    assert router.route("What are the top topics in January?", COMPANY_ID) is None
+    assert router.stats()["unsupported"] == 2
+    assert router.stats()["fallbacks"] == 2
+
+
+def test_route_uses_template_for_supported_questions(router):
+    name, sql = router.route("What are the top topics?", COMPANY_ID)
+    assert name == INTENTS[0]["name"]
+    assert "BETWEEN" not in sql
+    assert router.stats()["unsupported"] == 0